@@ -0,0 +1 @@
+"""Performance benchmarks of cruft, see `python -m benchmarks --help`."""
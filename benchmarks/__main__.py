@@ -0,0 +1,187 @@
+"""Time the cruft commands end to end and per phase on synthetic local templates.
+
+Run `python -m benchmarks --help` from the root of the repository for the options."""
+
+import io
+import json
+import os
+import platform
+import statistics
+from contextlib import redirect_stdout
+from pathlib import Path
+from shutil import rmtree
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional
+
+import typer
+
+from benchmarks.templates import GIT_CONFIG, SCENARIOS, TemplateSpec, build_template
+
+COMMANDS = ("create", "check", "diff", "link", "update")
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+
+app = typer.Typer(add_completion=False)
+
+
+@app.command()
+def main(
+    scenarios: List[str] = typer.Option(
+        list(SCENARIOS),
+        "--scenario",
+        "-s",
+        help=f"Scenarios to run, among {', '.join(SCENARIOS)}.",
+    ),
+    properties: List[str] = typer.Option(
+        [],
+        "--set",
+        help=(
+            "Override a property of the templates of every scenario, e.g. `--set files=1000`."
+            f" Properties: {', '.join(TemplateSpec._fields)}."
+        ),
+    ),
+    repeat: int = typer.Option(3, "--repeat", "-n", help="Timed runs of each command."),
+    output: Optional[Path] = typer.Option(
+        None, "--output", "-o", dir_okay=False, help="Write the results to this file as JSON."
+    ),
+    baseline: Path = typer.Option(
+        DEFAULT_BASELINE, "--baseline", dir_okay=False, help="The results to compare to."
+    ),
+    threshold: float = typer.Option(
+        0.25,
+        "--threshold",
+        help="Fail if a median time exceeds its baseline by more than this fraction.",
+    ),
+    save_baseline: bool = typer.Option(
+        False, "--save-baseline", help="Store the results as the new baseline.", show_default=False
+    ),
+) -> None:
+    """Benchmark create, check, diff, link and update on synthetic local templates."""
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise typer.BadParameter(f"Unknown scenarios {', '.join(sorted(unknown))}")
+    overrides = dict(prop.split("=", 1) for prop in properties)
+    # The templates are local: nothing must be fetched, nor routed to a running daemon
+    os.environ.update(GIT_CONFIG, CRUFT_NO_DAEMON="1")
+
+    results: Dict[str, Any] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "scenarios": {},
+    }
+    for name in scenarios:
+        spec = SCENARIOS[name].replace(**overrides)
+        typer.echo(f"Benchmarking {name}: {_describe(spec)}", err=True)
+        results["scenarios"][name] = {
+            "template": spec._asdict(),
+            "commands": run_scenario(spec, repeat),
+        }
+
+    if output:
+        output.write_text(json.dumps(results, indent=2) + "\n")
+    if save_baseline:
+        baseline.write_text(json.dumps(results, indent=2) + "\n")
+        typer.echo(f"Saved the baseline to {baseline}", err=True)
+        return
+
+    stored = json.loads(baseline.read_text()) if baseline.exists() else {"scenarios": {}}
+    typer.echo(report(results, stored, threshold))
+    if regressions(results, stored, threshold):
+        raise typer.Exit(1)
+
+
+def run_scenario(spec: TemplateSpec, repeat: int) -> Dict[str, Any]:
+    """Time every command `repeat` times on a template built from `spec`."""
+    import cruft
+    from cruft._commands import utils
+
+    timings: Dict[str, List[Dict[str, Any]]] = {command: [] for command in COMMANDS}
+    with TemporaryDirectory() as work_dir_str:
+        work_dir = Path(work_dir_str)
+        template = str(build_template(spec, work_dir / "template"))
+
+        def create(project_dir: Path) -> Path:
+            return cruft.create(
+                template, project_dir, checkout="v1", default_config=True, no_input=True
+            )
+
+        def timed(command: str, function: Callable[..., Any], *args: Any, **kwargs: Any):
+            with utils.profiling.profiling() as profile, redirect_stdout(io.StringIO()):
+                start = perf_counter()
+                function(*args, **kwargs)
+                duration = perf_counter() - start
+            phases = {phase.name: phase.total for phase in profile.phases()}
+            timings[command].append({"time": duration, "phases": phases})
+
+        for run in range(repeat):
+            run_dir = work_dir / f"run_{run}"
+            timed("create", create, run_dir / "created")
+            project_dir = create(run_dir / "project")
+            timed("check", cruft.check, project_dir)
+            (project_dir / "local_change.txt").write_text("Changed in the project\n")
+            timed("diff", cruft.diff, project_dir)
+            timed("update", cruft.update, project_dir, skip_apply_ask=True)
+
+            unlinked_dir = create(run_dir / "unlinked")
+            (unlinked_dir / ".cruft.json").unlink()
+            timed("link", cruft.link, template, unlinked_dir, checkout="v1", default_config=True)
+            rmtree(run_dir)
+    return {command: _summarize(runs) for command, runs in timings.items()}
+
+
+def _summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    phase_names = {name for run in runs for name in run["phases"]}
+    return {
+        "median": statistics.median(run["time"] for run in runs),
+        "min": min(run["time"] for run in runs),
+        "max": max(run["time"] for run in runs),
+        "phases": {
+            name: statistics.median(run["phases"].get(name, 0.0) for run in runs)
+            for name in sorted(phase_names)
+        },
+    }
+
+
+def regressions(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """The commands whose median time exceeds the baseline by more than `threshold`."""
+    slower = []
+    for scenario, commands, stored in _compared(results, baseline):
+        for command, timing in commands.items():
+            if command in stored and timing["median"] > stored[command]["median"] * (1 + threshold):
+                slower.append(f"{scenario}/{command}")
+    return slower
+
+
+def report(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> str:
+    rows = [f"{'Benchmark':<24} {'Median':>9} {'Baseline':>9} {'Change':>8}"]
+    for scenario, commands, stored in _compared(results, baseline):
+        for command, timing in commands.items():
+            name = f"{scenario}/{command}"
+            if command not in stored:
+                rows.append(f"{name:<24} {timing['median']:>8.3f}s {'':>9} {'':>8}")
+                continue
+            reference = stored[command]["median"]
+            change = timing["median"] / reference - 1 if reference else 0.0
+            flag = "  REGRESSION" if change > threshold else ""
+            rows.append(
+                f"{name:<24} {timing['median']:>8.3f}s {reference:>8.3f}s {change:>+7.0%}{flag}"
+            )
+    return "\n".join(rows)
+
+
+def _compared(results: Dict[str, Any], baseline: Dict[str, Any]):
+    for scenario, result in results["scenarios"].items():
+        stored = baseline["scenarios"].get(scenario)
+        # Timings of differently shaped templates are not comparable
+        if stored is None or stored["template"] != result["template"]:
+            stored = {"commands": {}}
+        yield scenario, result["commands"], stored["commands"]
+
+
+def _describe(spec: TemplateSpec) -> str:
+    return ", ".join(f"{name}={value}" for name, value in spec._asdict().items())
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,329 @@
+"""Fan template releases out to a fleet of synthetic projects, checking and updating them
+concurrently through the public API, to size the machines running cruft at scale.
+
+Run `python -m benchmarks.stress --help` from the root of the repository for the options."""
+
+import io
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from threading import Event, Thread
+from time import perf_counter
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import typer
+
+from benchmarks.templates import (
+    GIT_CONFIG,
+    SCENARIOS,
+    SLUG_DIR,
+    TemplateSpec,
+    build_template,
+    git,
+)
+from cruft._commands.utils.resources import get_rss_bytes, get_tree_size
+
+RELEASE_NOTES = "RELEASE.md"
+
+app = typer.Typer(add_completion=False)
+
+
+class ResourceUsage(NamedTuple):
+    """The peak usage of the resources sampled while a phase ran."""
+
+    rss_bytes: int
+    temp_bytes: int
+    open_fds: Optional[int]
+
+
+class PhaseReport(NamedTuple):
+    name: str
+    operations: int
+    failures: int
+    conflicts: int
+    wall_time: float
+    latencies: List[float]
+    usage: ResourceUsage
+
+    def to_dict(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        return {
+            "name": self.name,
+            "operations": self.operations,
+            "failures": self.failures,
+            "conflicts": self.conflicts,
+            "wall_time": self.wall_time,
+            "throughput": self.operations / self.wall_time if self.wall_time else 0.0,
+            "latency": {
+                "p50": _percentile(latencies, 50),
+                "p90": _percentile(latencies, 90),
+                "p99": _percentile(latencies, 99),
+                "max": latencies[-1] if latencies else 0.0,
+                "mean": statistics.mean(latencies) if latencies else 0.0,
+            },
+            "peak_rss_bytes": self.usage.rss_bytes,
+            "peak_temp_bytes": self.usage.temp_bytes,
+            "peak_open_fds": self.usage.open_fds,
+        }
+
+
+@app.command()
+def main(
+    projects: int = typer.Option(100, "--projects", "-p", help="Projects in the fleet."),
+    releases: int = typer.Option(
+        3, "--releases", "-r", help="Template commits, each fanned out to the fleet."
+    ),
+    conflict_rate: float = typer.Option(
+        0.1,
+        "--conflict-rate",
+        help="Fraction of the projects with local changes conflicting with every release.",
+    ),
+    workers: int = typer.Option(
+        # The default of ThreadPoolExecutor, as the phases wait on git as much as they compute
+        min(32, (os.cpu_count() or 1) + 4),
+        "--workers",
+        "-w",
+        min=1,
+        help="Projects checked or updated at once.",
+    ),
+    scenario: str = typer.Option(
+        "small", "--scenario", "-s", help=f"Template shape, among {', '.join(SCENARIOS)}."
+    ),
+    properties: List[str] = typer.Option(
+        [], "--set", help="Override a property of the template, e.g. `--set files=1000`."
+    ),
+    output: Optional[Path] = typer.Option(
+        None, "--output", "-o", dir_okay=False, help="Write the report to this file as JSON."
+    ),
+    seed: int = typer.Option(0, "--seed", help="Seed choosing the conflicting projects."),
+) -> None:
+    """Check and update a fleet of projects concurrently after each template release."""
+    if scenario not in SCENARIOS:
+        raise typer.BadParameter(f"Unknown scenario {scenario}")
+    spec = SCENARIOS[scenario].replace(**dict(prop.split("=", 1) for prop in properties))
+    os.environ.update(GIT_CONFIG, CRUFT_NO_DAEMON="1")
+
+    with tempfile.TemporaryDirectory() as work_dir_str:
+        work_dir = Path(work_dir_str)
+        # The scratch directories of cruft and git go to their own directory to be measured
+        scratch_dir = work_dir / "scratch"
+        scratch_dir.mkdir()
+        tempfile.tempdir = os.environ["TMPDIR"] = str(scratch_dir)
+        try:
+            typer.echo(f"Creating {projects} projects from a {scenario} template", err=True)
+            template_dir = _build_release_template(spec, work_dir / "template")
+            fleet = _create_fleet(template_dir, work_dir / "projects", projects, workers)
+            conflicting = random.Random(seed).sample(fleet, round(projects * conflict_rate))
+            for project_dir in conflicting:
+                _edit_release_notes(project_dir)
+
+            reports: List[PhaseReport] = []
+            for release in range(1, releases + 1):
+                typer.echo(f"Fanning release {release} out to the fleet", err=True)
+                _release(template_dir, release)
+                reports.append(_run_phase(f"check {release}", _check, fleet, workers, scratch_dir))
+                reports.append(
+                    _run_phase(f"update {release}", _update, fleet, workers, scratch_dir)
+                )
+                for project_dir in fleet:
+                    git("add", "-A", cwd=project_dir)
+                    git(
+                        "commit", "-q", "--allow-empty", "-m", f"Release {release}", cwd=project_dir
+                    )
+        finally:
+            tempfile.tempdir = None
+
+    results = {
+        "projects": projects,
+        "releases": releases,
+        "conflict_rate": conflict_rate,
+        "workers": workers,
+        "template": spec._asdict(),
+        "phases": [report.to_dict() for report in reports],
+        "peak_rss_bytes": _peak_rss(),
+    }
+    typer.echo(_table(results))
+    if output:
+        output.write_text(json.dumps(results, indent=2) + "\n")
+
+
+def _build_release_template(spec: TemplateSpec, template_dir: Path) -> Path:
+    build_template(spec._replace(commits=1), template_dir)
+    (template_dir / SLUG_DIR / RELEASE_NOTES).write_text("Release 0\n\nThe release notes.\n")
+    git("add", "-A", cwd=template_dir)
+    git("commit", "-q", "-m", "Release 0", cwd=template_dir)
+    return template_dir
+
+
+def _release(template_dir: Path, release: int):
+    # Every release changes the first line of the notes, which conflicting projects changed
+    (template_dir / SLUG_DIR / RELEASE_NOTES).write_text(
+        f"Release {release}\n\nThe release notes.\n"
+    )
+    git("commit", "-q", "-a", "-m", f"Release {release}", cwd=template_dir)
+
+
+def _create_fleet(template_dir: Path, fleet_dir: Path, projects: int, workers: int) -> List[Path]:
+    import cruft
+
+    def create(index: int) -> Path:
+        project_dir = cruft.create(
+            str(template_dir),
+            fleet_dir,
+            extra_context={"project_slug": f"project_{index}"},
+            default_config=True,
+        )
+        git("init", "-q", cwd=project_dir)
+        git("add", "-A", cwd=project_dir)
+        git("commit", "-q", "-m", "Create the project", cwd=project_dir)
+        return project_dir
+
+    with ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(create, range(projects)))
+
+
+def _edit_release_notes(project_dir: Path):
+    notes = project_dir / RELEASE_NOTES
+    notes.write_text("Our own release notes\n" + notes.read_text().split("\n", 1)[1])
+    git("commit", "-q", "-a", "-m", "Edit the release notes", cwd=project_dir)
+
+
+def _check(project_dir: Path) -> str:
+    import cruft
+
+    cruft.check(project_dir)
+    return "ok"
+
+
+def _update(project_dir: Path) -> str:
+    import cruft
+
+    if not cruft.update(project_dir, skip_apply_ask=True):
+        return "failed"
+    status = git("status", "--porcelain", cwd=project_dir).splitlines()
+    if any(line[:2] in ("UU", "AA", "DU", "UD") for line in status):
+        return "conflicts"
+    return "ok"
+
+
+def _run_phase(
+    name: str,
+    operation: Callable[[Path], str],
+    fleet: List[Path],
+    workers: int,
+    scratch_dir: Path,
+) -> PhaseReport:
+    latencies: List[float] = []
+    outcomes: List[str] = []
+
+    def timed(project_dir: Path):
+        start = perf_counter()
+        try:
+            outcome = operation(project_dir)
+        except Exception:
+            outcome = "failed"
+        latencies.append(perf_counter() - start)
+        outcomes.append(outcome)
+
+    sampler = _Sampler(scratch_dir)
+    with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()), sampler:
+        start = perf_counter()
+        with ThreadPoolExecutor(workers) as executor:
+            list(executor.map(timed, fleet))
+        wall_time = perf_counter() - start
+    return PhaseReport(
+        name,
+        len(fleet),
+        outcomes.count("failed"),
+        outcomes.count("conflicts"),
+        wall_time,
+        latencies,
+        sampler.peak,
+    )
+
+
+class _Sampler:
+    """Samples the resources used by the process in a background thread."""
+
+    def __init__(self, scratch_dir: Path, interval: float = 0.05):
+        self.scratch_dir = scratch_dir
+        self.interval = interval
+        self.peak = ResourceUsage(0, 0, None)
+        self._stop = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+
+    def __exit__(self, exc, value, tb):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            usage = ResourceUsage(get_rss_bytes(), get_tree_size(self.scratch_dir), _open_fds())
+            self.peak = ResourceUsage(
+                max(self.peak.rss_bytes, usage.rss_bytes),
+                max(self.peak.temp_bytes, usage.temp_bytes),
+                None if usage.open_fds is None else max(self.peak.open_fds or 0, usage.open_fds),
+            )
+            if self._stop.wait(self.interval):
+                return
+
+
+def _peak_rss() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux, and in bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _open_fds() -> Optional[int]:
+    for fd_dir in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(fd_dir))
+        except OSError:
+            continue
+    return None
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(percentile / 100 * len(values)) - 1))
+    return values[index]
+
+
+def _table(results: Dict[str, Any]) -> str:
+    workers = results["workers"]
+    rows = [
+        f"{results['projects']} projects, {workers} at once"
+        + (" (serial run, without any contention)" if workers == 1 else ""),
+        f"{'Phase':<12} {'Ops/s':>7} {'p50':>8} {'p90':>8} {'p99':>8} {'Failed':>6}"
+        f" {'Conflicts':>9} {'Peak RSS':>10} {'Peak temp':>10} {'Peak fds':>8}",
+    ]
+    for phase in results["phases"]:
+        latency = phase["latency"]
+        fds = "" if phase["peak_open_fds"] is None else phase["peak_open_fds"]
+        rows.append(
+            f"{phase['name']:<12} {phase['throughput']:>7.2f}"
+            f" {latency['p50']:>7.3f}s {latency['p90']:>7.3f}s {latency['p99']:>7.3f}s"
+            f" {phase['failures']:>6} {phase['conflicts']:>9}"
+            f" {_megabytes(phase['peak_rss_bytes']):>10} {_megabytes(phase['peak_temp_bytes']):>10}"
+            f" {fds:>8}"
+        )
+    return "\n".join(rows)
+
+
+def _megabytes(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f}MB"
+
+
+if __name__ == "__main__":
+    app()
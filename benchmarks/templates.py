@@ -0,0 +1,145 @@
+"""Synthetic cookiecutter templates, built as local git repositories so that the benchmarks
+run offline."""
+
+import json
+import random
+from pathlib import Path
+from subprocess import PIPE, run  # nosec
+from typing import Any, Dict, NamedTuple
+
+SLUG_DIR = "{{cookiecutter.project_slug}}"
+
+# Local submodules are cloned through the file protocol, which git only allows when asked to
+GIT_CONFIG = {
+    "GIT_CONFIG_COUNT": "1",
+    "GIT_CONFIG_KEY_0": "protocol.file.allow",
+    "GIT_CONFIG_VALUE_0": "always",
+}
+
+
+class TemplateSpec(NamedTuple):
+    """The shape of a synthetic template."""
+
+    # Rendered text files, and the approximate size of each of them in bytes
+    files: int = 20
+    file_size: int = 1024
+    # Binary files, which cookiecutter copies without rendering them
+    binary_assets: int = 0
+    binary_size: int = 64 * 1024
+    # The template history: `v1` is the first commit, each later commit changes one file
+    commits: int = 2
+    # Git submodules vendored in the generated project, each holding `files` files
+    submodules: int = 0
+    hooks: bool = False
+
+    def replace(self, **changes: Any) -> "TemplateSpec":
+        fields = {name: type(getattr(self, name)) for name in self._fields}
+        for name, value in changes.items():
+            if name not in fields:
+                raise ValueError(f"Unknown template property {name}, use one of {self._fields}")
+            if fields[name] is bool and isinstance(value, str):
+                value = value.lower() in ("1", "true", "yes")
+            changes[name] = fields[name](value)
+        return self._replace(**changes)
+
+
+SCENARIOS: Dict[str, TemplateSpec] = {
+    "small": TemplateSpec(),
+    "large": TemplateSpec(files=500, file_size=2048),
+    "binary": TemplateSpec(files=10, binary_assets=20, binary_size=256 * 1024),
+    "history": TemplateSpec(commits=100),
+    "submodules": TemplateSpec(submodules=3),
+    "hooks": TemplateSpec(hooks=True),
+}
+
+
+def git(*args: str, cwd: Path) -> str:
+    return run(  # nosec
+        ["git", "-c", "user.name=cruft", "-c", "user.email=cruft@example.com", *args],
+        cwd=cwd,
+        stdout=PIPE,
+        stderr=PIPE,
+        check=True,
+    ).stdout.decode()
+
+
+def build_template(spec: TemplateSpec, template_dir: Path) -> Path:
+    """Build the git repository of a template in `template_dir`.
+
+    The first commit is tagged `v1` and the default branch points at the last one."""
+    template_dir.mkdir(parents=True)
+    _init(template_dir)
+    (template_dir / "cookiecutter.json").write_text(
+        json.dumps({"project_slug": "bench", "description": "A benchmarked project"})
+    )
+    project_dir = template_dir / SLUG_DIR
+    for index in range(spec.files):
+        _write(project_dir / f"module_{index}" / f"file_{index}.txt", _text(spec.file_size))
+    for index in range(spec.binary_assets):
+        asset = project_dir / "assets" / f"asset_{index}.bin"
+        asset.parent.mkdir(parents=True, exist_ok=True)
+        asset.write_bytes(_binary(index, spec.binary_size))
+    if spec.hooks:
+        _write(
+            template_dir / "hooks" / "pre_gen_project.py",
+            "import sys\n\nif not '{{ cookiecutter.project_slug }}':\n    sys.exit(1)\n",
+        )
+        _write(
+            template_dir / "hooks" / "post_gen_project.py",
+            "from pathlib import Path\n\nPath('hooked.txt').write_text('{{ cookiecutter.description }}')\n",
+        )
+    git("add", "-A", cwd=template_dir)
+    for index in range(spec.submodules):
+        submodule_dir = template_dir.parent / f"{template_dir.name}_submodule_{index}"
+        submodule_dir.mkdir()
+        _init(submodule_dir)
+        for file_index in range(spec.files):
+            _write(submodule_dir / f"vendored_{file_index}.txt", _text(spec.file_size))
+        git("add", "-A", cwd=submodule_dir)
+        git("commit", "-q", "-m", "Vendored files", cwd=submodule_dir)
+        git(
+            "-c",
+            "protocol.file.allow=always",
+            "submodule",
+            "add",
+            "-q",
+            "-b",
+            "main",
+            submodule_dir.as_uri(),
+            f"{SLUG_DIR}/vendor/submodule_{index}",
+            cwd=template_dir,
+        )
+    git("commit", "-q", "-m", "Initial template", cwd=template_dir)
+    git("tag", "v1", cwd=template_dir)
+
+    for index in range(1, spec.commits):
+        changed = project_dir / f"module_{index % max(spec.files, 1)}" / "changes.txt"
+        _write(changed, f"Change {index} of {{{{ cookiecutter.project_slug }}}}\n")
+        git("add", "-A", cwd=template_dir)
+        git("commit", "-q", "-m", f"Change {index}", cwd=template_dir)
+    return template_dir
+
+
+def _init(repo_dir: Path):
+    git("init", "-q", cwd=repo_dir)
+    git("symbolic-ref", "HEAD", "refs/heads/main", cwd=repo_dir)
+
+
+def _write(path: Path, content: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def _text(size: int) -> str:
+    # Mostly literal text, as in most templates, with a few variables and blocks
+    lines = (
+        "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor.\n" * 3
+        + "{{ cookiecutter.project_slug }}: {{ cookiecutter.description }}"
+        + " {% if cookiecutter.project_slug %}ok{% endif %}\n"
+    )
+    return lines * max(size // len(lines), 1)
+
+
+def _binary(seed: int, size: int) -> bytes:
+    # Deterministic, so that the renders of a template are comparable between runs
+    return b"\0" + random.Random(seed).getrandbits(8 * size).to_bytes(size, "little")
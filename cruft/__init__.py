@@ -4,7 +4,54 @@ Allows you to maintain all the necessary cruft for packaging and building projec
 the code you intentionally write. Built on-top of, and fully compatible with, CookieCutter.
 """
 
-from cruft._commands import check, create, diff, link, update
-from cruft._version import __version__
+from typing import TYPE_CHECKING
 
-__all__ = ["create", "check", "diff", "update", "link", "__version__"]
+if TYPE_CHECKING:  # pragma: no cover
+    from cruft._commands import (
+        batch_create,
+        batch_update,
+        check,
+        create,
+        diff,
+        impact,
+        link,
+        update,
+    )
+    from cruft._commands.utils.hooks import hook_policy
+    from cruft._commands.utils.resources import resource_limits
+    from cruft._version import __version__
+
+__all__ = [
+    "create",
+    "check",
+    "diff",
+    "update",
+    "link",
+    "batch_create",
+    "batch_update",
+    "impact",
+    "resource_limits",
+    "hook_policy",
+    "__version__",
+]
+
+
+def __getattr__(name: str):
+    # The commands and the version are loaded on first use, keeping `import cruft` cheap
+    if name == "__version__":
+        from cruft._version import __version__
+
+        return __version__
+    if name == "resource_limits":
+        from cruft._commands.utils.resources import resource_limits
+
+        return resource_limits
+    if name == "hook_policy":
+        from cruft._commands.utils.hooks import hook_policy
+
+        return hook_policy
+    if name in __all__:
+        from cruft import _commands
+
+        return getattr(_commands, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,12 +1,15 @@
 """This module defines CLI interactions when using `cruft`."""
 
 import json
+import sys
+from contextlib import ExitStack
 from pathlib import Path
 from typing import List, Optional
 
 import typer
 
 from cruft import _commands, _logo
+from cruft._commands import utils
 
 app = typer.Typer(help=_logo.ascii_art, no_args_is_help=True, add_completion=False)
 
@@ -15,6 +18,130 @@ def _get_help_string(function):
     return function.__doc__.split("\n\n")[0]
 
 
+@app.callback()
+def main(
+    ctx: typer.Context,
+    profile: bool = typer.Option(
+        False,
+        "--profile",
+        help="Print the time spent in each phase of the command once it completes.",
+        show_default=False,
+    ),
+    profile_json: Optional[Path] = typer.Option(
+        None,
+        "--profile-json",
+        dir_okay=False,
+        help="Write the time spent in each phase of the command to this file as JSON.",
+    ),
+    profile_templates: bool = typer.Option(
+        False,
+        "--profile-templates",
+        help=(
+            "Also time the rendering of each template file and hook, and print the slowest"
+            " ones once the command completes."
+        ),
+        show_default=False,
+    ),
+    track_resources: bool = typer.Option(
+        False,
+        "--track-resources",
+        help="Print the peak memory and temporary disk used by each phase once the command completes.",
+        show_default=False,
+    ),
+    max_memory: Optional[str] = typer.Option(
+        None,
+        "--max-memory",
+        help="Abort the command if cruft uses more memory than this, e.g. 512M or 2G.",
+    ),
+    max_temp: Optional[str] = typer.Option(
+        None,
+        "--max-temp",
+        help="Abort the command if its temporary directories hold more than this, e.g. 1G.",
+    ),
+    git_summary: bool = typer.Option(
+        False,
+        "--git-summary",
+        help="Print the git processes spawned by the command once it completes.",
+        show_default=False,
+    ),
+    git_trace: Optional[Path] = typer.Option(
+        None,
+        "--git-trace",
+        dir_okay=False,
+        help="Write every git process spawned by the command to this file as JSON lines.",
+    ),
+    hooks: Optional[str] = typer.Option(
+        None,
+        "--hooks",
+        help=(
+            "How to run the hooks of the template when rendering it to compare the project with"
+            " it: run (the default), skip, or cache to replay the changes they made to the"
+            " same files. The hooks of new projects always run."
+        ),
+    ),
+) -> None:
+    resources = ExitStack()
+    if profile or profile_json or profile_templates:
+        collected = resources.enter_context(
+            utils.profiling.profiling(utils.profiling.Profile(template_files=profile_templates))
+        )
+        resources.callback(_report_profile, collected, profile, profile_json)
+    if track_resources or max_memory or max_temp:
+        try:
+            limits = utils.resources.resource_limits(max_memory, max_temp)
+        except ValueError as error:
+            raise typer.BadParameter(str(error))
+        tracker = resources.enter_context(limits)
+        if track_resources:
+            resources.callback(lambda: typer.echo(tracker.table(), err=True))
+    if git_summary or git_trace:
+        accounted = resources.enter_context(utils.gitrunner.accounting(git_trace))
+        if git_summary:
+            resources.callback(lambda: typer.echo(accounted.summary(), err=True))
+    if hooks:
+        resources.enter_context(utils.hooks.hook_policy(hooks))
+    ctx.call_on_close(resources.close)
+
+
+def _report_profile(
+    collected: "utils.profiling.Profile", profile: bool, profile_json: Optional[Path]
+):
+    if profile:
+        typer.echo(collected.table(), err=True)
+    if collected.template_files:
+        typer.echo(collected.files_table(), err=True)
+    if profile_json:
+        collected.write_json(profile_json)
+
+
+def _is_accounting_git() -> bool:
+    # Looked up without importing the runner, which loads GitPython
+    gitrunner = sys.modules.get("cruft._commands.utils.gitrunner")
+    return gitrunner is not None and gitrunner.active_accounting() is not None
+
+
+def _run_in_daemon(command: str, **arguments) -> bool:
+    """Run the command in the `cruft serve` daemon if it is running.
+    Returns False if the command has to be run in this process instead."""
+    if (
+        utils.profiling.active_profile() is not None
+        or utils.resources.active_tracker() is not None
+        or _is_accounting_git()
+    ):
+        # The daemon would not time the phases nor account for the resources of this process
+        return False
+    response = utils.daemon.call(command, **arguments)
+    if response is None:
+        return False
+    typer.echo(response.output, nl=False)
+    typer.echo(response.error_output, nl=False, err=True)
+    if response.error:
+        typer.secho(f"Error: {response.error}", fg=typer.colors.RED, err=True)
+    if response.exit_code:
+        raise typer.Exit(response.exit_code)
+    return True
+
+
 @app.command(
     short_help="Check if the linked Cookiecutter template has been updated",
     help=_get_help_string(_commands.check),
@@ -40,6 +167,8 @@ def check(
         ),
     ),
 ) -> None:
+    if _run_in_daemon("check", project_dir=project_dir, checkout=checkout, strict=strict):
+        return
     if not _commands.check(project_dir=project_dir, checkout=checkout, strict=strict):
         raise typer.Exit(1)
 
@@ -111,6 +240,24 @@ def create(
     skip: Optional[List[str]] = typer.Option(
         None, "--skip", show_default=False, help="Default files/pattern to skip on update"
     ),
+    manifest: bool = typer.Option(
+        False,
+        "--manifest",
+        help=(
+            "Store the hashes of the files of the rendered template in the project, in"
+            " `.cruft-manifest.json`, for `cruft diff --quick` and `cruft impact`."
+        ),
+        show_default=False,
+    ),
+    snapshot: bool = typer.Option(
+        False,
+        "--snapshot",
+        help=(
+            "Store the rendered template next to the project, in `.cruft-snapshot.tar.gz`,"
+            " so that later updates and diffs don't render it again."
+        ),
+        show_default=False,
+    ),
 ) -> None:
     _commands.create(
         template_git_url,
@@ -124,6 +271,8 @@ def create(
         checkout=checkout,
         overwrite_if_exists=overwrite_if_exists,
         skip=skip,
+        manifest=manifest,
+        snapshot=snapshot,
     )
 
 
@@ -174,6 +323,39 @@ def link(
             " with multi templates in it"
         ),
     ),
+    manifest: bool = typer.Option(
+        False,
+        "--manifest",
+        help=(
+            "Store the hashes of the files of the rendered template in the project, in"
+            " `.cruft-manifest.json`, for `cruft diff --quick` and `cruft impact`."
+        ),
+        show_default=False,
+    ),
+    snapshot: bool = typer.Option(
+        False,
+        "--snapshot",
+        help=(
+            "Store the rendered template next to the project, in `.cruft-snapshot.tar.gz`,"
+            " so that later updates and diffs don't render it again."
+        ),
+        show_default=False,
+    ),
+    detect_commit: bool = typer.Option(
+        False,
+        "--detect-commit",
+        help=(
+            "Link to the commit of the template whose render best matches the project, rather"
+            " than to the latest one, and list the best matches with their score."
+        ),
+        show_default=False,
+    ),
+    max_renders: int = typer.Option(
+        16,
+        "--max-renders",
+        min=1,
+        help="The number of template commits --detect-commit renders at most.",
+    ),
 ) -> None:
     _commands.link(
         template_git_url,
@@ -184,6 +366,10 @@ def link(
         extra_context=json.loads(extra_context),
         no_input=no_input,
         directory=directory,
+        manifest=manifest,
+        snapshot=snapshot,
+        detect_commit=detect_commit,
+        max_renders=max_renders,
     )
 
 
@@ -284,7 +470,78 @@ def update(
         writable=False,
         readable=True,
     ),
+    manifest: bool = typer.Option(
+        False,
+        "--manifest",
+        help=(
+            "Store the manifest of the template in the project once updated, as `cruft create"
+            " --manifest` does. An existing manifest is always kept up to date."
+        ),
+        show_default=False,
+    ),
+    snapshot: bool = typer.Option(
+        False,
+        "--snapshot",
+        help=(
+            "Store the rendered template next to the project once updated, as `cruft create"
+            " --snapshot` does. An existing snapshot is always kept up to date."
+        ),
+        show_default=False,
+    ),
+    incremental: bool = typer.Option(
+        False,
+        "--incremental",
+        help=(
+            "Only render again the template files changed since the current commit, or using"
+            " variables whose value changes, and the files including them, reusing the render"
+            " of the current commit for the others. The template is rendered in full when its"
+            " hooks, `cookiecutter.json` or Python modules change."
+        ),
+        show_default=False,
+    ),
+    only: Optional[List[str]] = typer.Option(
+        None,
+        "--only",
+        help=(
+            "Only render and update the files matching this pattern, e.g. --only '.github/*'."
+            " Can be given several times. The cruft state is left as is unless"
+            " --advance-state is given."
+        ),
+        show_default=False,
+    ),
+    advance_state: bool = typer.Option(
+        False,
+        "--advance-state",
+        help=(
+            "With --only, record the update in the cruft state even though only some files"
+            " were updated, as if the changes of the other files were skipped."
+        ),
+        show_default=False,
+    ),
 ) -> None:
+    # The daemon cannot prompt, only updates applied without asking are routed to it
+    if (
+        skip_apply_ask
+        and not cookiecutter_input
+        and _run_in_daemon(
+            "update",
+            project_dir=project_dir,
+            template_path=template_path,
+            refresh_private_variables=refresh_private_variables,
+            skip_update=skip_update,
+            checkout=checkout,
+            strict=strict,
+            allow_untracked_files=allow_untracked_files,
+            extra_context=json.loads(extra_context),
+            extra_context_file=extra_context_file,
+            manifest=manifest,
+            snapshot=snapshot,
+            incremental=incremental,
+            only=only,
+            advance_state=advance_state,
+        )
+    ):
+        return
     if not _commands.update(
         project_dir=project_dir,
         template_path=template_path,
@@ -297,6 +554,11 @@ def update(
         allow_untracked_files=allow_untracked_files,
         extra_context=json.loads(extra_context),
         extra_context_file=extra_context_file,
+        manifest=manifest,
+        snapshot=snapshot,
+        incremental=incremental,
+        only=only,
+        advance_state=advance_state,
     ):
         raise typer.Exit(1)
 
@@ -318,6 +580,301 @@ def diff(
         "-c",
         help=("The git reference to check against. Supports branches, tags and commit hashes."),
     ),
+    quick: bool = typer.Option(
+        False,
+        "--quick",
+        "-q",
+        help=(
+            "Only list the drifted, deleted and extra files, comparing the project to the"
+            " manifest of its template without cloning nor rendering it."
+        ),
+        show_default=False,
+    ),
+    paths: Optional[List[str]] = typer.Argument(
+        None,
+        metavar="[-- PATH...]",
+        help="Only render and diff the files matching these patterns, e.g. '.github/*'.",
+        show_default=False,
+    ),
 ) -> None:
-    if not _commands.diff(project_dir=project_dir, exit_code=exit_code, checkout=checkout):
+    # The daemon cannot page and color the diff for a terminal, and quick diffs are instant
+    if (
+        not quick
+        and (exit_code or not sys.stdout.isatty())
+        and _run_in_daemon(
+            "diff", project_dir=project_dir, exit_code=exit_code, checkout=checkout, paths=paths
+        )
+    ):
+        return
+    if not _commands.diff(
+        project_dir=project_dir, exit_code=exit_code, checkout=checkout, quick=quick, paths=paths
+    ):
         raise typer.Exit(1)
+
+
+@app.command(
+    "batch-update",
+    short_help="Update many projects at once, sharing template clones and renders",
+    help=_get_help_string(_commands.batch_update),
+)
+def batch_update(
+    project_dirs: List[Path] = typer.Argument(
+        ..., metavar="PROJECT_DIR...", help="Paths to the project directories.", exists=True
+    ),
+    checkout: Optional[str] = typer.Option(
+        None,
+        "--checkout",
+        "-c",
+        help=("The git reference to check against. Supports branches, tags and commit hashes."),
+    ),
+    strict: bool = typer.Option(
+        True,
+        "--strict/--not-strict",
+        help=(
+            "If enabled, ensures that the projects are updated to be"
+            " the same as the checked out cookiecutter template."
+            " If disabled, a project is skipped if the checked out cookiecutter template"
+            " commit is an ancestor of the project commit."
+        ),
+    ),
+    allow_untracked_files: bool = typer.Option(
+        False,
+        "--allow-untracked-files",
+        help=(
+            "Allow the projects' cruft to be updated if there are untracked files in their git"
+            " repositories (but no other changes)"
+        ),
+    ),
+    skip_update: bool = typer.Option(
+        False,
+        "--skip-update",
+        "-s",
+        help="Skip the template updates but update the cruft state",
+        show_default=False,
+    ),
+    workers: Optional[int] = typer.Option(
+        None,
+        "--workers",
+        "-w",
+        min=1,
+        help="Number of projects to update concurrently. Defaults to a value based on CPU count.",
+    ),
+    report_json: Optional[Path] = typer.Option(
+        None,
+        "--report-json",
+        dir_okay=False,
+        help="Write the per-project report to this file as JSON.",
+    ),
+) -> None:
+    reports = _commands.batch_update(
+        project_dirs,
+        checkout=checkout,
+        strict=strict,
+        allow_untracked_files=allow_untracked_files,
+        skip_update=skip_update,
+        workers=workers,
+    )
+    colors = {
+        "applied": typer.colors.GREEN,
+        "conflicts": typer.colors.YELLOW,
+        "failed": typer.colors.RED,
+    }
+    for report in reports:
+        message = f": {report.message}" if report.message else ""
+        typer.secho(
+            f"{report.status.upper():<10} {report.project_dir}{message}",
+            fg=colors.get(report.status),
+        )
+    if report_json:
+        report_json.write_text(
+            json.dumps(
+                [dict(report._asdict(), project_dir=str(report.project_dir)) for report in reports],
+                indent=2,
+            )
+            + "\n"
+        )
+    if any(report.status in ("conflicts", "failed") for report in reports):
+        raise typer.Exit(1)
+
+
+@app.command(
+    "batch-create",
+    short_help="Create many new projects at once from a Cookiecutter template",
+    help=_get_help_string(_commands.batch_create),
+)
+def batch_create(
+    template_git_url: str = typer.Argument(
+        ..., metavar="TEMPLATE", help="The Cookiecutter template URI."
+    ),
+    contexts_file: Path = typer.Argument(
+        ...,
+        metavar="CONTEXTS_FILE",
+        help=(
+            "Path to a JSON Lines file with one project per line, e.g."
+            ' {"output_dir": "services", "extra_context": {"project_slug": "billing"}}'
+        ),
+        exists=True,
+        dir_okay=False,
+    ),
+    config_file: Optional[Path] = typer.Option(
+        None, help="Path to the Cookiecutter user config file", exists=True
+    ),
+    default_config: bool = typer.Option(
+        False,
+        "--default-config",
+        "-d",
+        help="Do not load a config file. Use the defaults instead",
+        show_default=False,
+    ),
+    directory: Optional[str] = typer.Option(
+        None,
+        help=(
+            "Directory within repo that holds"
+            " cookiecutter.json file for advanced repositories"
+            " with multi templates in it"
+        ),
+    ),
+    checkout: Optional[str] = typer.Option(
+        None,
+        "--checkout",
+        "-c",
+        help=("The git reference to check against. Supports branches, tags and commit hashes."),
+    ),
+    overwrite_if_exists: bool = typer.Option(
+        False,
+        "--overwrite-if-exists",
+        "-f",
+        show_default=False,
+        help="Overwrite the contents of the output directories if they already exist",
+    ),
+    skip: Optional[List[str]] = typer.Option(
+        None, "--skip", show_default=False, help="Default files/pattern to skip on update"
+    ),
+    workers: Optional[int] = typer.Option(
+        None,
+        "--workers",
+        "-w",
+        min=1,
+        help="Number of worker processes. Defaults to the number of CPUs.",
+    ),
+) -> None:
+    reports = _commands.batch_create(
+        template_git_url,
+        contexts_file,
+        config_file=config_file,
+        default_config=default_config,
+        directory=directory,
+        checkout=checkout,
+        overwrite_if_exists=overwrite_if_exists,
+        skip=skip,
+        workers=workers,
+    )
+    for report in reports:
+        if report.error is None:
+            typer.secho(
+                f"CREATED {report.duration:8.3f}s {report.project_dir}", fg=typer.colors.GREEN
+            )
+        else:
+            typer.secho(
+                f"FAILED  {report.duration:8.3f}s {report.output_dir}: {report.error}",
+                fg=typer.colors.RED,
+            )
+    if any(report.error is not None for report in reports):
+        raise typer.Exit(1)
+
+
+@app.command(
+    short_help="Tell which projects a change of their template affects, without updating them",
+    help=_get_help_string(_commands.impact),
+)
+def impact(
+    template_git_url: str = typer.Argument(
+        ..., metavar="TEMPLATE", help="The Cookiecutter template URI."
+    ),
+    revision_range: str = typer.Argument(
+        ...,
+        metavar="FROM..TO",
+        help="The revisions of the template to compare, e.g. v1.0..v1.1 or v1.0..main.",
+    ),
+    project_dirs: List[Path] = typer.Argument(
+        ..., metavar="PROJECT_DIR...", help="Paths to the project directories.", exists=True
+    ),
+    workers: Optional[int] = typer.Option(
+        None,
+        "--workers",
+        "-w",
+        min=1,
+        help="Number of projects to analyze concurrently. Defaults to a value based on CPU count.",
+    ),
+    report_json: Optional[Path] = typer.Option(
+        None,
+        "--report-json",
+        dir_okay=False,
+        help="Write the per-project report to this file as JSON.",
+    ),
+) -> None:
+    reports = _commands.impact(template_git_url, revision_range, project_dirs, workers=workers)
+    colors = {
+        "unaffected": typer.colors.GREEN,
+        "conflict-likely": typer.colors.YELLOW,
+        "failed": typer.colors.RED,
+    }
+    for report in reports:
+        details = [report.message] if report.message else []
+        if report.files:
+            details.append(f"{len(report.files)} files")
+        if report.conflicts:
+            details.append(f"conflicts in {', '.join(report.conflicts)}")
+        message = f": {'; '.join(details)}" if details else ""
+        typer.secho(
+            f"{report.status.upper():<19} {report.project_dir}{message}",
+            fg=colors.get(report.status),
+        )
+    if report_json:
+        report_json.write_text(
+            json.dumps(
+                [dict(report._asdict(), project_dir=str(report.project_dir)) for report in reports],
+                indent=2,
+            )
+            + "\n"
+        )
+    if any(report.status == "failed" for report in reports):
+        raise typer.Exit(1)
+
+
+@app.command(
+    short_help="Run a daemon keeping template mirrors and renders warm between commands",
+    help=_get_help_string(_commands.serve),
+)
+def serve(
+    socket_path: Optional[Path] = typer.Option(
+        None,
+        "--socket",
+        dir_okay=False,
+        help=(
+            "Path of the Unix socket to listen on. Defaults to $CRUFT_SOCKET, or a socket"
+            " in the user's runtime directory. The CLI only finds a daemon listening on"
+            " another socket when $CRUFT_SOCKET points to it."
+        ),
+    ),
+    cache_dir: Optional[Path] = typer.Option(
+        None,
+        "--cache-dir",
+        file_okay=False,
+        help="Directory to keep the template mirrors in. Defaults to $CRUFT_CACHE_DIR.",
+    ),
+    stop: bool = typer.Option(
+        False, "--stop", help="Stop the running daemon instead.", show_default=False
+    ),
+) -> None:
+    if stop:
+        if not _commands.stop_daemon(socket_path):
+            typer.secho("No cruft daemon is running.", fg=typer.colors.YELLOW)
+            raise typer.Exit(1)
+        return
+    socket_path = socket_path or utils.daemon.get_socket_path()
+    typer.secho(f"Serving cruft commands on {socket_path}", fg=typer.colors.GREEN)
+    try:
+        _commands.serve(socket_path, cache_dir)
+    except KeyboardInterrupt:
+        pass
@@ -1,9 +1,24 @@
 """Contains the core logic behind all cruft commands."""
 
+from .batch_create import batch_create
+from .batch_update import batch_update
 from .check import check
 from .create import create
 from .diff import diff
+from .impact import impact
 from .link import link
+from .serve import serve, stop_daemon
 from .update import update
 
-__all__ = ["check", "create", "diff", "link", "update"]
+__all__ = [
+    "batch_create",
+    "batch_update",
+    "check",
+    "create",
+    "diff",
+    "impact",
+    "link",
+    "serve",
+    "stop_daemon",
+    "update",
+]
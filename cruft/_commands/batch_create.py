@@ -0,0 +1,182 @@
+import json
+from copy import deepcopy
+from pathlib import Path
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from cruft.exceptions import InvalidContextsFile
+
+from . import utils
+from .create import _generate_project
+from .utils.iohelper import AltTemporaryDirectory, absolute_path, rendering
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .utils.cookiecutter import CookiecutterContext
+
+
+class ProjectCreateReport(NamedTuple):
+    """The outcome of creating a single project as part of a batch creation."""
+
+    output_dir: Path
+    project_dir: Optional[Path]
+    duration: float
+    error: Optional[str] = None
+
+
+def batch_create(
+    template_git_url: str,
+    contexts_file: Path,
+    config_file: Optional[Path] = None,
+    default_config: bool = False,
+    directory: Optional[str] = None,
+    checkout: Optional[str] = None,
+    overwrite_if_exists: bool = False,
+    skip: Optional[List[str]] = None,
+    workers: Optional[int] = None,
+) -> List[ProjectCreateReport]:
+    """Expand a Git based Cookiecutter template into many new projects at once.
+
+    The contexts file is in the JSON Lines format: every line is a JSON object holding the
+    `output_dir` of a project and the `extra_context` to generate it with. The template is
+    cloned and its cookiecutter.json is loaded only once, then the projects are generated
+    in parallel processes. Lines generating the same project directory are rejected with
+    `InvalidContextsFile` before any project is generated. Returns a report per line, in the
+    order of the file."""
+    items = _read_contexts_file(contexts_file)
+    template_git_url = utils.cookiecutter.resolve_template_url(template_git_url)
+    with AltTemporaryDirectory() as cookiecutter_template_dir_str:
+        cookiecutter_template_dir = Path(cookiecutter_template_dir_str)
+        with utils.cookiecutter.get_cookiecutter_repo(
+            template_git_url, cookiecutter_template_dir, checkout
+        ) as repo:
+            last_commit = repo.head.object.hexsha
+
+        if directory:
+            cookiecutter_template_dir = cookiecutter_template_dir / directory
+
+        context = utils.cookiecutter.load_cookiecutter_context(
+            cookiecutter_template_dir, config_file, default_config
+        )
+        cruft_state: Dict[str, Any] = {
+            "template": template_git_url,
+            "commit": last_commit,
+            "checkout": checkout,
+            "context": None,
+            "directory": directory,
+        }
+        if skip:
+            cruft_state["skip"] = skip
+
+        # The projects are resolved up front, so that two lines generating the same project
+        # are rejected before any of them is generated
+        results: List[Union[ProjectCreateReport, Tuple[Path, "CookiecutterContext"]]] = []
+        project_lines: Dict[Path, int] = {}
+        for line_number, output_dir, extra_context in items:
+            start = perf_counter()
+            try:
+                project_context, project_dir = _resolve_project(
+                    cookiecutter_template_dir, context, extra_context, output_dir, cruft_state
+                )
+            except Exception as error:
+                results.append(
+                    ProjectCreateReport(output_dir, None, perf_counter() - start, str(error))
+                )
+                continue
+            if project_dir in project_lines:
+                raise InvalidContextsFile(
+                    contexts_file,
+                    line_number,
+                    f"Generates {project_dir} like line {project_lines[project_dir]}.",
+                )
+            project_lines[project_dir] = line_number
+            results.append((output_dir, project_context))
+
+        from concurrent.futures import ProcessPoolExecutor
+        from multiprocessing import get_context
+
+        # Forking a process holding the locks of other threads could deadlock its workers
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as executor:
+            futures = [
+                None
+                if isinstance(result, ProjectCreateReport)
+                else executor.submit(
+                    _create_project,
+                    cookiecutter_template_dir,
+                    result[1],
+                    result[0],
+                    overwrite_if_exists,
+                    cruft_state,
+                )
+                for result in results
+            ]
+            return [
+                result if future is None else future.result()  # type: ignore
+                for result, future in zip(results, futures)
+            ]
+
+
+def _read_contexts_file(contexts_file: Path) -> List[Tuple[int, Path, Dict[str, Any]]]:
+    items = []
+    with open(contexts_file, "r") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as error:
+                raise InvalidContextsFile(contexts_file, line_number, str(error))
+            if not isinstance(item, dict) or not isinstance(item.get("extra_context", {}), dict):
+                raise InvalidContextsFile(
+                    contexts_file,
+                    line_number,
+                    'Expected an object like {"output_dir": "...", "extra_context": {...}}.',
+                )
+            output_dir = absolute_path(Path(item.get("output_dir") or "."))
+            items.append((line_number, output_dir, item.get("extra_context") or {}))
+    return items
+
+
+def _resolve_project(
+    cookiecutter_template_dir: Path,
+    context: "CookiecutterContext",
+    extra_context: Dict[str, Any],
+    output_dir: Path,
+    cruft_state: Dict[str, Any],
+) -> Tuple["CookiecutterContext", Path]:
+    from cookiecutter.find import find_template
+    from cookiecutter.utils import create_env_with_context
+
+    with rendering(cookiecutter_template_dir):
+        project_context = utils.cookiecutter.prompt_cookiecutter_context(
+            deepcopy(context),
+            cruft_state["template"],
+            cruft_state["commit"],
+            extra_context,
+            no_input=True,
+        )
+        # Like cookiecutter names the directory of the project it generates
+        environment = create_env_with_context(project_context)
+        template_dir = find_template(cookiecutter_template_dir, environment)
+        name = environment.from_string(template_dir.name).render(**project_context)
+    return project_context, (output_dir / name).resolve()
+
+
+def _create_project(
+    cookiecutter_template_dir: Path,
+    project_context: "CookiecutterContext",
+    output_dir: Path,
+    overwrite_if_exists: bool,
+    cruft_state: Dict[str, Any],
+) -> ProjectCreateReport:
+    start = perf_counter()
+    try:
+        project_dir = _generate_project(
+            cookiecutter_template_dir,
+            project_context,
+            output_dir,
+            overwrite_if_exists,
+            dict(cruft_state, context=project_context),
+        )
+    except Exception as error:
+        return ProjectCreateReport(output_dir, None, perf_counter() - start, str(error))
+    return ProjectCreateReport(output_dir, project_dir, perf_counter() - start)
@@ -0,0 +1,267 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from shutil import copytree
+from tempfile import mkdtemp
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from . import utils
+from .update import _apply_binary_changes, _apply_patch, _is_project_repo_clean
+from .utils.iohelper import AltTemporaryDirectory
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .utils.cache import RenderKey
+    from .utils.cookiecutter import CookiecutterContext
+    from .utils.cruft import CruftState
+
+APPLIED = "applied"
+CONFLICTS = "conflicts"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+
+class ProjectUpdateReport(NamedTuple):
+    """The outcome of updating a single project as part of a batch update."""
+
+    project_dir: Path
+    status: str
+    message: str = ""
+    commit: Optional[str] = None
+
+
+class _Render(NamedTuple):
+    output_dir: Path
+    context: Optional["CookiecutterContext"]
+    error: Optional[Exception]
+
+
+class _ProjectUpdate(NamedTuple):
+    project_dir: Path
+    cruft_state: "CruftState"
+    # None when the changes of the template are skipped
+    old_render: Optional[_Render]
+    new_render: _Render
+    last_commit: str
+
+
+def batch_update(
+    project_dirs: Iterable[Path],
+    checkout: Optional[str] = None,
+    strict: bool = True,
+    allow_untracked_files: bool = False,
+    skip_update: bool = False,
+    workers: Optional[int] = None,
+) -> List[ProjectUpdateReport]:
+    """Update many projects to the latest release of their templates, without any prompt.
+
+    Every template is cloned only once, and every revision of a template is only rendered
+    once per distinct context, no matter how many projects share it. The updates are then
+    applied to the projects by a pool of worker threads, while the renders themselves run
+    one after the other, as rendering changes the working directory of the process.
+    Returns a report per project, in the order the projects were given."""
+    reports: Dict[Path, ProjectUpdateReport] = {}
+    groups: Dict[Tuple[str, str], List[Tuple[Path, "CruftState"]]] = {}
+    for project_dir in project_dirs:
+        project_dir = utils.iohelper.absolute_path(project_dir).resolve()
+        if project_dir in reports:
+            continue
+        try:
+            cruft_state = json.loads(utils.cruft.get_cruft_file(project_dir).read_text())
+        except Exception as error:
+            reports[project_dir] = ProjectUpdateReport(project_dir, FAILED, str(error))
+            continue
+        if not _is_project_repo_clean(project_dir, allow_untracked_files):
+            reports[project_dir] = ProjectUpdateReport(
+                project_dir, SKIPPED, "the git working tree is not clean"
+            )
+            continue
+        # Placeholder to keep the order of the projects in the final report
+        reports[project_dir] = ProjectUpdateReport(project_dir, SKIPPED)
+        group = (cruft_state["template"], cruft_state.get("directory") or "")
+        groups.setdefault(group, []).append((project_dir, cruft_state))
+
+    with AltTemporaryDirectory() as renders_dir_:
+        renders_dir = Path(renders_dir_)
+        project_updates: List[_ProjectUpdate] = []
+        for (template, directory), projects in groups.items():
+            project_updates.extend(
+                _render_template_group(
+                    template,
+                    directory,
+                    projects,
+                    checkout,
+                    strict,
+                    skip_update,
+                    renders_dir,
+                    reports,
+                )
+            )
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for report in executor.map(
+                lambda project_update: _update_project(
+                    project_update, checkout, allow_untracked_files, skip_update
+                ),
+                project_updates,
+            ):
+                reports[report.project_dir] = report
+
+    return list(reports.values())
+
+
+def _get_render_key(cruft_state: "CruftState", commit: str) -> "RenderKey":
+    return utils.cache.get_render_key(
+        cruft_state, commit, utils.cruft.get_extra_context(cruft_state)
+    )
+
+
+def _render_template_group(
+    template: str,
+    directory: str,
+    projects: List[Tuple[Path, "CruftState"]],
+    checkout: Optional[str],
+    strict: bool,
+    skip_update: bool,
+    renders_dir: Path,
+    reports: Dict[Path, ProjectUpdateReport],
+) -> List[_ProjectUpdate]:
+    """Clone a template once and render every revision and context needed by its projects:
+    the new revision only when the changes of the template are skipped."""
+    with AltTemporaryDirectory() as repo_dir:
+        try:
+            repo = utils.cookiecutter.get_cookiecutter_repo(template, Path(repo_dir), checkout)
+        except Exception as error:
+            for project_dir, _ in projects:
+                reports[project_dir] = ProjectUpdateReport(project_dir, FAILED, str(error))
+            return []
+
+        with repo:
+            last_commit = repo.head.object.hexsha
+            pending: List[Tuple[Path, "CruftState"]] = []
+            to_render: Dict["RenderKey", "CruftState"] = {}
+            for project_dir, cruft_state in projects:
+                try:
+                    is_updated = utils.cruft.is_project_updated(
+                        repo, cruft_state["commit"], last_commit, strict
+                    )
+                except Exception as error:
+                    reports[project_dir] = ProjectUpdateReport(project_dir, FAILED, str(error))
+                    continue
+                if is_updated:
+                    reports[project_dir] = ProjectUpdateReport(
+                        project_dir, SKIPPED, "already up to date", cruft_state["commit"]
+                    )
+                    continue
+                pending.append((project_dir, cruft_state))
+                if not skip_update:
+                    to_render.setdefault(
+                        _get_render_key(cruft_state, cruft_state["commit"]), cruft_state
+                    )
+                to_render.setdefault(_get_render_key(cruft_state, last_commit), cruft_state)
+
+            # Render commit by commit to avoid checking out the same revision several times
+            renders: Dict["RenderKey", _Render] = {}
+            for render_key in sorted(to_render):
+                output_dir = Path(mkdtemp(dir=renders_dir))
+                try:
+                    context = utils.generate.render_template(
+                        output_dir, repo, to_render[render_key], render_key[2]
+                    )
+                    renders[render_key] = _Render(output_dir, context, None)
+                except Exception as error:
+                    renders[render_key] = _Render(output_dir, None, error)
+
+    return [
+        _ProjectUpdate(
+            project_dir,
+            cruft_state,
+            renders.get(_get_render_key(cruft_state, cruft_state["commit"])),
+            renders[_get_render_key(cruft_state, last_commit)],
+            last_commit,
+        )
+        for project_dir, cruft_state in pending
+    ]
+
+
+def _update_project(
+    project_update: _ProjectUpdate,
+    checkout: Optional[str],
+    allow_untracked_files: bool,
+    skip_update: bool,
+) -> ProjectUpdateReport:
+    project_dir, cruft_state, old_render, new_render, last_commit = project_update
+    for render in (old_render, new_render):
+        if render is not None and render.error is not None:
+            return ProjectUpdateReport(
+                project_dir, FAILED, f"Failed to generate the template: {render.error}"
+            )
+
+    try:
+        applied_cleanly = True
+        if old_render is not None:
+            applied_cleanly = _apply_update(
+                cruft_state, project_dir, old_render, new_render, allow_untracked_files
+            )
+
+        cruft_state["commit"] = last_commit
+        cruft_state["checkout"] = checkout
+        cruft_state["context"] = new_render.context
+        utils.cruft.get_cruft_file(project_dir).write_text(utils.cruft.json_dumps(cruft_state))
+        utils.generate.record_render(
+            project_dir,
+            new_render.output_dir,
+            cruft_state,
+            new_render.context,
+            manifest=utils.manifest.get_manifest_file(project_dir).is_file(),
+            snapshot=utils.snapshot.get_snapshot_file(project_dir).is_file(),
+        )
+    except Exception as error:
+        return ProjectUpdateReport(project_dir, FAILED, str(error))
+
+    if skip_update:
+        return ProjectUpdateReport(
+            project_dir, SKIPPED, "template changes skipped, cruft state updated", last_commit
+        )
+    if not applied_cleanly:
+        return ProjectUpdateReport(
+            project_dir, CONFLICTS, "the update left merge conflicts to resolve", last_commit
+        )
+    return ProjectUpdateReport(project_dir, APPLIED, "", last_commit)
+
+
+def _apply_update(
+    cruft_state: "CruftState",
+    project_dir: Path,
+    old_render: _Render,
+    new_render: _Render,
+    allow_untracked_files: bool,
+) -> bool:
+    applied_cleanly = True
+    with AltTemporaryDirectory() as tmpdir_:
+        tmpdir = Path(tmpdir_)
+        current_template_dir = tmpdir / "current_template"
+        new_template_dir = tmpdir / "new_template"
+        copytree(str(old_render.output_dir), str(current_template_dir), symlinks=True)
+        copytree(str(new_render.output_dir), str(new_template_dir), symlinks=True)
+
+        deleted_paths: Set[Path] = set()
+        utils.generate.remove_unwanted_paths(
+            current_template_dir,
+            cruft_state,
+            project_dir,
+            deleted_paths,
+            update_deleted_paths=True,
+        )
+        utils.generate.remove_unwanted_paths(
+            new_template_dir, cruft_state, project_dir, deleted_paths
+        )
+
+        binary_changes = utils.binary.set_aside_binary_changes(
+            current_template_dir, new_template_dir, tmpdir / "binary", project_dir
+        )
+        diff = utils.diff.get_diff(current_template_dir, new_template_dir)
+        if diff.strip():
+            applied_cleanly = _apply_patch(diff, project_dir, allow_untracked_files)
+        if binary_changes:
+            applied_cleanly = _apply_binary_changes(binary_changes, project_dir) and applied_cleanly
+    return applied_cleanly
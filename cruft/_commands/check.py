@@ -6,7 +6,8 @@ import typer
 
 from . import utils
 from .utils import example
-from .utils.iohelper import AltTemporaryDirectory
+from .utils.iohelper import AltTemporaryDirectory, absolute_path
+from .utils.profiling import span
 
 
 @example()
@@ -15,19 +16,26 @@ def check(
 ) -> bool:
     """Checks to see if there have been any updates to the Cookiecutter template
     used to generate this project."""
+    project_dir = absolute_path(project_dir)
     cruft_file = utils.cruft.get_cruft_file(project_dir)
     cruft_state = json.loads(cruft_file.read_text())
-    with AltTemporaryDirectory(cruft_state.get("directory")) as cookiecutter_template_dir:
-        with utils.cookiecutter.get_cookiecutter_repo(
-            cruft_state["template"],
-            Path(cookiecutter_template_dir),
-            checkout,
-            filter="blob:none",
-            no_checkout=True,
-        ) as repo:
+    with AltTemporaryDirectory() as cookiecutter_template_dir:
+        with span("clone"):
+            repo = utils.cookiecutter.get_cookiecutter_repo(
+                cruft_state["template"],
+                Path(cookiecutter_template_dir),
+                checkout,
+                filter="blob:none",
+                no_checkout=True,
+            )
+        with repo:
             last_commit = repo.head.object.hexsha
 
-            if utils.cruft.is_project_updated(repo, cruft_state["commit"], last_commit, strict):
+            with span("compare"):
+                is_updated = utils.cruft.is_project_updated(
+                    repo, cruft_state["commit"], last_commit, strict
+                )
+            if is_updated:
                 typer.secho(
                     "SUCCESS: Good work! Project's cruft is up to date "
                     "and as clean as possible :).",
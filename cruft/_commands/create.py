@@ -1,11 +1,17 @@
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
-from cookiecutter.generate import generate_files
+import typer
 
 from . import utils
 from .utils import example
-from .utils.iohelper import AltTemporaryDirectory
+from .utils.iohelper import AltTemporaryDirectory, absolute_path, rendering
+from .utils.parallel import parallel_rendering
+from .utils.profiling import span, timing_template_files
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .utils.cookiecutter import CookiecutterContext
+    from .utils.cruft import CruftState
 
 
 @example("https://github.com/timothycrosley/cookiecutter-python/")
@@ -21,14 +27,23 @@ def create(
     checkout: Optional[str] = None,
     overwrite_if_exists: bool = False,
     skip: Optional[List[str]] = None,
+    manifest: bool = False,
+    snapshot: bool = False,
 ) -> Path:
-    """Expand a Git based Cookiecutter template into a new project on disk."""
+    """Expand a Git based Cookiecutter template into a new project on disk.
+
+    The manifest and the snapshot of the template are stored in the project when asked,
+    see `cruft diff --quick`, unless it is generated over an existing directory, which may
+    hold other files than the template."""
     template_git_url = utils.cookiecutter.resolve_template_url(template_git_url)
-    with AltTemporaryDirectory(directory) as cookiecutter_template_dir_str:
+    output_dir = absolute_path(output_dir)
+    with AltTemporaryDirectory() as cookiecutter_template_dir_str:
         cookiecutter_template_dir = Path(cookiecutter_template_dir_str)
-        with utils.cookiecutter.get_cookiecutter_repo(
-            template_git_url, cookiecutter_template_dir, checkout
-        ) as repo:
+        with span("clone"):
+            repo = utils.cookiecutter.get_cookiecutter_repo(
+                template_git_url, cookiecutter_template_dir, checkout
+            )
+        with repo:
             last_commit = repo.head.object.hexsha
 
             if directory:
@@ -36,16 +51,60 @@ def create(
 
             if extra_context_file:
                 extra_context = utils.cookiecutter.get_extra_context_from_file(extra_context_file)
-            context = utils.cookiecutter.generate_cookiecutter_context(
-                template_git_url,
-                last_commit,
+            with span("context"):
+                context = utils.cookiecutter.generate_cookiecutter_context(
+                    template_git_url,
+                    last_commit,
+                    cookiecutter_template_dir,
+                    config_file,
+                    default_config,
+                    extra_context,
+                    no_input,
+                )
+
+        cruft_content = {
+            "template": template_git_url,
+            "commit": last_commit,
+            "checkout": checkout,
+            "context": context,
+            "directory": directory,
+        }
+
+        if skip:
+            cruft_content["skip"] = skip
+
+        with span("generate"):
+            project_dir = _generate_project(
                 cookiecutter_template_dir,
-                config_file,
-                default_config,
-                extra_context,
-                no_input,
+                context,
+                output_dir,
+                overwrite_if_exists,
+                cruft_content,
+                manifest,
+                snapshot,
+            )
+        if overwrite_if_exists and (manifest or snapshot):
+            typer.secho(
+                "The manifest and the snapshot of the template were not stored, as the project"
+                " may hold other files than the template. Pass --manifest or --snapshot to the"
+                " next `cruft update` to store them.",
+                fg=typer.colors.YELLOW,
             )
+        return project_dir
+
+
+def _generate_project(
+    cookiecutter_template_dir: Path,
+    context: "CookiecutterContext",
+    output_dir: Path,
+    overwrite_if_exists: bool,
+    cruft_state: "CruftState",
+    manifest: bool = False,
+    snapshot: bool = False,
+) -> Path:
+    from cookiecutter.generate import generate_files
 
+    with rendering(cookiecutter_template_dir), timing_template_files(), parallel_rendering():
         project_dir = Path(
             generate_files(
                 repo_dir=cookiecutter_template_dir,
@@ -55,19 +114,15 @@ def create(
             )
         )
 
-        cruft_content = {
-            "template": template_git_url,
-            "commit": last_commit,
-            "checkout": checkout,
-            "context": context,
-            "directory": directory,
-        }
-
-        if skip:
-            cruft_content["skip"] = skip
+    if not overwrite_if_exists:
+        # Before the cruft state is saved, the new project is exactly the rendered template
+        with span("record"):
+            utils.generate.record_render(
+                project_dir, project_dir, cruft_state, context, manifest, snapshot
+            )
 
-        # After generating the project - save the cruft state
-        # into the cruft file.
-        (project_dir / ".cruft.json").write_text(utils.cruft.json_dumps(cruft_content))
+    # After generating the project - save the cruft state
+    # into the cruft file.
+    (project_dir / ".cruft.json").write_text(utils.cruft.json_dumps(cruft_state))
 
-        return project_dir
+    return project_dir
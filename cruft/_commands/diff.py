@@ -2,56 +2,171 @@ import json
 import shutil
 import sys
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, List, Optional
 
 import typer
 
 from . import utils
-from .utils.iohelper import AltTemporaryDirectory
+from .utils.iohelper import AltTemporaryDirectory, absolute_path
+from .utils.profiling import span
+
+if TYPE_CHECKING:  # pragma: no cover
+    from git import Repo
+
+    from .utils.cruft import CruftState
 
 
 def diff(
-    project_dir: Path = Path("."), exit_code: bool = False, checkout: Optional[str] = None
+    project_dir: Path = Path("."),
+    exit_code: bool = False,
+    checkout: Optional[str] = None,
+    quick: bool = False,
+    paths: Optional[List[str]] = None,
 ) -> bool:
-    """Show the diff between the project and the linked Cookiecutter template"""
+    """Show the diff between the project and the linked Cookiecutter template, limited to
+    the files matching `paths` patterns, such as `.github/*`, if given"""
+    project_dir = absolute_path(project_dir)
     cruft_file = utils.cruft.get_cruft_file(project_dir)
     cruft_state = json.loads(cruft_file.read_text())
+    pathspec = utils.pathspec.get_pathspec(paths)
+    if quick:
+        return _quick_diff(project_dir, cruft_state, exit_code, checkout, pathspec)
     checkout = checkout or cruft_state.get("commit")
 
-    has_diff = False
+    with AltTemporaryDirectory() as tmpdir_:
+        tmpdir = Path(tmpdir_)
+        # A snapshot of the template rendered at this commit saves cloning and rendering it
+        result = _diff_snapshot(tmpdir, cruft_state, project_dir, exit_code, checkout, pathspec)
+        if result is not None:
+            return result
+
+        # Let's clone the template
+        with span("clone"):
+            repo = utils.cookiecutter.get_cookiecutter_repo(
+                cruft_state["template"], tmpdir / "repo", checkout=checkout
+            )
+        with repo:
+            return _diff_with_repo(
+                repo, tmpdir, cruft_state, project_dir, exit_code, checkout, pathspec
+            )
 
-    directory = cruft_state.get("directory", "")
-    if directory:
-        directory = str(Path("repo") / directory)
-    else:
-        directory = "repo"
 
-    with AltTemporaryDirectory(directory) as tmpdir_:
-        tmpdir = Path(tmpdir_)
-        repo_dir = tmpdir / "repo"
-        remote_template_dir = tmpdir / "remote"
-        local_template_dir = tmpdir / "local"
+def _diff_snapshot(
+    tmpdir: Path,
+    cruft_state: "CruftState",
+    project_dir: Path,
+    exit_code: bool,
+    checkout: Optional[str],
+    pathspec: Optional[List[str]] = None,
+) -> Optional[bool]:
+    """Diff the project against the snapshot of the template rendered at `checkout`, or
+    return None when the project has no such snapshot."""
+    if not checkout:
+        return None
+    with span("restore snapshot"):
+        context = utils.snapshot.restore_snapshot(
+            utils.snapshot.get_snapshot_file(project_dir),
+            cruft_state,
+            checkout,
+            tmpdir / "remote",
+        )
+    if context is None:
+        return None
+    with span("remove paths"):
+        utils.generate.remove_unwanted_paths(
+            tmpdir / "remote", cruft_state, project_dir, update_deleted_paths=True
+        )
+        utils.pathspec.limit_render(tmpdir / "remote", pathspec)
+    return _diff_render(tmpdir, project_dir, exit_code)
 
-        # Create all the directories
-        remote_template_dir.mkdir(parents=True, exist_ok=True)
-        local_template_dir.mkdir(parents=True, exist_ok=True)
 
-        # Let's clone the template
-        with utils.cookiecutter.get_cookiecutter_repo(
-            cruft_state["template"], repo_dir, checkout=checkout
-        ) as repo:
-            # We generate the template for the revision expected by the project
-            utils.generate.cookiecutter_template(
-                output_dir=remote_template_dir,
+def _quick_diff(
+    project_dir: Path,
+    cruft_state: "CruftState",
+    exit_code: bool,
+    checkout: Optional[str],
+    pathspec: Optional[List[str]] = None,
+) -> bool:
+    """List the files of the project differing from the manifest of its template."""
+    if checkout and checkout != cruft_state.get("commit"):
+        typer.secho(
+            "--quick compares the project to the template at the commit of its cruft state,"
+            " and cannot be combined with --checkout.",
+            fg=typer.colors.RED,
+        )
+        return False
+    manifest = utils.manifest.load_manifest(project_dir, cruft_state)
+    if manifest is None:
+        typer.secho(
+            f"No up to date `{utils.manifest.MANIFEST_FILE}` was found in the project."
+            " It is written by create, link and update when passed --manifest, run"
+            " `cruft diff` without --quick meanwhile.",
+            fg=typer.colors.RED,
+        )
+        return False
+
+    skip_paths = utils.generate.get_skip_paths(cruft_state, project_dir / "pyproject.toml")
+    drift = [
+        [path for path in paths if utils.pathspec.matches_pathspec(path, pathspec)]
+        for paths in utils.manifest.get_drift(project_dir, manifest, skip_paths)
+    ]
+    for status, paths in zip(("drifted", "deleted", "extra"), drift):
+        for path in paths:
+            typer.echo(f"{status:<8} {path}")
+    return not (any(drift) and exit_code)
+
+
+def _diff_with_repo(
+    repo: "Repo",
+    tmpdir: Path,
+    cruft_state: "CruftState",
+    project_dir: Path,
+    exit_code: bool,
+    checkout: Optional[str],
+    pathspec: Optional[List[str]] = None,
+) -> bool:
+    if utils.memtree.is_memory_render_enabled() and not utils.cache.active_cache():
+        # Rendered in memory, only the files differing in the project are written out
+        with span("render"):
+            _, tree, _ = utils.generate.cookiecutter_tree(
+                spill_dir=tmpdir / "spill",
                 repo=repo,
                 cruft_state=cruft_state,
                 project_dir=project_dir,
                 checkout=checkout,
                 update_deleted_paths=True,
+                pathspec=pathspec,
             )
+        with span("write drift"):
+            utils.memtree.write_drift(tree, project_dir, tmpdir / "remote", tmpdir / "local")
+        return _show_diff(tmpdir, exit_code)
+
+    remote_template_dir = tmpdir / "remote"
+    remote_template_dir.mkdir(parents=True, exist_ok=True)
+
+    # We generate the template for the revision expected by the project
+    with span("render"):
+        utils.generate.cookiecutter_template(
+            output_dir=remote_template_dir,
+            repo=repo,
+            cruft_state=cruft_state,
+            project_dir=project_dir,
+            checkout=checkout,
+            update_deleted_paths=True,
+            pathspec=pathspec,
+        )
+    return _diff_render(tmpdir, project_dir, exit_code)
+
 
-        # Then we create a new tree with each file in the template that also exist
-        # locally.
+def _diff_render(tmpdir: Path, project_dir: Path, exit_code: bool) -> bool:
+    """Show the diff between the project and the template rendered in `tmpdir / "remote"`."""
+    remote_template_dir = tmpdir / "remote"
+    local_template_dir = tmpdir / "local"
+    local_template_dir.mkdir(parents=True, exist_ok=True)
+
+    # Then we create a new tree with each file in the template that also exist
+    # locally.
+    with span("copy project files"):
         for path in sorted(remote_template_dir.glob("**/*")):
             relative_path = path.relative_to(remote_template_dir)
             local_path = project_dir / relative_path
@@ -61,29 +176,39 @@ def diff(
             else:
                 destination.mkdir(parents=True, exist_ok=True)
                 destination.chmod(local_path.stat().st_mode)
+    return _show_diff(tmpdir, exit_code)
+
+
+def _show_diff(tmpdir: Path, exit_code: bool) -> bool:
+    """Show the diff between the project files in `tmpdir / "local"` and the template files
+    in `tmpdir / "remote"`."""
+    has_diff = False
+    remote_template_dir = tmpdir / "remote"
+    local_template_dir = tmpdir / "local"
 
-        # Finally we can compute and print the diff.
+    # Finally we can compute and print the diff.
+    with span("diff"):
         diff = utils.diff.get_diff(local_template_dir, remote_template_dir)
 
-        if diff.strip():
-            has_diff = True
-
-            if exit_code or not sys.stdout.isatty():
-                # The current shell doesn't run on a TTY or the "--exit-code" flag
-                # is set. This means we're probably not displaying the diff to an
-                # end-user. Let's just output the sanitized version of the diff.
-                #
-                # Note that we can't delegate this check to "git diff" command
-                # because it would show absolute paths to files as we're working in
-                # temporary, non-gitted directories. Doing so would prevent the user
-                # from applying the patch later on as the temporary directories wouldn't
-                # exist anymore.
-                typer.echo(diff, nl=False)
-            else:
-                # We're outputing the diff to a real user. We can delegate the job
-                # to git diff so that they can benefit from coloration and paging.
-                # Ouputing absolute paths is less of a concern although it would be
-                # better to find a way to make git shrink those paths.
-                utils.diff.display_diff(local_template_dir, remote_template_dir)
+    if diff.strip():
+        has_diff = True
+
+        if exit_code or not sys.stdout.isatty():
+            # The current shell doesn't run on a TTY or the "--exit-code" flag
+            # is set. This means we're probably not displaying the diff to an
+            # end-user. Let's just output the sanitized version of the diff.
+            #
+            # Note that we can't delegate this check to "git diff" command
+            # because it would show absolute paths to files as we're working in
+            # temporary, non-gitted directories. Doing so would prevent the user
+            # from applying the patch later on as the temporary directories wouldn't
+            # exist anymore.
+            typer.echo(diff, nl=False)
+        else:
+            # We're outputing the diff to a real user. We can delegate the job
+            # to git diff so that they can benefit from coloration and paging.
+            # Ouputing absolute paths is less of a concern although it would be
+            # better to find a way to make git shrink those paths.
+            utils.diff.display_diff(local_template_dir, remote_template_dir)
 
     return not (has_diff and exit_code)
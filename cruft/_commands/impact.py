@@ -0,0 +1,407 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from pathlib import Path
+from threading import Lock
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from cruft.exceptions import InvalidRevisionRange, UnableToFindCookiecutterTemplate
+
+from . import utils
+from .utils.iohelper import AltTemporaryDirectory
+from .utils.profiling import span
+
+if TYPE_CHECKING:  # pragma: no cover
+    from git import Repo
+    from jinja2 import Environment
+
+    from .utils.cruft import CruftState
+    from .utils.dependencies import TemplateIndex
+    from .utils.manifest import Manifest
+
+UNAFFECTED = "unaffected"
+CLEAN = "clean-apply-likely"
+CONFLICTS = "conflict-likely"
+FAILED = "failed"
+
+
+class ProjectImpact(NamedTuple):
+    """The likely outcome of updating a single project across a range of template revisions:
+    the files of the project the change touches, and the ones the project changed as well."""
+
+    project_dir: Path
+    status: str
+    message: str = ""
+    files: Tuple[str, ...] = ()
+    conflicts: Tuple[str, ...] = ()
+
+
+class _Project(NamedTuple):
+    project_dir: Path
+    cruft_state: "CruftState"
+    manifest: Optional["Manifest"]
+
+
+def impact(
+    template_git_url: str,
+    revision_range: str,
+    project_dirs: Iterable[Path],
+    workers: Optional[int] = None,
+) -> List[ProjectImpact]:
+    """Tell which projects a change of their template affects, without updating them.
+
+    The files changed in the template between the two revisions of `<from>..<to>` are
+    mapped to the files of each project through its `directory` and skipped paths, along
+    with the files including them or using changed variables. Only the paths using
+    variables are rendered, with the variables of each project. A project is then
+    unaffected, likely to apply cleanly, or likely to conflict when it changed any of these
+    files since it was generated, compared to its manifest.
+
+    Projects without an up to date manifest are compared to the files of the template at
+    their commit instead, when the affected files are generated as is: files whose path and
+    content use no Jinja syntax, or copied without being rendered, in templates without
+    hooks. Otherwise the template is rendered once per distinct commit and variables of
+    these projects, one render at a time, which is most of the cost of a large fleet: store
+    the manifests with `--manifest` to avoid it.
+
+    Returns a report per project, in the order the projects were given."""
+    old, separator, new = revision_range.partition("..")
+    if not separator or not old or new.startswith("."):
+        raise InvalidRevisionRange(revision_range)
+    template_git_url = utils.cookiecutter.resolve_template_url(template_git_url)
+
+    reports: Dict[Path, ProjectImpact] = {}
+    groups: Dict[str, List[_Project]] = {}
+    with span("load states"):
+        for project_dir in project_dirs:
+            project_dir = utils.iohelper.absolute_path(project_dir).resolve()
+            if project_dir in reports:
+                continue
+            try:
+                cruft_state = json.loads(utils.cruft.get_cruft_file(project_dir).read_text())
+                template = utils.cookiecutter.resolve_template_url(cruft_state["template"])
+            except Exception as error:
+                reports[project_dir] = ProjectImpact(project_dir, FAILED, str(error))
+                continue
+            if template != template_git_url:
+                reports[project_dir] = ProjectImpact(
+                    project_dir, UNAFFECTED, f"linked to another template, {template}"
+                )
+                continue
+            # Placeholder to keep the order of the projects in the final report
+            reports[project_dir] = ProjectImpact(project_dir, UNAFFECTED)
+            manifest = utils.manifest.load_manifest(project_dir, cruft_state)
+            groups.setdefault(cruft_state.get("directory") or "", []).append(
+                _Project(project_dir, cruft_state, manifest)
+            )
+    if not groups:
+        return list(reports.values())
+
+    with AltTemporaryDirectory() as tmpdir_:
+        tmpdir = Path(tmpdir_)
+        with span("clone"):
+            repo = utils.cookiecutter.get_cookiecutter_repo(template_git_url, tmpdir / "repo")
+        with repo:
+            old_commit = utils.cookiecutter.get_commit(repo, old, template_git_url)
+            new_commit = utils.cookiecutter.get_commit(repo, new or "HEAD", template_git_url)
+            changes = {}
+            with span("template changes"):
+                for directory in groups:
+                    changes[directory] = _TemplateChange(
+                        repo, template_git_url, old_commit, new_commit, directory
+                    )
+            with span("render manifests"):
+                projects = _get_missing_manifests(
+                    repo, groups, changes, new_commit, tmpdir / "renders", reports
+                )
+
+        with span("projects"), ThreadPoolExecutor(max_workers=workers) as executor:
+            for report in executor.map(
+                lambda project: _get_impact(
+                    project, changes[project.cruft_state.get("directory") or ""], new_commit
+                ),
+                projects,
+            ):
+                reports[report.project_dir] = report
+
+    return list(reports.values())
+
+
+def _get_missing_manifests(
+    repo: "Repo",
+    groups: Dict[str, List[_Project]],
+    changes: Dict[str, "_TemplateChange"],
+    new_commit: str,
+    renders_dir: Path,
+    reports: Dict[Path, ProjectImpact],
+) -> List[_Project]:
+    # Read from the template when possible, or else rendered once per distinct template
+    # commit and variables, like the manifests are keyed. A render failing, such as for a
+    # commit missing from the template, fails every project sharing it, and only them.
+    manifests: Dict[str, Union["Manifest", str]] = {}
+    projects = []
+    for directory, group in groups.items():
+        for project in group:
+            if project.manifest is None:
+                cruft_state = project.cruft_state
+                try:
+                    commit = cruft_state["commit"]
+                    manifest = _read_template_files(repo, project, changes[directory], new_commit)
+                    if manifest is not None:
+                        projects.append(project._replace(manifest=manifest))
+                        continue
+                    key = json.dumps(utils.manifest.get_state_key(cruft_state, commit))
+                except Exception as error:
+                    reports[project.project_dir] = ProjectImpact(
+                        project.project_dir, FAILED, str(error)
+                    )
+                    continue
+                if key not in manifests:
+                    render_dir = renders_dir / str(len(manifests))
+                    try:
+                        utils.generate.render_template(render_dir, repo, cruft_state, commit)
+                        manifests[key] = utils.manifest.get_manifest(render_dir)
+                    except Exception as error:
+                        manifests[key] = f"unable to render the template at {commit}, {error}"
+                manifest = manifests[key]
+                if isinstance(manifest, str):
+                    reports[project.project_dir] = ProjectImpact(
+                        project.project_dir, FAILED, manifest
+                    )
+                    continue
+                project = project._replace(manifest=manifest)
+            projects.append(project)
+    if manifests:
+        # The templated paths are rendered with the local extensions of the new commit
+        repo.head.reset(commit=new_commit, working_tree=True)
+    return projects
+
+
+def _read_template_files(
+    repo: "Repo", project: _Project, change: "_TemplateChange", new_commit: str
+) -> Optional["Manifest"]:
+    """The entries the template generated at the commit of a project for its affected files,
+    read from the files of the template rather than rendered, None when some of them can't
+    be: when their path or content uses Jinja syntax, or may be changed by hooks or by the
+    settings of the environment."""
+    cruft_state = project.cruft_state
+    commit = cruft_state["commit"]
+    if commit == new_commit:
+        return {}
+    variables = cruft_state["context"]["cookiecutter"]
+    if any(name in variables for name in ("_new_lines", "_jinja2_env_vars")):
+        return None
+    tree = repo.commit(commit).tree
+    directory = cruft_state.get("directory")
+    try:
+        if directory:
+            tree = tree / directory.strip("/")
+        has_hooks = any(item.name == "hooks" for item in tree)
+        if has_hooks and utils.hooks.get_hook_policy() != "skip":
+            return None
+        tree = tree / change.template_dir_name
+    except KeyError:
+        return None
+
+    manifest = {}
+    for relative_path, (path, _) in change.project_paths(variables).items():
+        if relative_path != path:
+            return None
+        try:
+            blob = tree / path
+        except KeyError:
+            # The file was not part of the template yet
+            continue
+        if blob.type != "blob" or blob.mode == 0o120000:
+            return None
+        data = blob.data_stream.read()
+        if not utils.incremental.is_copied(path, cruft_state["context"]) and (
+            any(marker in data for marker in (b"{{", b"{%", b"{#", b"\r")) or not _is_utf8(data)
+        ):
+            return None
+        manifest[path] = utils.manifest.FileEntry(blob.mode, len(data), sha256(data).hexdigest())
+    return manifest
+
+
+def _is_utf8(data: bytes) -> bool:
+    try:
+        data.decode("utf-8")
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+class _TemplateChange:
+    """The files of a template changed between two revisions, and what else they affect,
+    by path relative to its project template directory."""
+
+    def __init__(self, repo: "Repo", template: str, old: str, new: str, directory: str):
+        from cookiecutter.utils import create_env_with_context
+
+        repo.head.reset(commit=new, working_tree=True)
+        repo.submodule_update(recursive=True, force_reset=True)
+        assert repo.working_dir is not None  # nosec B101 (allow assert for type checking)
+        self.inner_dir = inner_dir = Path(repo.working_dir) / directory
+        self.changed: Dict[str, str] = {}
+        self.changed_templates: Set[str] = set()
+        # Set when the change may affect every file, such as a change of the hooks
+        self.everything: Optional[str] = None
+        self.index: Optional["TemplateIndex"] = None
+        self.copied_files: Set[str] = set()
+        self._lock = Lock()
+        self._affected: Dict[FrozenSet[str], Dict[str, str]] = {}
+        self._paths: Dict[str, Any] = {}
+
+        template_dir = utils.incremental.find_template_dir(inner_dir)
+        if template_dir is None:
+            raise UnableToFindCookiecutterTemplate(inner_dir)
+        self.template_dir_name = template_dir.name
+        diff = utils.incremental.get_template_diff(repo, old, new, directory)
+        self.everything = diff.everything
+        for path, status in diff.files.items():
+            top = path.split("/")[0]
+            if top == template_dir.name:
+                self.changed[path[len(top) + 1 :]] = status
+            elif top == "templates":
+                self.changed_templates.add(path[len("templates/") :])
+            elif "{{" in top:
+                self.everything = self.everything or "the template directory was renamed"
+        old_variables = utils.cookiecutter.read_cookiecutter_json(repo, old, directory)
+        new_variables = utils.cookiecutter.read_cookiecutter_json(repo, new, directory)
+        # The commit of the template is a variable of its own
+        self.variables = {"_commit"} | {
+            name
+            for name in set(old_variables) | set(new_variables)
+            if old_variables.get(name) != new_variables.get(name)
+        }
+        self.defaults = {
+            name: value[0] if isinstance(value, list) and value else value
+            for name, value in new_variables.items()
+        }
+
+        context = utils.cookiecutter.generate_cookiecutter_context(
+            template, new, inner_dir, no_input=True
+        )
+        if self.variables.intersection(utils.incremental.GENERATION_VARIABLES):
+            self.everything = "variables changing how the template is generated changed"
+        with utils.iohelper.rendering(inner_dir):
+            self.environment: "Environment" = create_env_with_context(context)
+            self.index = utils.dependencies.get_template_index(
+                repo, new, inner_dir, template_dir, self.environment
+            )
+        self.copied_files = {
+            path for path in self.index.files if utils.incremental.is_copied(path, context)
+        }
+
+    def affected(self, variables: Dict[str, Any]) -> Dict[str, str]:
+        """The status of the template files whose render likely changes for a project with
+        the given variables: A, M or D. Projects keep the values of their own variables, so
+        only the private variables, and the variables they don't define, change."""
+        assert self.index is not None  # nosec B101 (allow assert for type checking)
+        changed_variables = frozenset(
+            name for name in self.variables if name.startswith("_") or name not in variables
+        )
+        with self._lock:
+            affected = self._affected.get(changed_variables)
+            if affected is None:
+                if self.everything:
+                    paths = set(self.index.files)
+                else:
+                    paths = utils.dependencies.get_affected_files(
+                        self.index,
+                        set(self.changed) | self.changed_templates,
+                        set(changed_variables),
+                        self.copied_files,
+                    )
+                affected = {path: "M" for path in paths if path in self.index.files}
+                affected.update(self.changed)
+                self._affected[changed_variables] = affected
+        return affected
+
+    def project_paths(self, variables: Dict[str, Any]) -> Dict[str, Tuple[str, str]]:
+        """The template files affected for a project with the given variables, with their
+        status, by their path in the project, see `affected`."""
+        paths = {}
+        for path, status in self.affected(variables).items():
+            relative_path = self.render_path(path, variables)
+            if relative_path is not None:
+                paths[relative_path] = (path, status)
+        return paths
+
+    def render_path(self, path: str, variables: Dict[str, Any]) -> Optional[str]:
+        """The path in a project of a template file, None when it isn't generated. Rendered
+        like the template, one render at a time and with its local extensions importable."""
+        if "{{" not in path and "{%" not in path:
+            return path
+        with utils.iohelper.rendering(self.inner_dir):
+            template = self._paths.get(path)
+            if template is None:
+                template = self._paths[path] = self.environment.from_string(path)
+            rendered = template.render(cookiecutter=dict(self.defaults, **variables))
+        parts = rendered.split("/")
+        if not all(parts):
+            # Rendered to an empty name, the file is never generated
+            return None
+        return rendered
+
+
+def _get_impact(project: _Project, change: _TemplateChange, new_commit: str) -> ProjectImpact:
+    try:
+        return _classify(project, change, new_commit)
+    except Exception as error:
+        # Such as an invalid cruft state, which only fails its own project
+        return ProjectImpact(project.project_dir, FAILED, str(error))
+
+
+def _classify(project: _Project, change: _TemplateChange, new_commit: str) -> ProjectImpact:
+    project_dir, cruft_state, manifest = project
+    if cruft_state["commit"] == new_commit:
+        return ProjectImpact(project_dir, UNAFFECTED, f"already at {new_commit[:10]}")
+    variables = cruft_state["context"]["cookiecutter"]
+    skip_parts = utils.manifest.get_skip_parts(
+        utils.generate.get_skip_paths(cruft_state, project_dir / "pyproject.toml")
+    )
+    try:
+        paths = change.project_paths(variables)
+    except Exception as error:
+        return ProjectImpact(project_dir, FAILED, f"unable to render the paths, {error}")
+
+    files: List[str] = []
+    conflicts: List[str] = []
+    for relative_path, (_, status) in sorted(paths.items()):
+        if utils.manifest.is_skipped(relative_path, skip_parts):
+            continue
+        entry = manifest.get(relative_path) if manifest is not None else None
+        local_path = project_dir / relative_path
+        exists = local_path.is_file() or local_path.is_symlink()
+        if entry is None:
+            if status == "D" and not exists:
+                continue
+            # Added by the template, or changed while the project has a file of its own
+            files.append(relative_path)
+            if exists:
+                conflicts.append(relative_path)
+        elif exists:
+            files.append(relative_path)
+            if utils.manifest.get_file_hash(local_path) != entry.sha256:
+                conflicts.append(relative_path)
+        # Otherwise deleted from the project, and left out of its updates
+
+    message = change.everything or ""
+    if conflicts:
+        return ProjectImpact(project_dir, CONFLICTS, message, tuple(files), tuple(conflicts))
+    if files:
+        return ProjectImpact(project_dir, CLEAN, message, tuple(files))
+    return ProjectImpact(project_dir, UNAFFECTED, message)
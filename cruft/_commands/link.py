@@ -1,11 +1,17 @@
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import TYPE_CHECKING, Any, Dict, Optional
 
 import typer
 
 from . import utils
 from .utils import example
-from .utils.iohelper import AltTemporaryDirectory
+from .utils.iohelper import AltTemporaryDirectory, absolute_path
+from .utils.profiling import span
+
+if TYPE_CHECKING:  # pragma: no cover
+    from git import Repo
+
+    from .utils.cruft import CruftState
 
 
 @example("https://github.com/timothycrosley/cookiecutter-python/")
@@ -18,13 +24,23 @@ def link(
     default_config: bool = False,
     extra_context: Optional[Dict[str, Any]] = None,
     directory: Optional[str] = None,
+    manifest: bool = False,
+    snapshot: bool = False,
+    detect_commit: bool = False,
+    max_renders: int = 16,
 ) -> bool:
-    """Links an existing project created from a template, to the template it was created from."""
+    """Links an existing project created from a template, to the template it was created from.
+
+    With `detect_commit`, the project is linked to the commit of the template whose render
+    best matches it rather than to the latest one, rendering at most `max_renders` commits.
+    The template is only rendered to detect the commit, or to store the manifest and the
+    snapshot of the template when asked, and its hooks are never run."""
+    project_dir = absolute_path(project_dir)
     cruft_file = utils.cruft.get_cruft_file(project_dir, exists=False)
     template_git_url = utils.cookiecutter.resolve_template_url(template_git_url)
-    with AltTemporaryDirectory(directory) as cookiecutter_template_dir_str:
+    with AltTemporaryDirectory() as cookiecutter_template_dir_str:
         cookiecutter_template_dir = Path(cookiecutter_template_dir_str)
-        with utils.cookiecutter.get_cookiecutter_repo(
+        with span("clone"), utils.cookiecutter.get_cookiecutter_repo(
             template_git_url, cookiecutter_template_dir, checkout
         ) as repo:
             last_commit = repo.head.object.hexsha
@@ -32,34 +48,93 @@ def link(
         if directory:
             cookiecutter_template_dir = cookiecutter_template_dir / directory
 
-        context = utils.cookiecutter.generate_cookiecutter_context(
-            template_git_url,
-            last_commit,
-            cookiecutter_template_dir,
-            config_file,
-            default_config,
-            extra_context,
-            no_input,
-        )
+        with span("context"):
+            context = utils.cookiecutter.generate_cookiecutter_context(
+                template_git_url,
+                last_commit,
+                cookiecutter_template_dir,
+                config_file,
+                default_config,
+                extra_context,
+                no_input,
+            )
+        detection = None
+        if detect_commit:
+            # Linking never runs the hooks of the template, which may change files anywhere
+            with span("detect commit"), utils.hooks.hook_policy("skip"), utils.gitrunner.Repo(
+                cookiecutter_template_dir_str
+            ) as repo:
+                detection = utils.detect.detect_commit(
+                    repo,
+                    {
+                        "template": template_git_url,
+                        "commit": last_commit,
+                        "context": context,
+                        "directory": directory,
+                    },
+                    project_dir,
+                    max_renders,
+                )
+                _report_detection(repo, detection)
+            detected_commit = detection.candidates[0].commit
+        else:
+            detected_commit = last_commit
+
         if no_input:
-            use_commit = last_commit
+            use_commit = detected_commit
         else:
             typer.echo(
-                f"Linking against the commit: {last_commit}"
+                f"Linking against the commit: {detected_commit}"
                 f" which corresponds with the git reference: {checkout}"
             )
             typer.echo("Press enter to link against this commit or provide an alternative commit.")
-            use_commit = typer.prompt("Link to template at commit", default=last_commit)
+            use_commit = typer.prompt("Link to template at commit", default=detected_commit)
+        if detection is not None and use_commit == detected_commit:
+            # The variables as the detected commit of the template defines them
+            context = detection.candidates[0].context
 
-        cruft_file.write_text(
-            utils.cruft.json_dumps(
-                {
-                    "template": template_git_url,
-                    "commit": use_commit,
-                    "checkout": checkout,
-                    "context": context,
-                    "directory": directory,
-                }
-            )
-        )
+        cruft_state = {
+            "template": template_git_url,
+            "commit": use_commit,
+            "checkout": checkout,
+            "context": context,
+            "directory": directory,
+        }
+        if manifest or snapshot:
+            # Recorded before the cruft state, so that a failed render doesn't leave it behind
+            with span("record"), utils.gitrunner.Repo(cookiecutter_template_dir_str) as repo:
+                _record_template(repo, cruft_state, project_dir, manifest, snapshot)
+        cruft_file.write_text(utils.cruft.json_dumps(cruft_state))
         return True
+
+
+def _record_template(
+    repo: "Repo", cruft_state: "CruftState", project_dir: Path, manifest: bool, snapshot: bool
+):
+    assert repo.working_dir is not None  # nosec B101 (allow assert for type checking)
+    repo.head.reset(commit=cruft_state["commit"], working_tree=True)
+    inner_dir = Path(repo.working_dir) / (cruft_state.get("directory") or "")
+    if utils.hooks.get_hook_names(inner_dir):
+        # Without its hooks, the render would differ from the ones of diff and update
+        typer.secho(
+            "The manifest and the snapshot of the template were not stored, as link doesn't"
+            " run its hooks. Pass --manifest or --snapshot to the next `cruft update` to"
+            " store them.",
+            fg=typer.colors.YELLOW,
+        )
+        return
+    utils.generate.record_template(repo, cruft_state, project_dir, manifest, snapshot)
+
+
+def _report_detection(repo: "Repo", detection: "utils.detect.Detection", top: int = 5):
+    typer.echo(
+        f"Rendered {detection.renders} of {detection.commits} template commits"
+        f" in {detection.duration:.1f}s, the best matches are:"
+    )
+    for candidate in detection.candidates[:top]:
+        commit = repo.commit(candidate.commit)
+        summary = commit.summary if isinstance(commit.summary, str) else commit.summary.decode()
+        typer.echo(
+            f"  {candidate.score:6.1%}  {candidate.commit[:10]}"
+            f"  {commit.committed_datetime:%Y-%m-%d}  {summary}"
+        )
@@ -0,0 +1,172 @@
+import io
+import json
+import socket
+import socketserver
+import sys
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from pathlib import Path
+from threading import local
+from typing import Any, Dict, Iterator, Optional, TextIO
+
+from cruft._version import __version__
+from cruft.exceptions import CruftError, DaemonAlreadyRunning
+
+from . import utils
+from .check import check
+from .diff import diff
+from .update import update
+from .utils.iohelper import AltTemporaryDirectory
+
+SERVED_COMMANDS = {"check": check, "diff": diff, "update": update}
+
+
+def serve(socket_path: Optional[Path] = None, cache_dir: Optional[Path] = None) -> None:
+    """Run a daemon serving check, diff and update requests over a local Unix socket.
+
+    The daemon keeps a mirror of every template it sees and the templates it renders,
+    so that later requests skip the cloning and rendering work done by earlier ones.
+    While it runs, the CLI transparently routes the non interactive check, diff and update
+    commands to it, each with the settings of its client, such as CRUFT_HOOKS or
+    CRUFT_GIT_TIMEOUT, rather than the ones of the daemon. Each request is served by a
+    thread of its own, but the templates are rendered by one request at a time, as
+    rendering is process wide: requests only overlap while fetching templates and applying
+    changes."""
+    if not hasattr(socket, "AF_UNIX"):  # pragma: no cov_4_nix
+        raise CruftError("The cruft daemon requires support for Unix sockets !")
+    socket_path = socket_path or utils.daemon.get_socket_path()
+    cache_dir = cache_dir or utils.cache.get_cache_dir()
+    connection = utils.daemon.connect(socket_path)
+    if connection is not None:
+        connection.close()
+        raise DaemonAlreadyRunning(socket_path)
+    if socket_path.exists():
+        # Left behind by a daemon which did not shut down cleanly
+        socket_path.unlink()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    output, error_output = _ThreadOutput(sys.stdout), _ThreadOutput(sys.stderr)
+    with AltTemporaryDirectory() as renders_dir, redirect_stdout(output):  # type: ignore
+        with redirect_stderr(error_output), utils.cache.using_cache(  # type: ignore
+            utils.cache.TemplateCache(cache_dir, Path(renders_dir))
+        ):
+            server = _Server(str(socket_path), output, error_output)
+            try:
+                socket_path.chmod(0o600)
+                server.serve_forever()
+            finally:
+                server.server_close()
+                if socket_path.exists():
+                    socket_path.unlink()
+
+
+def stop_daemon(socket_path: Optional[Path] = None) -> bool:
+    """Stop the running daemon. Returns False if no daemon was running."""
+    connection = utils.daemon.connect(socket_path)
+    if connection is None:
+        return False
+    with connection:
+        utils.daemon.send(connection, {"version": __version__, "command": "shutdown"})
+    return True
+
+
+class _ThreadOutput(io.TextIOBase):
+    """A standard output or error sending what each request writes to its own buffer."""
+
+    encoding = "utf-8"
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self._local = local()
+
+    @contextmanager
+    def capture(self) -> Iterator[io.StringIO]:
+        self._local.buffer = io.StringIO()
+        try:
+            yield self._local.buffer
+        finally:
+            del self._local.buffer
+
+    def _target(self) -> TextIO:
+        buffer = getattr(self._local, "buffer", None)
+        return self.stream if buffer is None else buffer
+
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+    def isatty(self) -> bool:
+        return self._target().isatty()
+
+    def writable(self) -> bool:
+        return True
+
+
+# UnixStreamServer is missing on platforms without Unix sockets, where serve refuses to start
+_UnixStreamServer = getattr(socketserver, "UnixStreamServer", socketserver.TCPServer)
+
+
+class _Server(socketserver.ThreadingMixIn, _UnixStreamServer):  # type: ignore
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, output: _ThreadOutput, error_output: _ThreadOutput):
+        self.output = output
+        self.error_output = error_output
+        super().__init__(socket_path, _RequestHandler)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    server: _Server
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        request = json.loads(line)
+        command = request.get("command")
+        if command == "shutdown":
+            self._reply({"version": __version__, "exit_code": 0, "output": ""})
+            self.server.shutdown()
+        elif request.get("version") != __version__:
+            # Let the client run the command itself
+            self._reply({"version": __version__})
+        else:
+            self._reply(
+                self._run_command(
+                    command, request.get("arguments") or {}, request.get("settings") or {}
+                )
+            )
+
+    def _reply(self, response: Dict[str, Any]):
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+    def _run_command(
+        self, command: str, arguments: Dict[str, Any], settings: Dict[str, Optional[str]]
+    ) -> Dict[str, Any]:
+        for name in utils.daemon.PATH_ARGUMENTS:
+            if arguments.get(name) is not None:
+                arguments[name] = Path(arguments[name])
+        if command == "update":
+            # There is no terminal to prompt on
+            arguments.update(cookiecutter_input=False, skip_apply_ask=True)
+
+        exit_code, error = 1, None
+        with self.server.output.capture() as buffer, self.server.error_output.capture() as errors:
+            with utils.config.using_settings(settings):
+                try:
+                    if command not in SERVED_COMMANDS:
+                        raise CruftError(f"The cruft daemon cannot run `{command}` !")
+                    if SERVED_COMMANDS[command](**arguments):
+                        exit_code = 0
+                except CruftError as cruft_error:
+                    error = cruft_error.format_message()
+                except Exception as exception:
+                    error = f"{type(exception).__name__}: {exception}"
+            return {
+                "version": __version__,
+                "exit_code": exit_code,
+                "output": buffer.getvalue(),
+                "error": error,
+                "error_output": errors.getvalue(),
+            }
@@ -1,14 +1,20 @@
 import json
 from pathlib import Path
-from subprocess import DEVNULL, PIPE, CalledProcessError, run  # nosec
-from typing import Any, Dict, Optional, Set
+from subprocess import DEVNULL, CalledProcessError  # nosec
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
 
 import click
 import typer
 
 from . import utils
 from .utils import example
-from .utils.iohelper import AltTemporaryDirectory
+from .utils.iohelper import AltTemporaryDirectory, absolute_path
+from .utils.profiling import span
+
+if TYPE_CHECKING:  # pragma: no cover
+    from git import Repo
+
+    from .utils.cruft import CruftState
 
 
 @example(skip_apply_ask=False)
@@ -25,8 +31,68 @@ def update(
     allow_untracked_files: bool = False,
     extra_context: Optional[Dict[str, Any]] = None,
     extra_context_file: Optional[Path] = None,
+    manifest: bool = False,
+    snapshot: bool = False,
+    incremental: bool = False,
+    only: Optional[List[str]] = None,
+    advance_state: bool = False,
 ) -> bool:
-    """Update specified project's cruft to the latest and greatest release."""
+    """Update specified project's cruft to the latest and greatest release.
+
+    Given `only` patterns, such as `.github/*`, only the files matching them are rendered
+    and updated, and the cruft state is left as is unless `advance_state` is set, so that
+    the next update still brings the changes of the other files."""
+    project_dir = absolute_path(project_dir)
+    with span("load state"):
+        inputs = _load_update_inputs(
+            project_dir, allow_untracked_files, extra_context, extra_context_file
+        )
+    if inputs is None:
+        return False
+    cruft_file, cruft_state, extra_context = inputs
+
+    if template_path is None:
+        template_git_str = cruft_state["template"]
+    else:
+        template_git_str = utils.cookiecutter.resolve_template_url(str(template_path))
+    with AltTemporaryDirectory() as tmpdir_:
+        tmpdir = Path(tmpdir_)
+        # Clone the template
+        with span("clone"):
+            repo = utils.cookiecutter.get_cookiecutter_repo(
+                template_git_str, tmpdir / "repo", checkout
+            )
+        with repo:
+            return _update_with_repo(
+                repo,
+                tmpdir,
+                cruft_file,
+                cruft_state,
+                project_dir,
+                cookiecutter_input,
+                refresh_private_variables,
+                skip_apply_ask,
+                skip_update,
+                checkout,
+                strict,
+                allow_untracked_files,
+                extra_context,
+                manifest,
+                snapshot,
+                incremental,
+                utils.pathspec.get_pathspec(only),
+                advance_state,
+            )
+
+
+def _load_update_inputs(
+    project_dir: Path,
+    allow_untracked_files: bool,
+    extra_context: Optional[Dict[str, Any]] = None,
+    extra_context_file: Optional[Path] = None,
+) -> Optional[Tuple[Path, "CruftState", Optional[Dict[str, Any]]]]:
+    """Read the cruft state and the variables to update, or return None if the project
+    cannot be updated."""
     cruft_file = utils.cruft.get_cruft_file(project_dir)
 
     if extra_context_file:
@@ -39,7 +105,7 @@ def update(
                 f" part of the process.",
                 fg=typer.colors.RED,
             )
-            return False
+            return None
 
         extra_context_from_cli = extra_context
         with open(extra_context_file, "r") as extra_context_fp:
@@ -57,46 +123,79 @@ def update(
             " Please make sure your git working tree is clean before proceeding.",
             fg=typer.colors.RED,
         )
-        return False
+        return None
 
-    cruft_state = json.loads(cruft_file.read_text())
+    return cruft_file, json.loads(cruft_file.read_text()), extra_context
 
-    directory = cruft_state.get("directory", "")
-    if directory:
-        directory = str(Path("repo") / directory)
-    else:
-        directory = "repo"
-    if template_path is None:
-        template_git_str = cruft_state["template"]
-    else:
-        template_git_str = utils.cookiecutter.resolve_template_url(str(template_path))
-    with AltTemporaryDirectory(directory) as tmpdir_:
-        # Initial setup
-        tmpdir = Path(tmpdir_)
-        repo_dir = tmpdir / "repo"
-        current_template_dir = tmpdir / "current_template"
-        new_template_dir = tmpdir / "new_template"
-        deleted_paths: Set[Path] = set()
 
-        # Clone the template
-        with utils.cookiecutter.get_cookiecutter_repo(template_git_str, repo_dir, checkout) as repo:
-            last_commit = repo.head.object.hexsha
-
-            # Bail early if the repo is already up to date and no inputs are asked
-            if not (
-                extra_context or cookiecutter_input or refresh_private_variables
-            ) and utils.cruft.is_project_updated(repo, cruft_state["commit"], last_commit, strict):
-                typer.secho(
-                    "Nothing to do, project's cruft is already up to date!", fg=typer.colors.GREEN
-                )
-                return True
-
-            # Generate clean outputs via the cookiecutter
-            # from the current cruft state commit of the cookiecutter and the updated
-            # cookiecutter.
-            # For the current cruft state, we do not try to update the cookiecutter_input
-            # because we want to keep the current context input intact.
-            _ = utils.generate.cookiecutter_template(
+def _update_with_repo(
+    repo: "Repo",
+    tmpdir: Path,
+    cruft_file: Path,
+    cruft_state: "CruftState",
+    project_dir: Path,
+    cookiecutter_input: bool,
+    refresh_private_variables: bool,
+    skip_apply_ask: bool,
+    skip_update: bool,
+    checkout: Optional[str],
+    strict: bool,
+    allow_untracked_files: bool,
+    extra_context: Optional[Dict[str, Any]],
+    manifest: bool = False,
+    snapshot: bool = False,
+    incremental: bool = False,
+    pathspec: Optional[List[str]] = None,
+    advance_state: bool = False,
+) -> bool:
+    current_template_dir = tmpdir / "current_template"
+    new_template_dir = tmpdir / "new_template"
+    rendered_dir = tmpdir / "rendered"
+    previous_dir = tmpdir / "previous"
+    deleted_paths: Set[Path] = set()
+    snapshot_file = utils.snapshot.get_snapshot_file(project_dir)
+    # Once stored, the manifest and the snapshot are kept up to date by every update
+    manifest = manifest or utils.manifest.get_manifest_file(project_dir).is_file()
+    snapshot = snapshot or snapshot_file.is_file()
+    # Limited to some paths, the update is only recorded in the cruft state when asked to,
+    # which requires the new render to be complete for the manifest and the snapshot
+    record = pathspec is None or advance_state
+    keep_render = record and (manifest or snapshot)
+
+    last_commit = repo.head.object.hexsha
+
+    # Bail early if the repo is already up to date and no inputs are asked
+    with span("compare"):
+        is_updated = not (
+            extra_context or cookiecutter_input or refresh_private_variables
+        ) and utils.cruft.is_project_updated(repo, cruft_state["commit"], last_commit, strict)
+    if is_updated:
+        typer.secho("Nothing to do, project's cruft is already up to date!", fg=typer.colors.GREEN)
+        return True
+
+    # Generate clean outputs via the cookiecutter
+    # from the current cruft state commit of the cookiecutter and the updated
+    # cookiecutter.
+    # For the current cruft state, we do not try to update the cookiecutter_input
+    # because we want to keep the current context input intact.
+    # Rendered in memory, only the files differing between the renders are written out
+    in_memory = utils.memtree.is_memory_render_enabled() and not (
+        incremental or snapshot or utils.cache.active_cache()
+    )
+    with span("render current"):
+        if in_memory:
+            current_context, current_tree, _ = utils.generate.cookiecutter_tree(
+                spill_dir=tmpdir / "spill",
+                repo=repo,
+                cruft_state=cruft_state,
+                project_dir=project_dir,
+                checkout=cruft_state["commit"],
+                deleted_paths=deleted_paths,
+                update_deleted_paths=True,
+                pathspec=pathspec,
+            )
+        else:
+            current_context = utils.generate.cookiecutter_template(
                 output_dir=current_template_dir,
                 repo=repo,
                 cruft_state=cruft_state,
@@ -104,18 +203,42 @@ def update(
                 checkout=cruft_state["commit"],
                 deleted_paths=deleted_paths,
                 update_deleted_paths=True,
+                snapshot_file=snapshot_file,
+                rendered_dir=previous_dir if incremental else None,
+                pathspec=pathspec,
             )
-            # Remove private variables from cruft_state to refresh their values
-            # from the cookiecutter template config
-            if refresh_private_variables:
-                _clean_cookiecutter_private_variables(cruft_state)
-
-            # Add new input data from command line to cookiecutter context
-            if extra_context:
-                extra = cruft_state["context"]["cookiecutter"]
-                for k, v in extra_context.items():
-                    extra[k] = v
-
+    # Unless the variables change, only the files changed since are rendered again
+    previous = None
+    if incremental:
+        previous = utils.incremental.PreviousRender(
+            cruft_state["commit"], previous_dir, current_context
+        )
+    # Remove private variables from cruft_state to refresh their values
+    # from the cookiecutter template config
+    if refresh_private_variables:
+        _clean_cookiecutter_private_variables(cruft_state)
+
+    # Add new input data from command line to cookiecutter context
+    if extra_context:
+        extra = cruft_state["context"]["cookiecutter"]
+        for k, v in extra_context.items():
+            extra[k] = v
+
+    new_render = None
+    with span("render new"):
+        if in_memory:
+            new_context, new_tree, new_render = utils.generate.cookiecutter_tree(
+                spill_dir=tmpdir / "spill",
+                repo=repo,
+                cruft_state=cruft_state,
+                project_dir=project_dir,
+                cookiecutter_input=cookiecutter_input,
+                checkout=last_commit,
+                deleted_paths=deleted_paths,
+                pathspec=pathspec,
+                complete=keep_render,
+            )
+        else:
             new_context = utils.generate.cookiecutter_template(
                 output_dir=new_template_dir,
                 repo=repo,
@@ -124,30 +247,52 @@ def update(
                 cookiecutter_input=cookiecutter_input,
                 checkout=last_commit,
                 deleted_paths=deleted_paths,
+                rendered_dir=rendered_dir if keep_render else None,
+                previous=previous,
+                pathspec=pathspec,
+            )
+    if in_memory:
+        with span("write changes"):
+            utils.memtree.write_changes(
+                current_tree, new_tree, current_template_dir, new_template_dir
             )
 
-        # Given the two versions of the cookiecutter outputs based
-        # on the current project's context we calculate the diff and
-        # apply the updates to the current project.
-        if _apply_project_updates(
-            current_template_dir,
-            new_template_dir,
-            project_dir,
-            skip_update,
-            skip_apply_ask,
-            allow_untracked_files,
-        ):
-            # Update the cruft state and dump the new state
-            # to the cruft file
-            cruft_state["commit"] = last_commit
-            cruft_state["checkout"] = checkout
-            cruft_state["context"] = new_context
-            cruft_file.write_text(utils.cruft.json_dumps(cruft_state))
+    # Given the two versions of the cookiecutter outputs based
+    # on the current project's context we calculate the diff and
+    # apply the updates to the current project.
+    if _apply_project_updates(
+        current_template_dir,
+        new_template_dir,
+        project_dir,
+        skip_update,
+        skip_apply_ask,
+        allow_untracked_files,
+    ):
+        if not record:
             typer.secho(
-                "Good work! Project's cruft has been updated and is as clean as possible!",
+                "Updated the files matching the given paths. The cruft state was left as is,"
+                " pass --advance-state to record the update.",
                 fg=typer.colors.GREEN,
             )
-        return True
+            return True
+        # Update the cruft state and dump the new state
+        # to the cruft file
+        cruft_state["commit"] = last_commit
+        cruft_state["checkout"] = checkout
+        cruft_state["context"] = new_context
+        cruft_file.write_text(utils.cruft.json_dumps(cruft_state))
+        with span("record"):
+            if new_render is not None and manifest:
+                utils.manifest.save_manifest(project_dir, new_render.get_manifest(), cruft_state)
+            elif keep_render:
+                utils.generate.record_render(
+                    project_dir, rendered_dir, cruft_state, new_context, manifest, snapshot
+                )
+        typer.secho(
+            "Good work! Project's cruft has been updated and is as clean as possible!",
+            fg=typer.colors.GREEN,
+        )
+    return True
 
 
 def _clean_cookiecutter_private_variables(cruft_state: dict):
@@ -165,8 +310,8 @@ def _is_git_repo(directory: Path):
     # Taken from https://stackoverflow.com/a/16925062
     # This works even if we are in a sub folder in a git
     # repo
-    output = run(
-        ["git", "rev-parse", "--is-inside-work-tree"], stdout=PIPE, stderr=DEVNULL, cwd=directory
+    output = utils.gitrunner.run_git(
+        "rev-parse", "--is-inside-work-tree", stderr=DEVNULL, cwd=directory
     )
     if b"true" in output.stdout:
         return True
@@ -180,7 +325,7 @@ def _has_untracked_file(status_line: str):
 def _is_project_repo_clean(directory: Path, allow_untracked_files: bool):
     if not _is_git_repo(directory):
         return True
-    git_status = run(["git", "status", "--porcelain"], stdout=PIPE, stderr=DEVNULL, cwd=directory)
+    git_status = utils.gitrunner.run_git("status", "--porcelain", stderr=DEVNULL, cwd=directory)
     status_lines = git_status.stdout.decode("utf-8").split("\n")
     # remove empty string from trailing newline
     status_lines = [line for line in status_lines if line]
@@ -191,22 +336,15 @@ def _is_project_repo_clean(directory: Path, allow_untracked_files: bool):
     return True
 
 
-def _apply_patch_with_rejections(diff: str, expanded_dir_path: Path):
+def _apply_patch_with_rejections(diff: str, expanded_dir_path: Path) -> bool:
     offset = _get_offset(expanded_dir_path)
 
-    git_apply = ["git", "apply", "--reject"]
+    git_apply = ["apply", "--reject"]
     if offset:
         git_apply.extend(["--directory", offset])
 
     try:
-        run(
-            git_apply,
-            input=diff.encode(),
-            stderr=PIPE,
-            stdout=PIPE,
-            check=True,
-            cwd=expanded_dir_path,
-        )
+        utils.gitrunner.run_git(*git_apply, input=diff.encode(), check=True, cwd=expanded_dir_path)
     except CalledProcessError as error:
         typer.secho(error.stderr.decode(), err=True)
         typer.secho(
@@ -216,24 +354,19 @@ def _apply_patch_with_rejections(diff: str, expanded_dir_path: Path):
             ),
             fg=typer.colors.YELLOW,
         )
+        return False
+    return True
 
 
-def _apply_three_way_patch(diff: str, expanded_dir_path: Path, allow_untracked_files: bool):
+def _apply_three_way_patch(diff: str, expanded_dir_path: Path, allow_untracked_files: bool) -> bool:
     offset = _get_offset(expanded_dir_path)
 
-    git_apply = ["git", "apply", "-3"]
+    git_apply = ["apply", "-3"]
     if offset:
         git_apply.extend(["--directory", offset])
 
     try:
-        run(
-            git_apply,
-            input=diff.encode(),
-            stderr=PIPE,
-            stdout=PIPE,
-            check=True,
-            cwd=expanded_dir_path,
-        )
+        utils.gitrunner.run_git(*git_apply, input=diff.encode(), check=True, cwd=expanded_dir_path)
     except CalledProcessError as error:
         typer.secho(error.stderr.decode(), err=True)
         if _is_project_repo_clean(expanded_dir_path, allow_untracked_files):
@@ -241,19 +374,15 @@ def _apply_three_way_patch(diff: str, expanded_dir_path: Path, allow_untracked_f
                 "Failed to apply the update. Retrying again with a different update strategy.",
                 fg=typer.colors.YELLOW,
             )
-            _apply_patch_with_rejections(diff, expanded_dir_path)
+            return _apply_patch_with_rejections(diff, expanded_dir_path)
+        return False
+    return True
 
 
 def _get_offset(expanded_dir_path: Path):
     try:
         offset = (
-            run(
-                ["git", "rev-parse", "--show-prefix"],
-                stderr=PIPE,
-                stdout=PIPE,
-                check=True,
-                cwd=expanded_dir_path,
-            )
+            utils.gitrunner.run_git("rev-parse", "--show-prefix", check=True, cwd=expanded_dir_path)
             .stdout.decode()
             .strip()
         )
@@ -265,17 +394,36 @@ def _get_offset(expanded_dir_path: Path):
             raise error
 
 
-def _apply_patch(diff: str, expanded_dir_path: Path, allow_untracked_files: bool):
+def _apply_patch(diff: str, expanded_dir_path: Path, allow_untracked_files: bool) -> bool:
     # Git 3 way merge is the our best bet
     # at applying patches. But it only works
     # with git repos. If the repo is not a git dir
     # we fall back to git apply --reject which applies
     # diffs cleanly where applicable otherwise creates
     # *.rej files where there are conflicts
+    # Returns False if the patch could not be applied without conflicts.
     if _is_git_repo(expanded_dir_path):
-        _apply_three_way_patch(diff, expanded_dir_path, allow_untracked_files)
-    else:
-        _apply_patch_with_rejections(diff, expanded_dir_path)
+        return _apply_three_way_patch(diff, expanded_dir_path, allow_untracked_files)
+    return _apply_patch_with_rejections(diff, expanded_dir_path)
+
+
+def _apply_binary_changes(
+    binary_changes: List["utils.binary.BinaryChange"], project_dir: Path
+) -> bool:
+    # Returns False if some binary files were changed in the project as well, which are
+    # then left as they are.
+    conflicts = utils.binary.apply_binary_changes(binary_changes, project_dir)
+    for change in conflicts:
+        typer.secho(
+            f"Binary file {change.path} was changed in the project, keeping its version"
+            f" rather than the one {change.status} by the template.",
+            fg=typer.colors.YELLOW,
+        )
+    applied = [change.path for change in binary_changes if change not in conflicts]
+    if applied and _is_git_repo(project_dir):
+        # Staged like the changes applied by a three-way merge
+        utils.gitrunner.run_git("add", "-A", "--", *applied, stderr=DEVNULL, cwd=project_dir)
+    return not conflicts
 
 
 def _apply_project_updates(
@@ -286,7 +434,15 @@ def _apply_project_updates(
     skip_apply_ask: bool,
     allow_untracked_files: bool,
 ) -> bool:
-    diff = utils.diff.get_diff(old_main_directory, new_main_directory)
+    with span("diff"):
+        # The binary files are brought over as a whole rather than through the patch
+        binary_changes = utils.binary.set_aside_binary_changes(
+            old_main_directory,
+            new_main_directory,
+            new_main_directory.parent / "binary",
+            project_dir,
+        )
+        diff = utils.diff.get_diff(old_main_directory, new_main_directory)
 
     if not skip_apply_ask and not skip_update:
         input_str: str = "v"
@@ -305,7 +461,9 @@ def _apply_project_updates(
             if input_str == "v":
                 if diff.strip():
                     utils.diff.display_diff(old_main_directory, new_main_directory)
-                else:
+                for change in binary_changes:
+                    typer.echo(f"Binary file {change.path} {change.status}")
+                if not diff.strip() and not binary_changes:
                     click.secho("There are no changes.", fg=typer.colors.YELLOW)
         if input_str == "n":
             typer.echo("User cancelled Cookiecutter template update.")
@@ -313,6 +471,10 @@ def _apply_project_updates(
         elif input_str == "s":
             skip_update = True
 
-    if not skip_update and diff.strip():
-        _apply_patch(diff, project_dir, allow_untracked_files)
+    if not skip_update and (diff.strip() or binary_changes):
+        with span("apply"):
+            # The patch first, as a three-way merge requires the index to be clean
+            if diff.strip():
+                _apply_patch(diff, project_dir, allow_untracked_files)
+            _apply_binary_changes(binary_changes, project_dir)
     return True
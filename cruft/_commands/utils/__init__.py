@@ -1,21 +1,73 @@
-from functools import wraps
+import sys
+from importlib import import_module
 
-from . import cookiecutter, cruft, diff, generate, iohelper
+_SUBMODULES = (
+    "binary",
+    "bytecode",
+    "cache",
+    "config",
+    "cookiecutter",
+    "cruft",
+    "daemon",
+    "dependencies",
+    "detect",
+    "diff",
+    "generate",
+    "gitrunner",
+    "hooks",
+    "incremental",
+    "iohelper",
+    "manifest",
+    "memtree",
+    "parallel",
+    "pathspec",
+    "profiling",
+    "resources",
+    "snapshot",
+)
 
-try:
+
+def example(*args, **kwargs):
+    """Attach an example to a command with the optional examples package.
+
+    Importing the package is slow, so the examples are only registered when the package
+    was imported before the commands, as the test suite does. Otherwise this is a no-op."""
+    if "examples" not in sys.modules:
+        return lambda function: function
     from examples import example
-except ImportError:  # pragma: no cover
-    # In case examples is not available,
-    # we introduce a no-op decorator.
-    def example(*_args, **_kwargs):
-        def decorator(f):
-            @wraps(f)
-            def wrapper(*args, **kwargs):
-                return f(*args, **kwargs)
 
-            return wrapper
+    return example(*args, **kwargs)
+
 
-        return decorator
+def __getattr__(name: str):
+    # The helpers are imported on first use, as they depend on GitPython and cookiecutter
+    if name in _SUBMODULES:
+        return import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-__all__ = ["cookiecutter", "cruft", "diff", "example", "generate", "iohelper"]
+__all__ = [
+    "binary",
+    "bytecode",
+    "cache",
+    "config",
+    "cookiecutter",
+    "cruft",
+    "daemon",
+    "dependencies",
+    "detect",
+    "diff",
+    "example",
+    "generate",
+    "gitrunner",
+    "hooks",
+    "incremental",
+    "iohelper",
+    "manifest",
+    "memtree",
+    "parallel",
+    "pathspec",
+    "profiling",
+    "resources",
+    "snapshot",
+]
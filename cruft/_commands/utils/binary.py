@@ -0,0 +1,144 @@
+import filecmp
+import os
+from pathlib import Path
+from shutil import copy2
+from subprocess import DEVNULL  # nosec
+from typing import List, NamedTuple, Optional, Set
+
+from .gitrunner import run_git
+
+# Like git, a file is binary if its first 8000 bytes hold a NUL byte
+_SNIFF_SIZE = 8000
+
+
+class BinaryChange(NamedTuple):
+    """A binary file changed by the template, with its versions in the old and the new
+    renders, None when it doesn't exist in that render."""
+
+    path: str
+    old_file: Optional[Path]
+    new_file: Optional[Path]
+
+    @property
+    def status(self) -> str:
+        if self.old_file is None:
+            return "added"
+        if self.new_file is None:
+            return "deleted"
+        return "modified"
+
+
+def is_binary_file(path: Path) -> bool:
+    with open(path, "rb") as file:
+        return b"\0" in file.read(_SNIFF_SIZE)
+
+
+def get_binary_attributes(project_dir: Path, paths: List[str]) -> Set[str]:
+    """The paths marked as binary, or not to diff, by the `.gitattributes` of the project."""
+    if not paths:
+        return set()
+    result = run_git(
+        "check-attr",
+        "-z",
+        "--stdin",
+        "diff",
+        input="\0".join(paths).encode(),
+        stderr=DEVNULL,
+        cwd=project_dir,
+    )
+    if result.returncode:
+        # Not a git repository
+        return set()
+    fields = result.stdout.decode().split("\0")
+    return {
+        path for path, _, info in zip(fields[::3], fields[1::3], fields[2::3]) if info == "unset"
+    }
+
+
+def set_aside_binary_changes(
+    old_dir: Path, new_dir: Path, aside_dir: Path, project_dir: Path
+) -> List[BinaryChange]:
+    """Move the binary files which differ between the old and the new renders out of them,
+    into aside_dir, so that their content doesn't go through the text patch.
+
+    Both renders are left with the same text files, and `apply_binary_changes` then brings
+    the binary ones to the project."""
+    old_files, new_files = _get_files(old_dir), _get_files(new_dir)
+    changed = sorted(
+        path
+        for path in old_files | new_files
+        if path not in old_files
+        or path not in new_files
+        or not filecmp.cmp(str(old_dir / path), str(new_dir / path), shallow=False)
+    )
+    marked = get_binary_attributes(project_dir, changed)
+
+    changes = []
+    for path in changed:
+        if path not in marked and not any(
+            path in files and is_binary_file(directory / path)
+            for directory, files in ((old_dir, old_files), (new_dir, new_files))
+        ):
+            continue
+        old_file = _move(old_dir, aside_dir / "old", path) if path in old_files else None
+        new_file = _move(new_dir, aside_dir / "new", path) if path in new_files else None
+        changes.append(BinaryChange(path, old_file, new_file))
+    return changes
+
+
+def apply_binary_changes(changes: List[BinaryChange], project_dir: Path) -> List[BinaryChange]:
+    """Bring the binary files changed by the template to the project, when the project
+    still holds their old version, and return the ones it changed as well.
+
+    The files are copied from the new render rather than linked, as renders may share their
+    files with the cache of renders."""
+    conflicts = []
+    for change in changes:
+        project_file = project_dir / change.path
+        if _matches(project_file, change.new_file):
+            continue
+        if not _matches(project_file, change.old_file):
+            conflicts.append(change)
+        elif change.new_file is None:
+            _remove_file(project_dir, project_file)
+        else:
+            project_file.parent.mkdir(parents=True, exist_ok=True)
+            if project_file.exists():
+                project_file.unlink()
+            copy2(str(change.new_file), str(project_file))
+    return conflicts
+
+
+def _get_files(directory: Path) -> Set[str]:
+    # Links are left to the text patch, which holds their target
+    return {
+        Path(root, name).relative_to(directory).as_posix()
+        for root, _, names in os.walk(directory)
+        for name in names
+        if not os.path.islink(os.path.join(root, name))
+    }
+
+
+def _move(directory: Path, aside_dir: Path, relative_path: str) -> Path:
+    destination = aside_dir / relative_path
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(str(directory / relative_path), str(destination))
+    return destination
+
+
+def _matches(project_file: Path, render_file: Optional[Path]) -> bool:
+    if render_file is None:
+        return not os.path.lexists(project_file)
+    return (
+        project_file.is_file()
+        and not project_file.is_symlink()
+        and filecmp.cmp(str(project_file), str(render_file), shallow=False)
+    )
+
+
+def _remove_file(project_dir: Path, path: Path):
+    path.unlink()
+    parent = path.parent
+    while parent != project_dir and not any(parent.iterdir()):
+        parent.rmdir()
+        parent = parent.parent
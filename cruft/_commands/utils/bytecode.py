@@ -0,0 +1,211 @@
+import os
+import sys
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from hashlib import sha256
+from pathlib import Path
+from threading import Lock
+from types import CodeType
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import jinja2
+from cookiecutter.environment import StrictEnvironment
+from jinja2.bccache import Bucket
+
+from .cache import get_cache_dir, get_cache_size, store_entry, use_entry
+from .config import get_setting
+from .iohelper import patching, writing_aside
+
+_MEMORY_SIZE = 1024
+_memory: "OrderedDict[str, CodeType]" = OrderedDict()
+_memory_lock = Lock()
+_module_hashes: Dict[Tuple[str, int, int], str] = {}
+# Code objects keep the file they were compiled from, which changes with every checkout
+_RELOCATABLE = hasattr(CodeType, "replace")
+
+
+def get_bytecode_dir() -> Path:
+    return get_cache_dir() / "bytecode"
+
+
+def is_bytecode_cache_enabled() -> bool:
+    """Whether compiled templates are cached, unless CRUFT_BYTECODE_CACHE is set to 0."""
+    setting = get_setting("bytecode_cache", "CRUFT_BYTECODE_CACHE")
+    return (setting or "1").lower() not in ("0", "false", "no", "off")
+
+
+class CachingEnvironment(StrictEnvironment):
+    """The environment of cookiecutter, compiling each template source only once.
+
+    The code compiled for a template is stored in memory and in the cache directory of
+    cruft, under the hash of its source, its name and everything the compilation depends
+    on: the versions of Python and Jinja, the settings of the environment, and its
+    extensions, filters and tests. Unchanged template files and path names are thus only
+    compiled by the first render using them, across the renders of a command and across
+    commands."""
+
+    _settings_key: Optional[str] = None
+
+    def compile(  # type: ignore
+        self,
+        source: Any,
+        name: Optional[str] = None,
+        filename: Optional[str] = None,
+        raw: bool = False,
+        defer_init: bool = False,
+    ) -> Any:
+        settings_key = self._get_settings_key()
+        if (
+            raw
+            or not isinstance(source, str)
+            or settings_key is None
+            or (filename is not None and not _RELOCATABLE)
+        ):
+            return super().compile(source, name, filename, raw, defer_init)
+
+        key = sha256(
+            "\0".join([settings_key, repr(name), str(defer_init), source]).encode()
+        ).hexdigest()
+        code = _load(self, key)
+        if code is None:
+            code = super().compile(source, name, filename, raw, defer_init)
+            _store(self, key, code)
+        elif filename is not None and code.co_filename != filename:
+            code = _relocate(code, filename)
+        return code
+
+    def _get_settings_key(self) -> Optional[str]:
+        # Computed once, as the extensions are all loaded when the environment is created
+        if self._settings_key is None and not callable(self.autoescape):
+            self._settings_key = get_environment_key(self)
+        return self._settings_key
+
+
+def get_environment_key(environment: jinja2.Environment) -> str:
+    """A hash of everything the code compiled by an environment depends on, but the sources."""
+    parts = [
+        jinja2.__version__,
+        sys.version,
+        environment.block_start_string,
+        environment.block_end_string,
+        environment.variable_start_string,
+        environment.variable_end_string,
+        environment.comment_start_string,
+        environment.comment_end_string,
+        str(environment.line_statement_prefix),
+        str(environment.line_comment_prefix),
+        str(environment.trim_blocks),
+        str(environment.lstrip_blocks),
+        environment.newline_sequence,
+        str(environment.keep_trailing_newline),
+        str(environment.optimized),
+        str(environment.autoescape),
+        str(environment.is_async),
+        _get_qualified_name(environment.code_generator_class),
+    ]
+    for extension in sorted(environment.extensions):
+        extension_class = type(environment.extensions[extension])
+        parts.extend([extension, _get_module_hash(extension_class.__module__)])
+    # Calls to filters and tests are compiled differently depending on what they are passed
+    for kind, functions in (("filter", environment.filters), ("test", environment.tests)):
+        for function_name in sorted(functions):
+            function = functions[function_name]
+            parts.extend(
+                [
+                    kind,
+                    function_name,
+                    _get_qualified_name(function),
+                    str(getattr(function, "jinja_pass_arg", None)),
+                ]
+            )
+    return sha256("\0".join(parts).encode()).hexdigest()
+
+
+def _get_qualified_name(value: Any) -> str:
+    return f"{getattr(value, '__module__', '')}.{getattr(value, '__qualname__', repr(value))}"
+
+
+def _get_module_hash(module_name: str) -> str:
+    # The source of the extension rather than its version, as the local extensions of
+    # templates have none and change along with them
+    module_file = getattr(sys.modules.get(module_name), "__file__", None)
+    if not module_file:
+        return module_name
+    try:
+        module_stat = os.stat(module_file)
+    except OSError:
+        return module_name
+    stat_key = (module_file, module_stat.st_mtime_ns, module_stat.st_size)
+    if stat_key not in _module_hashes:
+        _module_hashes[stat_key] = sha256(Path(module_file).read_bytes()).hexdigest()
+    return _module_hashes[stat_key]
+
+
+def _load(environment: jinja2.Environment, key: str) -> Optional[CodeType]:
+    with _memory_lock:
+        code = _memory.get(key)
+        if code is not None:
+            _memory.move_to_end(key)
+            return code
+    if not get_cache_size():
+        return None
+    bucket = Bucket(environment, key, "")
+    bytecode_file = get_bytecode_dir() / key
+    try:
+        bucket.bytecode_from_string(bytecode_file.read_bytes())
+    except OSError:
+        return None
+    if bucket.code is not None:
+        use_entry(bytecode_file)
+        _remember(key, bucket.code)
+    return bucket.code
+
+
+def _store(environment: jinja2.Environment, key: str, code: CodeType):
+    _remember(key, code)
+    if not get_cache_size():
+        return
+    bucket = Bucket(environment, key, "")
+    bucket.code = code
+    bytecode_file = get_bytecode_dir() / key
+    try:
+        with writing_aside(bytecode_file) as partial_file:
+            partial_file.write_bytes(bucket.bytecode_to_string())
+        store_entry(bytecode_file)
+    except OSError:
+        # The cache is only an optimization, the next render will compile the source again
+        pass
+
+
+def _remember(key: str, code: CodeType):
+    with _memory_lock:
+        _memory[key] = code
+        while len(_memory) > _MEMORY_SIZE:
+            _memory.popitem(last=False)
+
+
+def _relocate(code: CodeType, filename: str) -> CodeType:
+    constants = tuple(
+        _relocate(constant, filename) if isinstance(constant, CodeType) else constant
+        for constant in code.co_consts
+    )
+    return code.replace(co_filename=filename, co_consts=constants)  # type: ignore
+
+
+@contextmanager
+def caching_templates() -> Iterator[None]:
+    """Have cookiecutter compile templates in the block with a `CachingEnvironment`."""
+    if not is_bytecode_cache_enabled():
+        yield
+        return
+
+    from cookiecutter import generate, hooks, prompt, utils
+
+    with ExitStack() as stack:
+        # Older versions of cookiecutter create their environments in several modules
+        for module in (utils, generate, hooks, prompt):
+            if getattr(module, "StrictEnvironment", None) is StrictEnvironment:
+                stack.enter_context(
+                    patching(module, "StrictEnvironment", lambda _: CachingEnvironment)
+                )
+        yield
@@ -0,0 +1,197 @@
+import json
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from copy import deepcopy
+from hashlib import sha256
+from pathlib import Path
+from shutil import copy2, copytree, rmtree
+from threading import Lock
+from time import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .config import get_setting
+from .gitrunner import Repo
+
+RenderKey = Tuple[str, str, str, str]
+CookiecutterContext = Dict[str, Any]
+
+DEFAULT_CACHE_SIZE = 256
+# Entries used more recently are never pruned, as other processes may be reading them
+_MIN_AGE = 60
+
+_active_cache: Optional["TemplateCache"] = None
+# The bytes stored in each cache directory by this process since it last pruned it
+_stored: Dict[Path, int] = {}
+_stored_lock = Lock()
+
+
+class TemplateCache:
+    """Template mirrors and renders kept warm by a long running cruft process.
+
+    Mirrors are bare clones kept in `cache_dir` and fetched before every use, so that
+    later clones of a template are local. Renders are kept in memory, keyed by the
+    template, its commit and the variables they were rendered with, along with anything
+    else changing the render, such as the hook policy, so that a template revision is only
+    rendered once per context."""
+
+    def __init__(self, cache_dir: Path, renders_dir: Path, max_renders: int = 64):
+        self.cache_dir = cache_dir
+        self.renders_dir = renders_dir
+        self.max_renders = max_renders
+        self._lock = Lock()
+        self._mirror_locks: Dict[str, Lock] = {}
+        self._renders: "OrderedDict[Tuple[str, ...], Tuple[Path, CookiecutterContext]]" = (
+            OrderedDict()
+        )
+
+    def mirror(self, template_git_url: str) -> str:
+        """Return the path of an up to date mirror of the template repository."""
+        digest = sha256(template_git_url.encode()).hexdigest()[:16]
+        mirror_dir = self.cache_dir / "mirrors" / digest
+        with self._lock:
+            mirror_lock = self._mirror_locks.setdefault(digest, Lock())
+        with mirror_lock:
+            if mirror_dir.is_dir():
+                with Repo(mirror_dir) as mirror:
+                    mirror.git.remote("update", "--prune")
+            else:
+                Repo.clone_from(template_git_url, mirror_dir, mirror=True).close()
+        return str(mirror_dir)
+
+    def get_render(self, key: Tuple[str, ...], output_dir: Path) -> Optional[CookiecutterContext]:
+        """Copy a cached render into output_dir and return its context, if there is one."""
+        with self._lock:
+            render = self._renders.get(key)
+            if render is None:
+                return None
+            self._renders.move_to_end(key)
+            render_dir, context = render
+            _copy_into(render_dir, output_dir)
+        return deepcopy(context)
+
+    def add_render(self, key: Tuple[str, ...], output_dir: Path, context: CookiecutterContext):
+        """Keep a copy of the render generated in output_dir."""
+        render_dir = self.renders_dir / sha256(json.dumps(key).encode()).hexdigest()
+        with self._lock:
+            if key in self._renders:
+                return
+            copytree(str(output_dir), str(render_dir), symlinks=True)
+            self._renders[key] = (render_dir, deepcopy(context))
+            while len(self._renders) > self.max_renders:
+                _, (evicted_dir, _) = self._renders.popitem(last=False)
+                rmtree(evicted_dir, ignore_errors=True)
+
+
+def _copy_into(source_dir: Path, destination_dir: Path):
+    destination_dir.mkdir(parents=True, exist_ok=True)
+    for source in source_dir.iterdir():
+        if source.is_dir() and not source.is_symlink():
+            copytree(str(source), str(destination_dir / source.name), symlinks=True)
+        else:
+            copy2(str(source), str(destination_dir / source.name), follow_symlinks=False)
+
+
+def get_render_key(cruft_state: Dict, commit: str, extra_context: Dict) -> RenderKey:
+    context_json = json.dumps(extra_context, sort_keys=True, default=str)
+    return (
+        cruft_state["template"],
+        cruft_state.get("directory") or "",
+        commit,
+        sha256(context_json.encode()).hexdigest(),
+    )
+
+
+def get_cache_dir() -> Path:
+    """The directory holding the template mirrors, which can be set with CRUFT_CACHE_DIR."""
+    if os.environ.get("CRUFT_CACHE_DIR"):
+        return Path(os.environ["CRUFT_CACHE_DIR"])
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "cruft"
+
+
+def get_cache_size() -> int:
+    """The bytes each cache of cruft on disk is kept under: the compiled templates, the
+    template indexes and the changes made by hooks. Set in megabytes with CRUFT_CACHE_SIZE
+    or `cache_size` in the configuration file, 0 turning these caches off."""
+    size = get_setting("cache_size", "CRUFT_CACHE_SIZE")
+    return max(int(float(size) * 2**20), 0) if size else DEFAULT_CACHE_SIZE * 2**20
+
+
+def use_entry(path: Path):
+    """Mark an entry of a cache directory as just used, so that it is pruned last."""
+    try:
+        os.utime(str(path))
+    except OSError:
+        pass
+
+
+def store_entry(path: Path):
+    """Account for an entry just stored in a cache directory. The first entry a process
+    stores, and then every eighth of `get_cache_size` stored, prunes the directory, see
+    `prune_cache`."""
+    directory, max_size, size = path.parent, get_cache_size(), _get_size(path)
+    with _stored_lock:
+        stored = _stored.get(directory)
+        if stored is not None and stored + size < max_size // 8:
+            _stored[directory] = stored + size
+            return
+        _stored[directory] = 0
+    prune_cache(directory, max_size)
+
+
+def prune_cache(directory: Path, max_size: int):
+    """Delete the least recently used entries of a cache directory, by modification time,
+    until it holds at most max_size bytes, or only entries used in the last minute."""
+    entries = []
+    try:
+        with os.scandir(str(directory)) as scan:
+            for entry in scan:
+                try:
+                    entries.append((entry.stat(follow_symlinks=False).st_mtime, entry.path))
+                except OSError:
+                    continue
+    except OSError:
+        return
+    sizes = {path: _get_size(Path(path)) for _, path in entries}
+    total = sum(sizes.values())
+    recent = time() - _MIN_AGE
+    for modified, path in sorted(entries):
+        if total <= max_size or modified > recent:
+            break
+        if os.path.isdir(path) and not os.path.islink(path):
+            rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+        total -= sizes[path]
+
+
+def _get_size(path: Path) -> int:
+    try:
+        if not path.is_dir() or path.is_symlink():
+            return path.lstat().st_size
+        return sum(
+            os.lstat(os.path.join(root, name)).st_size
+            for root, _, names in os.walk(str(path))
+            for name in names
+        )
+    except OSError:
+        return 0
+
+
+def active_cache() -> Optional[TemplateCache]:
+    """The cache used by the commands, only set while serving them from a daemon."""
+    return _active_cache
+
+
+@contextmanager
+def using_cache(cache: TemplateCache) -> Iterator[TemplateCache]:
+    global _active_cache
+    previous, _active_cache = _active_cache, cache
+    try:
+        yield cache
+    finally:
+        _active_cache = previous
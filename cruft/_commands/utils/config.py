@@ -0,0 +1,81 @@
+import json
+import os
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from threading import local
+from typing import Any, Dict, Iterator, Optional
+
+from cruft.exceptions import InvalidConfigFile
+
+# The settings of cruft, by name in the configuration file and environment variable
+SETTINGS = {
+    "bytecode_cache": "CRUFT_BYTECODE_CACHE",
+    "cache_size": "CRUFT_CACHE_SIZE",
+    "git_max_processes": "CRUFT_GIT_MAX_PROCESSES",
+    "git_timeout": "CRUFT_GIT_TIMEOUT",
+    "hooks": "CRUFT_HOOKS",
+    "memory_renders": "CRUFT_MEMORY_RENDERS",
+    "render_workers": "CRUFT_RENDER_WORKERS",
+    "scratch_dir": "CRUFT_SCRATCH_DIR",
+    "scratch_pool_size": "CRUFT_SCRATCH_POOL_SIZE",
+}
+
+_thread_settings = local()
+
+
+def get_config_file() -> Path:
+    """The configuration file of cruft, which can be set with CRUFT_CONFIG."""
+    if os.environ.get("CRUFT_CONFIG"):
+        return Path(os.environ["CRUFT_CONFIG"])
+    config_home = os.environ.get("XDG_CONFIG_HOME") or Path.home() / ".config"
+    return Path(config_home) / "cruft" / "config.json"
+
+
+def get_setting(name: str, environment_variable: str) -> Optional[str]:
+    """A setting from its environment variable, or else from the configuration file, unless
+    the current thread uses settings of its own, see `using_settings`."""
+    settings = getattr(_thread_settings, "settings", None)
+    if settings is not None and name in settings:
+        return settings[name]
+    value = os.environ.get(environment_variable)
+    if value:
+        return value
+    config_file = get_config_file()
+    try:
+        config_stat = config_file.stat()
+    except OSError:
+        return None
+    value = _read_config(str(config_file), config_stat.st_mtime_ns, config_stat.st_size).get(name)
+    return None if value is None else str(value)
+
+
+def get_settings() -> Dict[str, Optional[str]]:
+    """The value of every setting of `SETTINGS`."""
+    return {name: get_setting(name, variable) for name, variable in SETTINGS.items()}
+
+
+@contextmanager
+def using_settings(settings: Dict[str, Optional[str]]) -> Iterator[None]:
+    """Use the given values of the settings in the current thread for the duration of the
+    block, instead of the environment and configuration file of the process, None unsetting
+    them. This lets the daemon run each request with the settings of its client, see
+    `get_settings`."""
+    previous = getattr(_thread_settings, "settings", None)
+    _thread_settings.settings = dict(previous or {}, **settings)
+    try:
+        yield
+    finally:
+        _thread_settings.settings = previous
+
+
+@lru_cache(maxsize=8)
+def _read_config(config_file: str, modified: int, size: int) -> Dict[str, Any]:
+    # Read again whenever the file is modified, which matters to a long running daemon
+    try:
+        config = json.loads(Path(config_file).read_text())
+    except ValueError as error:
+        raise InvalidConfigFile(config_file, str(error))
+    if not isinstance(config, dict):
+        raise InvalidConfigFile(config_file, "Expected a JSON object.")
+    return config
@@ -4,12 +4,16 @@ from typing import Any, Dict, Optional
 from urllib.parse import urlparse
 
 from cookiecutter.config import get_user_config
-from cookiecutter.generate import generate_context
+from cookiecutter.generate import apply_overwrites_to_context, generate_context
 from cookiecutter.prompt import prompt_for_config
-from git import GitCommandError, Repo
+from git import BadName, GitCommandError
 
 from cruft.exceptions import InvalidCookiecutterRepository, UnableToFindCookiecutterTemplate
 
+from .cache import active_cache
+from .gitrunner import Repo
+from .iohelper import absolute_path, rendering
+
 CookiecutterContext = Dict[str, Any]
 
 
@@ -26,7 +30,7 @@ def resolve_template_url(url: str) -> str:
     # work properly in case the generated project directory
     # does not reside in the same relative path.
     if not parsed_url.scheme or parsed_url.scheme == "file":
-        file_path = (Path(parsed_url.netloc) / Path(parsed_url.path)).absolute()
+        file_path = absolute_path(Path(parsed_url.netloc) / Path(parsed_url.path))
         # Below is to handle cases like "git@github.com"
         # which passes through to this block, but will obviously not
         # exist in the file system.
@@ -45,7 +49,15 @@ def get_cookiecutter_repo(
     **clone_kwargs,
 ) -> Repo:
     try:
-        repo = Repo.clone_from(template_git_url, cookiecutter_template_dir, **clone_kwargs)
+        cache = active_cache()
+        if cache is None:
+            repo = Repo.clone_from(template_git_url, cookiecutter_template_dir, **clone_kwargs)
+        else:
+            # Local clones share the objects of the mirror, there is nothing to filter
+            clone_kwargs.pop("filter", None)
+            repo = Repo.clone_from(
+                cache.mirror(template_git_url), cookiecutter_template_dir, **clone_kwargs
+            )
     except GitCommandError as error:
         raise InvalidCookiecutterRepository(
             template_git_url, f"Failed to clone the repo. {error.stderr.strip()}"
@@ -62,6 +74,28 @@ def get_cookiecutter_repo(
     return repo
 
 
+def get_commit(repo: Repo, revision: str, template_git_url: str) -> str:
+    """The hash of the commit a revision of the template repository points to."""
+    try:
+        return repo.commit(revision).hexsha
+    except (BadName, GitCommandError, ValueError) as error:
+        raise InvalidCookiecutterRepository(
+            template_git_url, f"Unknown revision {revision}. {error}"
+        )
+
+
+def read_cookiecutter_json(
+    repo: Repo, commit: str, directory: Optional[str] = None
+) -> Dict[str, Any]:
+    """The content of the cookiecutter.json of the template at a commit, without checking it
+    out, an empty dict when it has none."""
+    path = f"{directory.strip('/')}/cookiecutter.json" if directory else "cookiecutter.json"
+    try:
+        return json.loads(repo.git.show(f"{commit}:{path}"))
+    except (GitCommandError, ValueError):
+        return {}
+
+
 def _validate_cookiecutter(cookiecutter_template_dir: Path):
     main_cookiecutter_directory: Optional[Path] = None
 
@@ -83,6 +117,20 @@ def generate_cookiecutter_context(
     extra_context: Optional[Dict[str, Any]] = None,
     no_input: bool = False,
 ) -> CookiecutterContext:
+    context = load_cookiecutter_context(cookiecutter_template_dir, config_file, default_config)
+    # Rendering the variables may use the local extensions of the template
+    with rendering(cookiecutter_template_dir):
+        return prompt_cookiecutter_context(
+            context, template_git_url, last_commit, extra_context, no_input
+        )
+
+
+def load_cookiecutter_context(
+    cookiecutter_template_dir: Path,
+    config_file: Optional[Path] = None,
+    default_config: bool = False,
+) -> CookiecutterContext:
+    """Load the template's cookiecutter.json, with the defaults from the user config applied."""
     _validate_cookiecutter(cookiecutter_template_dir)
 
     context_file = cookiecutter_template_dir / "cookiecutter.json"
@@ -90,12 +138,24 @@ def generate_cookiecutter_context(
         config_file=str(config_file) if config_file else None, default_config=default_config
     )
 
-    context = generate_context(
-        context_file=context_file,
-        default_context=config_dict["default_context"],
-        extra_context=extra_context,
+    return generate_context(
+        context_file=context_file, default_context=config_dict["default_context"]
     )
 
+
+def prompt_cookiecutter_context(
+    context: CookiecutterContext,
+    template_git_url: str,
+    last_commit: str,
+    extra_context: Optional[Dict[str, Any]] = None,
+    no_input: bool = False,
+) -> CookiecutterContext:
+    """Apply the extra context to a loaded context and resolve the final template variables.
+
+    The given context is modified in place."""
+    if extra_context:
+        apply_overwrites_to_context(context["cookiecutter"], extra_context)
+
     # prompt the user to manually configure at the command line.
     # except when 'no-input' flag is set
     context["cookiecutter"] = prompt_for_config(context, no_input)
@@ -36,6 +36,15 @@ def is_project_updated(repo: Repo, current_commit: str, latest_commit: str, stri
     )
 
 
+def get_extra_context(cruft_state: CruftState) -> Dict[str, Any]:
+    # Don't pass entries prefixed by "_" = cookiecutter extensions, not direct user intent
+    return {
+        key: value
+        for key, value in cruft_state["context"]["cookiecutter"].items()
+        if not key.startswith("_")
+    }
+
+
 def json_dumps(cruft_state: Dict[str, Any]) -> str:
     text = json.dumps(cruft_state, ensure_ascii=False, indent=2, separators=(",", ": "))
     return text + "\n"
@@ -0,0 +1,89 @@
+import getpass
+import json
+import os
+import socket
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional
+
+from cruft._version import __version__
+
+from .config import get_settings
+
+# Paths are sent as strings, and converted back by the daemon
+PATH_ARGUMENTS = ("project_dir", "template_path", "extra_context_file")
+
+
+class DaemonResponse(NamedTuple):
+    exit_code: int
+    output: str
+    error: Optional[str] = None
+    # What the command wrote to the standard error
+    error_output: str = ""
+
+
+def get_socket_path() -> Path:
+    """The socket of the `cruft serve` daemon, which can be set with CRUFT_SOCKET. The
+    commands only find a daemon listening on another socket through CRUFT_SOCKET."""
+    if os.environ.get("CRUFT_SOCKET"):
+        return Path(os.environ["CRUFT_SOCKET"])
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return Path(runtime_dir) / f"cruft-{getpass.getuser()}.sock"
+
+
+def connect(socket_path: Optional[Path] = None) -> Optional[socket.socket]:
+    """Connect to the daemon, or return None if it is not running."""
+    if not hasattr(socket, "AF_UNIX"):  # pragma: no cov_4_nix
+        return None
+    socket_path = socket_path or get_socket_path()
+    if not socket_path.exists():
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(str(socket_path))
+    except OSError:
+        connection.close()
+        return None
+    return connection
+
+
+def call(command: str, **arguments: Any) -> Optional[DaemonResponse]:
+    """Run a command in the `cruft serve` daemon, with the settings of this process, see
+    `config.get_settings`.
+
+    Returns None when the command has to be run in process instead: when the daemon is not
+    running, runs another version of cruft, or CRUFT_NO_DAEMON is set."""
+    if os.environ.get("CRUFT_NO_DAEMON"):
+        return None
+    connection = connect()
+    if connection is None:
+        return None
+    for name in PATH_ARGUMENTS:
+        if arguments.get(name) is not None:
+            arguments[name] = str(Path(arguments[name]).absolute())
+    with connection:
+        response = send(
+            connection,
+            {
+                "version": __version__,
+                "command": command,
+                "arguments": arguments,
+                "settings": get_settings(),
+            },
+        )
+    if response is None or response.get("version") != __version__:
+        return None
+    return DaemonResponse(
+        response["exit_code"],
+        response["output"],
+        response.get("error"),
+        response.get("error_output") or "",
+    )
+
+
+def send(connection: socket.socket, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Send a message to the other end of the connection and wait for its reply."""
+    connection.sendall(json.dumps(message).encode() + b"\n")
+    with connection.makefile("rb") as reader:
+        reply = reader.readline()
+    return json.loads(reply) if reply else None
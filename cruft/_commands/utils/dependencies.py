@@ -0,0 +1,245 @@
+import json
+import os
+import posixpath
+from hashlib import sha256
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from git import Repo
+from jinja2 import Environment, TemplateSyntaxError, meta, nodes
+
+from .bytecode import get_environment_key
+from .cache import get_cache_dir, get_cache_size, store_entry, use_entry
+from .iohelper import writing_aside
+
+_VERSION = 1
+_CONTEXT = "cookiecutter"
+# Looked up as attributes before the variables, as Jinja does for `cookiecutter.items`
+_DICT_ATTRIBUTES = frozenset(dir(dict))
+_CONTEXT_REFERENCES = (
+    nodes.ContextReference,
+    getattr(nodes, "DerivedContextReference", nodes.ContextReference),
+)
+
+
+class FileDependencies(NamedTuple):
+    """What the render of a template file depends on, None when it may depend on anything.
+
+    `variables` are the variables of the context used by its content, `includes` the
+    templates it includes, imports or extends, and `path_variables` the variables used by
+    its path."""
+
+    variables: Optional[List[str]]
+    includes: Optional[List[str]]
+    path_variables: Optional[List[str]]
+
+
+class TemplateIndex(NamedTuple):
+    """The dependencies of the files of a template at a commit, by path relative to the
+    directory of the project template, and of the templates shared in `templates`."""
+
+    files: Dict[str, FileDependencies]
+    templates: Dict[str, FileDependencies]
+
+
+def get_index_dir() -> Path:
+    return get_cache_dir() / "index"
+
+
+def get_template_index(
+    repo: Repo, commit: str, inner_dir: Path, template_dir: Path, environment: Environment
+) -> TemplateIndex:
+    """The index of the template checked out at `commit`, built once per template tree and
+    kept in the cache directory of cruft."""
+    tree = repo.commit(commit).tree
+    directory = inner_dir.relative_to(Path(repo.working_dir or "")).as_posix()
+    if directory != ".":
+        tree = tree / directory
+    key = sha256(
+        "\0".join([str(_VERSION), tree.hexsha, get_environment_key(environment)]).encode()
+    ).hexdigest()
+    index_file = get_index_dir() / f"{key}.json"
+    cached = get_cache_size() > 0
+    try:
+        content = json.loads(index_file.read_text()) if cached else {}
+        index = TemplateIndex(
+            *(
+                {path: FileDependencies(*entry) for path, entry in content[part].items()}
+                for part in TemplateIndex._fields
+            )
+        )
+        use_entry(index_file)
+        return index
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    index = build_template_index(inner_dir, template_dir, environment)
+    if not cached:
+        return index
+    try:
+        with writing_aside(index_file) as partial_file:
+            partial_file.write_text(json.dumps(index._asdict()))
+        store_entry(index_file)
+    except OSError:
+        pass
+    return index
+
+
+def build_template_index(
+    inner_dir: Path, template_dir: Path, environment: Environment
+) -> TemplateIndex:
+    files = {}
+    path_variables: Dict[str, Optional[Set[str]]] = {".": set()}
+    for root, dirs, names in os.walk(template_dir):
+        directory = Path(root).relative_to(template_dir).as_posix()
+        for name in dirs:
+            # A link to a directory is generated as a directory, and not walked through
+            path = posixpath.normpath(posixpath.join(directory, name))
+            path_variables[path] = _union(
+                path_variables[directory], _get_path_variables(name, environment)
+            )
+        for name in names:
+            path = posixpath.normpath(posixpath.join(directory, name))
+            variables, includes = get_dependencies(_read_source(Path(root, name)), environment)
+            files[path] = FileDependencies(
+                _sorted(variables),
+                _sorted(includes),
+                _sorted(_union(path_variables[directory], _get_path_variables(name, environment))),
+            )
+
+    templates = {}
+    # The templates cookiecutter also looks up in `../templates`, which aren't rendered
+    for root, _, names in os.walk(inner_dir / "templates"):
+        for name in names:
+            path = Path(root, name)
+            variables, includes = get_dependencies(_read_source(path), environment)
+            templates[path.relative_to(inner_dir / "templates").as_posix()] = FileDependencies(
+                _sorted(variables), _sorted(includes), []
+            )
+    return TemplateIndex(files, templates)
+
+
+def get_dependencies(
+    source: Optional[str], environment: Environment
+) -> Tuple[Optional[Set[str]], Optional[Set[str]]]:
+    """The variables of the context a template source uses, and the templates it includes.
+
+    Either is None when it cannot be known: when the source uses the context as a whole, or
+    through computed names such as `cookiecutter[name]`, calls functions given the context,
+    or includes templates by computed names."""
+    if source is None or not any(
+        start in source
+        for start in (environment.block_start_string, environment.variable_start_string)
+    ):
+        return set(), set()
+    try:
+        ast = environment.parse(source)
+    except TemplateSyntaxError:
+        return None, None
+
+    variables: Optional[Set[str]] = set()
+    if not _find_variables(ast, variables, environment):  # type: ignore
+        variables = None
+    includes: Optional[Set[str]] = set()
+    for name in meta.find_referenced_templates(ast):
+        if name is None:
+            includes = None
+            break
+        includes.add(posixpath.normpath(name))  # type: ignore
+    return variables, includes
+
+
+def get_affected_files(
+    index: TemplateIndex,
+    changed_files: Set[str],
+    changed_variables: Set[str],
+    copied_files: Set[str],
+) -> Set[str]:
+    """The files of the template whose render changes with the given files and variables,
+    including the ones including these files or the macros they define, directly or not.
+    The files copied without being rendered only change with their own content."""
+    # The templates are looked up by the same names as the files, either may be included
+    graph: Dict[str, Tuple[Optional[List[str]], Optional[List[str]]]] = {}
+    for entries in (index.templates, index.files):
+        for path, entry in entries.items():
+            variables, includes = entry.variables, entry.includes
+            if entries is index.files and path in copied_files:
+                variables, includes = [], []
+            if path in graph:
+                variables = _merge(graph[path][0], variables)
+                includes = _merge(graph[path][1], includes)
+            graph[path] = (variables, includes)
+
+    affected = set(changed_files)
+    for path, (variables, _) in graph.items():
+        if variables is None or changed_variables.intersection(variables):
+            affected.add(path)
+    updated = True
+    while updated:
+        updated = False
+        for path, (_, includes) in graph.items():
+            if path not in affected and (includes is None or affected.intersection(includes)):
+                affected.add(path)
+                updated = True
+    return affected
+
+
+def _find_variables(node: nodes.Node, variables: Set[str], environment: Environment) -> bool:
+    # False when the node may use any variable
+    if isinstance(node, nodes.Getattr) and _is_context(node.node):
+        if node.attr in _DICT_ATTRIBUTES:
+            return False
+        variables.add(node.attr)
+        return True
+    if isinstance(node, nodes.Getitem) and _is_context(node.node):
+        if not isinstance(node.arg, nodes.Const) or not isinstance(node.arg.value, str):
+            return False
+        variables.add(node.arg.value)
+        return True
+    if _is_context(node) or isinstance(node, _CONTEXT_REFERENCES):
+        return False
+    if isinstance(node, (nodes.Filter, nodes.Test)):
+        functions = environment.filters if isinstance(node, nodes.Filter) else environment.tests
+        if _is_given_context(functions.get(node.name)):
+            return False
+    if isinstance(node, nodes.Call) and isinstance(node.node, nodes.Name):
+        if _is_given_context(environment.globals.get(node.node.name)):
+            return False
+    return all(_find_variables(child, variables, environment) for child in node.iter_child_nodes())
+
+
+def _is_context(node: nodes.Node) -> bool:
+    return isinstance(node, nodes.Name) and node.name == _CONTEXT and node.ctx == "load"
+
+
+def _is_given_context(function: Any) -> bool:
+    pass_arg = getattr(function, "jinja_pass_arg", None)
+    # Jinja 2 flagged these functions with attributes instead
+    return getattr(pass_arg, "name", None) == "context" or any(
+        getattr(function, flag, False) for flag in ("contextfilter", "contextfunction")
+    )
+
+
+def _get_path_variables(name: str, environment: Environment) -> Optional[Set[str]]:
+    variables, _ = get_dependencies(name, environment)
+    return variables
+
+
+def _read_source(path: Path) -> Optional[str]:
+    try:
+        return path.read_text(encoding="utf-8")
+    except (UnicodeDecodeError, OSError):
+        # Binary files are copied without being rendered
+        return None
+
+
+def _union(first: Optional[Set[str]], second: Optional[Set[str]]) -> Optional[Set[str]]:
+    return None if first is None or second is None else first | second
+
+
+def _merge(first: Optional[List[str]], second: Optional[List[str]]) -> Optional[List[str]]:
+    return None if first is None or second is None else first + second
+
+
+def _sorted(values: Optional[Set[str]]) -> Optional[List[str]]:
+    return None if values is None else sorted(values)
@@ -0,0 +1,129 @@
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, FrozenSet, List, NamedTuple, Optional
+
+from git import Repo
+
+from .cookiecutter import CookiecutterContext
+from .cruft import CruftState
+from .generate import remove_unwanted_paths, render_template
+from .iohelper import AltTemporaryDirectory
+from .manifest import get_file_hash, get_manifest
+from .profiling import span
+
+
+class Candidate(NamedTuple):
+    """A commit of the template, scored by how well its render matches the project."""
+
+    commit: str
+    score: float
+    context: CookiecutterContext
+
+
+class Detection(NamedTuple):
+    """The candidates of a commit detection, best first, with the renders it took."""
+
+    candidates: List[Candidate]
+    commits: int
+    renders: int
+    duration: float
+
+
+def get_candidate_commits(repo: Repo, commit: str, directory: Optional[str] = None) -> List[str]:
+    """The commits of the template up to `commit`, oldest first, which may change its render:
+    the commits changing its directory, and `commit` itself."""
+    output = repo.git.rev_list("--first-parent", "--reverse", commit, "--", directory or ".")
+    commits = output.split()
+    head = repo.commit(commit).hexsha
+    if head not in commits:
+        commits.append(head)
+    return commits
+
+
+def detect_commit(
+    repo: Repo, cruft_state: CruftState, project_dir: Path, max_renders: int = 16
+) -> Detection:
+    """Find the commits of the template whose render best matches the project.
+
+    The history is sampled evenly first, then bisected around the best commit found so
+    far, so that at most `max_renders` renders are made. Between equal scores, the most
+    recent commit wins, as it brings the fewest changes on the next update."""
+    if max_renders < 1:
+        raise ValueError(f"max_renders must be at least 1, not {max_renders}")
+    start = perf_counter()
+    commits = get_candidate_commits(repo, cruft_state["commit"], cruft_state.get("directory"))
+    scorer = _Scorer(repo, cruft_state, project_dir)
+    scored: Dict[int, Candidate] = {}
+
+    def score(index: int):
+        if index not in scored and len(scored) < max_renders:
+            scored[index] = scorer.score(commits[index])
+
+    last = len(commits) - 1
+    samples = max(2, min(len(commits), max_renders // 2))
+    # The most recent commits first, in case a single render is allowed
+    for sample in reversed(range(samples)):
+        score(round(sample * last / max(samples - 1, 1)))
+    while len(scored) < min(max_renders, len(commits)):
+        best = max(scored, key=lambda index: (scored[index].score, index))
+        lower = max((index for index in scored if index < best), default=best)
+        upper = min((index for index in scored if index > best), default=best)
+        middles = {(lower + best) // 2, (best + upper + 1) // 2} - set(scored)
+        if not middles:
+            break
+        for middle in sorted(middles):
+            score(middle)
+
+    ranked = sorted(scored.items(), key=lambda item: (item[1].score, item[0]), reverse=True)
+    return Detection(
+        [candidate for _, candidate in ranked], len(commits), len(scored), perf_counter() - start
+    )
+
+
+class _Scorer:
+    """Renders the template at a commit and scores how well it matches the project: the
+    mean similarity of the files of the render, 1 for the files the project holds as is,
+    the share of lines they have in common for the others, and 0 for the missing ones."""
+
+    def __init__(self, repo: Repo, cruft_state: CruftState, project_dir: Path):
+        self.repo = repo
+        self.cruft_state = cruft_state
+        self.project_dir = project_dir
+        self.hashes: Dict[str, Optional[str]] = {}
+        self.lines: Dict[str, FrozenSet[bytes]] = {}
+
+    def score(self, commit: str) -> Candidate:
+        with AltTemporaryDirectory() as render_dir_:
+            render_dir = Path(render_dir_)
+            with span("render"):
+                context = render_template(render_dir, self.repo, self.cruft_state, commit)
+            remove_unwanted_paths(render_dir, self.cruft_state, self.project_dir)
+            manifest = get_manifest(render_dir)
+            total = 0.0
+            for relative_path, entry in manifest.items():
+                project_hash = self._get_hash(relative_path)
+                if project_hash == entry.sha256:
+                    total += 1
+                elif project_hash is not None:
+                    total += self._get_similarity(relative_path, render_dir / relative_path)
+        return Candidate(commit, total / len(manifest) if manifest else 0.0, context)
+
+    def _get_hash(self, relative_path: str) -> Optional[str]:
+        if relative_path not in self.hashes:
+            path = self.project_dir / relative_path
+            is_file = path.is_file() or path.is_symlink()
+            self.hashes[relative_path] = get_file_hash(path) if is_file else None
+        return self.hashes[relative_path]
+
+    def _get_similarity(self, relative_path: str, render_file: Path) -> float:
+        if relative_path not in self.lines:
+            self.lines[relative_path] = _get_lines(self.project_dir / relative_path)
+        project_lines, render_lines = self.lines[relative_path], _get_lines(render_file)
+        union = project_lines | render_lines
+        return len(project_lines & render_lines) / len(union) if union else 0.0
+
+
+def _get_lines(path: Path) -> FrozenSet[bytes]:
+    if path.is_symlink() or not path.is_file():
+        return frozenset()
+    return frozenset(line.strip() for line in path.read_bytes().splitlines())
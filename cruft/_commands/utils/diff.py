@@ -1,10 +1,11 @@
 from pathlib import Path
 from re import sub
-from subprocess import PIPE, run  # nosec
 from typing import List
 
 from cruft import exceptions
 
+from .gitrunner import run_git
+
 DIFF_SRC_PREFIX = "upstream-template-old"
 DIFF_DST_PREFIX = "upstream-template-new"
 
@@ -12,7 +13,6 @@ DIFF_DST_PREFIX = "upstream-template-new"
 def _git_diff(*args: str) -> List[str]:
     # https://git-scm.com/docs/git-diff#Documentation/git-diff.txt---binary support for binary patch
     return [
-        "git",
         "-c",
         "diff.noprefix=",
         "diff",
@@ -31,11 +31,8 @@ def get_diff(repo0: Path, repo1: Path) -> str:
     repo0_str = repo0.resolve().as_posix()
     repo1_str = repo1.resolve().as_posix()
     try:
-        diff = run(
-            _git_diff("--no-ext-diff", "--no-color", repo0_str, repo1_str),
-            cwd=repo0_str,
-            stdout=PIPE,
-            stderr=PIPE,
+        diff = run_git(
+            *_git_diff("--no-ext-diff", "--no-color", repo0_str, repo1_str), cwd=repo0_str
         ).stdout.decode()
     except UnicodeDecodeError:
         raise exceptions.ChangesetUnicodeError()
@@ -70,4 +67,4 @@ def get_diff(repo0: Path, repo1: Path) -> str:
 
 def display_diff(repo0: Path, repo1: Path):
     """Displays the diff between two repositories."""
-    run(_git_diff(repo0.as_posix(), repo1.as_posix()))
+    run_git(*_git_diff(repo0.as_posix(), repo1.as_posix()), stdout=None, stderr=None)
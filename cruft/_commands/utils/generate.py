@@ -3,15 +3,24 @@ import stat
 import sys
 from pathlib import Path
 from shutil import move, rmtree
-from typing import Optional, Set, Union
+from typing import List, Optional, Set, Tuple, Union
 from warnings import warn
 
 from cookiecutter.generate import generate_files
 from git import Repo
 
+from .cache import active_cache, get_render_key
 from .cookiecutter import CookiecutterContext, generate_cookiecutter_context
-from .cruft import CruftState
-from .iohelper import AltTemporaryDirectory
+from .cruft import CruftState, get_extra_context
+from .hooks import get_hook_names, get_hook_policy, running_hooks
+from .incremental import PreviousRender, render_changes
+from .iohelper import AltTemporaryDirectory, link_tree, rendering
+from .manifest import get_manifest, save_manifest
+from .memtree import MemoryTree, get_deleted_paths
+from .parallel import parallel_rendering
+from .pathspec import limit_render, limit_tree, limiting_render
+from .profiling import span, timing_template_files
+from .snapshot import restore_snapshot, save_snapshot
 
 if not sys.version_info >= (3, 11):
     try:
@@ -31,23 +40,198 @@ def cookiecutter_template(
     checkout: Optional[str] = None,
     deleted_paths: Optional[Set[Path]] = None,
     update_deleted_paths: bool = False,
+    snapshot_file: Optional[Path] = None,
+    rendered_dir: Optional[Path] = None,
+    previous: Optional[PreviousRender] = None,
+    pathspec: Optional[List[str]] = None,
 ) -> CookiecutterContext:
-    """Generate a clean cookiecutter template in output_dir."""
-    if deleted_paths is None:
-        deleted_paths = set()
-    pyproject_file = project_dir / "pyproject.toml"
+    """Generate a clean cookiecutter template in output_dir.
+
+    The render is restored from `snapshot_file` when it holds it, and a copy of the render
+    is kept in `rendered_dir` before removing any path if given. Given a previous render,
+    only the files affected by the changes since are rendered again when possible. Given
+    a pathspec, only the files matching it are kept, and rendered unless the copy of the
+    render is kept, see `pathspec.get_pathspec`."""
     commit = checkout or repo.remotes.origin.refs["HEAD"]
+    context = render_template(
+        output_dir,
+        repo,
+        cruft_state,
+        commit,
+        cookiecutter_input,
+        snapshot_file,
+        previous,
+        pathspec if rendered_dir is None else None,
+    )
+    if rendered_dir is not None:
+        # The paths are then removed from the render, but none of its files are modified
+        link_tree(output_dir, rendered_dir)
+    with span("remove paths"):
+        remove_unwanted_paths(
+            output_dir, cruft_state, project_dir, deleted_paths, update_deleted_paths
+        )
+        limit_render(output_dir, pathspec)
+    return context
 
-    repo.head.reset(commit=commit, working_tree=True)
-    repo.submodule_update(recursive=True, force_reset=True)
 
+def cookiecutter_tree(
+    spill_dir: Path,
+    repo: Repo,
+    cruft_state: CruftState,
+    project_dir: Path = Path("."),
+    cookiecutter_input: bool = False,
+    checkout: Optional[str] = None,
+    deleted_paths: Optional[Set[Path]] = None,
+    update_deleted_paths: bool = False,
+    pathspec: Optional[List[str]] = None,
+    complete: bool = False,
+) -> Tuple[CookiecutterContext, MemoryTree, MemoryTree]:
+    """Generate a clean cookiecutter template in memory, like `cookiecutter_template` does
+    on disk. Returns the context, the clean render, and the render before any path was
+    removed from it, which is only limited to pathspec as well unless complete."""
+    commit = checkout or repo.remotes.origin.refs["HEAD"]
+    with span("checkout"):
+        repo.head.reset(commit=commit, working_tree=True)
+    with span("submodules"):
+        repo.submodule_update(recursive=True, force_reset=True)
     assert repo.working_dir is not None  # nosec B101 (allow assert for type checking)
-    context = _generate_output(
-        cruft_state, commit, Path(repo.working_dir), cookiecutter_input, output_dir
-    )
+    rendered = MemoryTree(spill_dir)
+    with span("generate"):
+        context = _generate_output(
+            cruft_state,
+            commit,
+            Path(repo.working_dir),
+            cookiecutter_input,
+            None,
+            rendered,
+            None if complete else pathspec,
+        )
+    tree = rendered.copy()
+    with span("remove paths"):
+        skip_paths = get_skip_paths(cruft_state, project_dir / "pyproject.toml")
+        if deleted_paths is None:
+            deleted_paths = set()
+        if update_deleted_paths:
+            deleted_paths.update(get_deleted_paths(tree, project_dir))
+        tree.remove(skip_paths | deleted_paths)
+        limit_tree(tree, pathspec)
+    return context, tree, rendered
+
+
+def render_template(
+    output_dir: Path,
+    repo: Repo,
+    cruft_state: CruftState,
+    commit: str,
+    cookiecutter_input: bool = False,
+    snapshot_file: Optional[Path] = None,
+    previous: Optional[PreviousRender] = None,
+    pathspec: Optional[List[str]] = None,
+) -> CookiecutterContext:
+    """Generate the template at the given commit in output_dir, without removing any path,
+    see `incremental.render_changes` for the previous render.
+
+    Given a pathspec, the files which don't match it may not be rendered, and the render is
+    then left out of the cache of renders."""
+    cache = active_cache()
+    render_key = None
+    if cache is not None and not cookiecutter_input:
+        # Skipping the hooks changes the render, and each request of the daemon may ask to
+        # run, skip or cache them, so the hook policy is part of the render key
+        render_key = (
+            *get_render_key(
+                cruft_state, repo.commit(commit).hexsha, get_extra_context(cruft_state)
+            ),
+            get_hook_policy(),
+        )
+        context = cache.get_render(render_key, output_dir)
+        if context is not None:
+            return context
+    if snapshot_file is not None and not cookiecutter_input:
+        with span("restore snapshot"):
+            context = restore_snapshot(
+                snapshot_file, cruft_state, repo.commit(commit).hexsha, output_dir
+            )
+        if context is not None:
+            return context
+
+    with span("checkout"):
+        repo.head.reset(commit=commit, working_tree=True)
+    with span("submodules"):
+        repo.submodule_update(recursive=True, force_reset=True)
+
+    context = None
+    if previous is not None and not cookiecutter_input:
+        with span("generate changes"):
+            context = render_changes(repo, cruft_state, previous, commit, output_dir)
+    if context is None:
+        assert repo.working_dir is not None  # nosec B101 (allow assert for type checking)
+        with span("generate"):
+            context = _generate_output(
+                cruft_state,
+                commit,
+                Path(repo.working_dir),
+                cookiecutter_input,
+                output_dir,
+                pathspec=pathspec,
+            )
+    if cache is not None and render_key is not None and pathspec is None:
+        cache.add_render(render_key, output_dir, context)
+    return context
+
+
+def record_template(
+    repo: Repo,
+    cruft_state: CruftState,
+    project_dir: Path,
+    manifest: bool = False,
+    snapshot: bool = False,
+):
+    """Render the template the project is linked to, to store its manifest and snapshot as
+    asked, see `record_render`."""
+    if not (manifest or snapshot):
+        return
+    with AltTemporaryDirectory() as render_dir:
+        with span("render"):
+            context = render_template(Path(render_dir), repo, cruft_state, cruft_state["commit"])
+        record_render(project_dir, Path(render_dir), cruft_state, context, manifest, snapshot)
+
+
+def record_render(
+    project_dir: Path,
+    render_dir: Path,
+    cruft_state: CruftState,
+    context: CookiecutterContext,
+    manifest: bool = False,
+    snapshot: bool = False,
+):
+    """Store the manifest of the template rendered for the cruft state of the project, and
+    the render itself as the snapshot of the project, as asked."""
+    files = None
+    if manifest:
+        with span("manifest"):
+            files = get_manifest(render_dir)
+            save_manifest(project_dir, files, cruft_state)
+    if snapshot:
+        with span("snapshot"):
+            save_snapshot(project_dir, render_dir, cruft_state, context, files)
+
+
+def remove_unwanted_paths(
+    output_dir: Path,
+    cruft_state: CruftState,
+    project_dir: Path = Path("."),
+    deleted_paths: Optional[Set[Path]] = None,
+    update_deleted_paths: bool = False,
+):
+    """Remove the skipped paths, and optionally the paths deleted from the project,
+    from a generated template."""
+    if deleted_paths is None:
+        deleted_paths = set()
+    pyproject_file = project_dir / "pyproject.toml"
 
     # Get all paths that we are supposed to skip before generating the diff and applying updates
-    skip_paths = _get_skip_paths(cruft_state, pyproject_file)
+    skip_paths = get_skip_paths(cruft_state, pyproject_file)
     # We also get the list of paths that were deleted from the project
     # directory but were present in the template that the project is linked against
     # This is to avoid introducing changes that won't apply cleanly to the current project.
@@ -56,8 +240,6 @@ def cookiecutter_template(
     # We now remove skipped and deleted paths from the project
     _remove_paths(output_dir, skip_paths | deleted_paths)  # type: ignore
 
-    return context
-
 
 #####################################
 # Generating clean outputs for diff #
@@ -69,21 +251,20 @@ def _generate_output(
     commit: str,
     project_dir: Path,
     cookiecutter_input: bool,
-    output_dir: Path,
+    output_dir: Optional[Path],
+    tree: Optional[MemoryTree] = None,
+    pathspec: Optional[List[str]] = None,
 ) -> CookiecutterContext:
     inner_dir = project_dir / (cruft_state.get("directory") or "")
+    # Unless skipped, the hooks may read or change any file of the render
+    if get_hook_names(inner_dir) and get_hook_policy() != "skip":
+        pathspec = None
 
-    # Don't pass entries prefixed by "_" = cookiecutter extensions, not direct user intent
-    extra_context = {
-        key: value
-        for key, value in cruft_state["context"]["cookiecutter"].items()
-        if not key.startswith("_")
-    }
     new_context = generate_cookiecutter_context(
         cruft_state["template"],
         commit,
         inner_dir,
-        extra_context=extra_context,
+        extra_context=get_extra_context(cruft_state),
         no_input=not cookiecutter_input,
     )
 
@@ -92,17 +273,27 @@ def _generate_output(
     # arbitrary directory. It insists on creating the initial project directory.
     # Therefore we have to move the directory content to the expected output_dir.
     # See https://github.com/cookiecutter/cookiecutter/pull/907
-    output_dir.mkdir(parents=True, exist_ok=True)
-    with AltTemporaryDirectory(cruft_state.get("directory")) as tmpdir:
+    # Rendering in memory, only the files it writes itself are held in that directory.
+    if output_dir is not None:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    with AltTemporaryDirectory() as tmpdir, rendering(inner_dir):
         # Kindly ask cookiecutter to generate the template
-        template_dir = generate_files(
-            repo_dir=inner_dir, context=new_context, overwrite_if_exists=True, output_dir=tmpdir
-        )
+        with timing_template_files(), running_hooks(), parallel_rendering(tree):
+            with limiting_render(pathspec):
+                template_dir = generate_files(
+                    repo_dir=inner_dir,
+                    context=new_context,
+                    overwrite_if_exists=True,
+                    output_dir=tmpdir,
+                )
         template_dir = Path(template_dir)
 
-        # Move the template content to the output directory
-        for name in os.listdir(template_dir):
-            move(str(template_dir / name), str(output_dir))
+        if tree is not None:
+            tree.load(template_dir)
+        else:
+            # Move the template content to the output directory
+            for name in os.listdir(template_dir):
+                move(str(template_dir / name), str(output_dir))
 
     return new_context
 
@@ -112,8 +303,10 @@ def _generate_output(
 ##############################
 
 
-def _get_skip_paths(cruft_state: CruftState, pyproject_file: Path) -> Set[Union[str, Path]]:
-    skip_cruft = cruft_state.get("skip", [])
+def get_skip_paths(cruft_state: CruftState, pyproject_file: Path) -> Set[Union[str, Path]]:
+    """The paths cruft leaves out of the project, from its state and from `tool.cruft` in
+    pyproject.toml: glob patterns as strings, and paths otherwise."""
+    skip_cruft = list(cruft_state.get("skip", []))
     if tomllib and pyproject_file.is_file():
         pyproject_cruft = tomllib.loads(pyproject_file.read_text()).get("tool", {}).get("cruft", {})
         skip_cruft.extend(pyproject_cruft.get("skip", []))
@@ -127,13 +320,8 @@ def _get_skip_paths(cruft_state: CruftState, pyproject_file: Path) -> Set[Union[
 
 
 def _get_deleted_files(template_dir: Path, project_dir: Path):
-    cwd = Path.cwd()
-    os.chdir(template_dir)
-    template_paths = set(Path(".").glob("**/*"))
-    os.chdir(cwd)
-    os.chdir(project_dir)
-    deleted_paths = set(filter(lambda path: not path.exists(), template_paths))
-    os.chdir(cwd)
+    template_paths = set(path.relative_to(template_dir) for path in template_dir.glob("**/*"))
+    deleted_paths = set(filter(lambda path: not (project_dir / path).exists(), template_paths))
     return deleted_paths
 
 
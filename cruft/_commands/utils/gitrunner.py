@@ -0,0 +1,335 @@
+"""Every git process cruft spawns goes through this module, which accounts for them.
+
+Git is run directly with `run_git`, and through GitPython with the `Repo` defined here,
+whose commands are executed by `Git`. While an accounting is active, see `accounting`,
+each invocation is recorded with its duration, exit code and the bytes sent through its
+pipes. The limits set with CRUFT_GIT_TIMEOUT and CRUFT_GIT_MAX_PROCESSES apply here too."""
+
+import json
+import subprocess  # nosec
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from threading import BoundedSemaphore, Lock, Timer, current_thread
+from time import perf_counter
+from typing import (
+    IO,
+    Any,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import git
+from git import GitCommandError
+
+from cruft.exceptions import GitTimeout
+
+from .config import get_setting
+
+_active_accounting: Optional["GitAccounting"] = None
+
+_SLOTS_LOCK = Lock()
+_slots: Tuple[int, Optional[BoundedSemaphore]] = (0, None)
+
+# Options of git taking a value, which precede the name of the command
+_GLOBAL_OPTIONS_WITH_VALUE = ("-c", "-C", "--git-dir", "--work-tree", "--namespace")
+
+
+class GitInvocation(NamedTuple):
+    command: List[str]
+    cwd: Optional[str]
+    start: float
+    duration: float
+    # None when git did not exit on its own: it timed out, or was closed by GitPython
+    exit_code: Optional[int]
+    stdin_bytes: int
+    stdout_bytes: int
+    thread: str
+
+
+class CommandTotal(NamedTuple):
+    name: str
+    calls: int
+    failures: int
+    total: float
+    max: float
+    stdin_bytes: int
+    stdout_bytes: int
+
+
+class GitAccounting:
+    """The git invocations recorded while an accounting is active, see `accounting`."""
+
+    def __init__(self, trace_file: Optional[Path] = None):
+        self.start = perf_counter()
+        self.invocations: List[GitInvocation] = []
+        self._lock = Lock()
+        self._trace: Optional[IO[str]] = None
+        if trace_file is not None:
+            self._trace = trace_file.open("w")
+
+    def record(
+        self,
+        command: Sequence[Any],
+        cwd: Optional[Union[str, Path]],
+        start: float,
+        exit_code: Optional[int],
+        stdin_bytes: int = 0,
+        stdout_bytes: int = 0,
+    ):
+        invocation = GitInvocation(
+            [str(argument) for argument in command],
+            None if cwd is None else str(cwd),
+            start - self.start,
+            perf_counter() - start,
+            exit_code,
+            stdin_bytes,
+            stdout_bytes,
+            current_thread().name,
+        )
+        with self._lock:
+            self.invocations.append(invocation)
+            if self._trace is not None:
+                # Written as they complete, so that the trace of a stuck command is useful
+                self._trace.write(json.dumps(invocation._asdict()) + "\n")
+                self._trace.flush()
+
+    def commands(self) -> List[CommandTotal]:
+        """The invocations aggregated by git command, the most time consuming first."""
+        totals: Dict[str, CommandTotal] = {}
+        with self._lock:
+            invocations = list(self.invocations)
+        for invocation in invocations:
+            name = get_command_name(invocation.command)
+            total = totals.get(name, CommandTotal(name, 0, 0, 0.0, 0.0, 0, 0))
+            totals[name] = CommandTotal(
+                name,
+                total.calls + 1,
+                total.failures + bool(invocation.exit_code),
+                total.total + invocation.duration,
+                max(total.max, invocation.duration),
+                total.stdin_bytes + invocation.stdin_bytes,
+                total.stdout_bytes + invocation.stdout_bytes,
+            )
+        return sorted(totals.values(), key=lambda command: (-command.total, command.name))
+
+    def summary(self) -> str:
+        """A human readable table of the git processes spawned, by git command."""
+        rows = [
+            f"{'Git command':<20} {'Calls':>5} {'Failed':>6} {'Total':>9} {'Max':>9}"
+            f" {'Stdin':>10} {'Stdout':>10}"
+        ]
+        commands = self.commands()
+        for command in commands:
+            rows.append(
+                f"{command.name:<20} {command.calls:>5} {command.failures:>6}"
+                f" {command.total:>8.3f}s {command.max:>8.3f}s"
+                f" {command.stdin_bytes:>9}B {command.stdout_bytes:>9}B"
+            )
+        rows.append(
+            f"{'total':<20} {sum(command.calls for command in commands):>5}"
+            f" {sum(command.failures for command in commands):>6}"
+            f" {sum(command.total for command in commands):>8.3f}s"
+        )
+        return "\n".join(rows)
+
+    def close(self):
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+
+
+def get_command_name(command: Sequence[str]) -> str:
+    """The git command run by a command line, e.g. `clone` for `git -c x=y clone url`."""
+    arguments = iter(command[1:])
+    for argument in arguments:
+        if argument in _GLOBAL_OPTIONS_WITH_VALUE:
+            next(arguments, None)
+        elif not argument.startswith("-"):
+            return argument
+    return "git"
+
+
+def active_accounting() -> Optional[GitAccounting]:
+    return _active_accounting
+
+
+@contextmanager
+def accounting(trace_file: Optional[Path] = None) -> Iterator[GitAccounting]:
+    """Record the git processes spawned in the block, and trace them to `trace_file` as
+    JSON lines if given."""
+    global _active_accounting
+    collected = GitAccounting(trace_file)
+    previous, _active_accounting = _active_accounting, collected
+    try:
+        yield collected
+    finally:
+        _active_accounting = previous
+        collected.close()
+
+
+def get_timeout() -> Optional[float]:
+    """The seconds a git command may run for, which can be set with CRUFT_GIT_TIMEOUT."""
+    timeout = get_setting("git_timeout", "CRUFT_GIT_TIMEOUT")
+    return float(timeout) if timeout else None
+
+
+def process_slot() -> ContextManager:
+    """Wait for one of the CRUFT_GIT_MAX_PROCESSES git processes allowed to run at once."""
+    global _slots
+    limit = int(get_setting("git_max_processes", "CRUFT_GIT_MAX_PROCESSES") or 0)
+    if limit <= 0:
+        return nullcontext()
+    with _SLOTS_LOCK:
+        if _slots[0] != limit:
+            _slots = (limit, BoundedSemaphore(limit))
+        return _slots[1]  # type: ignore
+
+
+def run_git(
+    *arguments: str,
+    cwd: Optional[Union[str, Path]] = None,
+    input: Optional[bytes] = None,
+    stdout: Optional[int] = subprocess.PIPE,
+    stderr: Optional[int] = subprocess.PIPE,
+    check: bool = False,
+) -> "subprocess.CompletedProcess[bytes]":
+    """Run `git *arguments`, the way `subprocess.run` would."""
+    command = ["git", *arguments]
+    timeout = get_timeout()
+    accounted = _active_accounting
+    with process_slot():
+        start = perf_counter()
+        try:
+            result = subprocess.run(  # nosec
+                command, cwd=cwd, input=input, stdout=stdout, stderr=stderr, timeout=timeout
+            )
+        except subprocess.TimeoutExpired:
+            if accounted is not None:
+                accounted.record(command, cwd, start, None, len(input or b""))
+            raise GitTimeout(command, timeout)  # type: ignore
+    if accounted is not None:
+        accounted.record(
+            command, cwd, start, result.returncode, len(input or b""), len(result.stdout or b"")
+        )
+    if check:
+        result.check_returncode()
+    return result
+
+
+class _AccountedProcess(git.Git.AutoInterrupt):
+    """A git process GitPython streams from, recorded once it is waited for or closed."""
+
+    __slots__ = ("_accounting", "_start", "_cwd", "_slot", "_timer", "_finished")
+
+    def _account(
+        self,
+        accounted: Optional[GitAccounting],
+        start: float,
+        cwd: Optional[str],
+        slot: ContextManager,
+        timeout: Optional[float],
+    ):
+        self._accounting = accounted
+        self._start = start
+        self._cwd = cwd
+        self._slot = slot
+        self._timer: Optional[Timer] = None
+        self._finished = False
+        if timeout is not None:
+            self._timer = Timer(timeout, self._kill)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _kill(self):
+        process = self.proc
+        if process is not None and process.poll() is None:
+            process.kill()
+
+    def _finish(self, exit_code: Optional[int]):
+        if getattr(self, "_finished", True):
+            return
+        self._finished = True
+        if self._timer is not None:
+            self._timer.cancel()
+        self._slot.__exit__(None, None, None)
+        if self._accounting is not None:
+            self._accounting.record(self.args, self._cwd, self._start, exit_code)
+
+    def wait(self, stderr: Union[None, str, bytes] = b"") -> int:
+        try:
+            status = super().wait(stderr)
+        except GitCommandError as error:
+            self._finish(error.status)  # type: ignore
+            raise
+        self._finish(status)
+        return status
+
+    def __del__(self):
+        # Processes kept open by GitPython, such as `git cat-file --batch`, are never waited for
+        super().__del__()
+        self._finish(None)
+
+
+class Git(git.Git):
+    """The runner of the git commands of GitPython, see `Repo`."""
+
+    AutoInterrupt = _AccountedProcess  # type: ignore
+
+    def execute(self, command, *args, **kwargs):  # type: ignore
+        accounted = _active_accounting
+        if kwargs.get("as_process"):
+            # The processes fed through their standard input, such as `git cat-file --batch`,
+            # are kept open by GitPython as long as their repository: they neither hold a slot
+            # nor time out.
+            persistent = kwargs.get("istream") is not None
+            slot = nullcontext() if persistent else process_slot()
+            slot.__enter__()
+            start = perf_counter()
+            try:
+                process = super().execute(command, *args, **kwargs)
+            except BaseException:
+                slot.__exit__(None, None, None)
+                raise
+            timeout = None if persistent else get_timeout()
+            process._account(accounted, start, self._working_dir, slot, timeout)
+            return process
+
+        if kwargs.get("kill_after_timeout") is None:
+            kwargs["kill_after_timeout"] = get_timeout()
+        with process_slot():
+            start = perf_counter()
+            try:
+                result = super().execute(command, *args, **kwargs)
+            except GitCommandError as error:
+                if accounted is not None:
+                    accounted.record(command, self._working_dir, start, error.status)  # type: ignore
+                raise
+        if accounted is not None:
+            exit_code, output = 0, result
+            if kwargs.get("with_extended_output"):
+                exit_code, output, _ = result
+            accounted.record(command, self._working_dir, start, exit_code, 0, _get_size(output))
+        return result
+
+
+class Repo(git.Repo):
+    """A GitPython repository whose git commands are run by `Git`."""
+
+    GitCommandWrapperType = Git
+
+
+def _get_size(output: Any) -> int:
+    if isinstance(output, str):
+        return len(output.encode())
+    if isinstance(output, bytes):
+        return len(output)
+    # Written to a stream given by the caller
+    return 0
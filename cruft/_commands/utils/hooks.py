@@ -0,0 +1,166 @@
+import json
+import os
+from contextlib import contextmanager
+from hashlib import sha256
+from pathlib import Path
+from shutil import copy2
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, List
+
+from cruft.exceptions import InvalidHookPolicy
+
+from .cache import get_cache_dir, get_cache_size, store_entry, use_entry
+from .config import get_setting, using_settings
+from .iohelper import patching, writing_aside
+from .manifest import Manifest, get_manifest
+from .profiling import active_profile
+
+HOOK_POLICIES = ["run", "skip", "cache"]
+_VERSION = 1
+_CHANGES = "changes.json"
+_FILES = "files"
+
+
+def get_hook_policy() -> str:
+    """How the hooks of templates are run when rendering them to compare a project with
+    them: set with `hook_policy`, or else CRUFT_HOOKS or `hooks` in the configuration file.
+
+    - run: run the hooks on every render, the default.
+    - skip: never run the hooks.
+    - cache: run the hooks once, then replay the changes they made to the rendered files
+      whenever the same hook runs on the same files with the same variables."""
+    policy = get_setting("hooks", "CRUFT_HOOKS") or "run"
+    if policy not in HOOK_POLICIES:
+        raise InvalidHookPolicy(policy, HOOK_POLICIES)
+    return policy
+
+
+@contextmanager
+def hook_policy(policy: str) -> Iterator[str]:
+    """Run the hooks of the templates rendered by the commands of the block with this policy,
+    in the current thread, see `get_hook_policy`. The hooks of the projects created are
+    always run."""
+    if policy not in HOOK_POLICIES:
+        raise InvalidHookPolicy(policy, HOOK_POLICIES)
+    with using_settings({"hooks": policy}):
+        yield policy
+
+
+def get_hook_cache_dir() -> Path:
+    return get_cache_dir() / "hooks"
+
+
+@contextmanager
+def running_hooks() -> Iterator[None]:
+    """Run the hooks of the templates rendered in the block according to the hook policy."""
+    policy = get_hook_policy()
+    if policy == "run":
+        yield
+        return
+
+    from cookiecutter import hooks
+
+    def skip(run_script: Callable) -> Callable:
+        def skipped_run_script(script_path: str, cwd: str, context: Dict[str, Any]):
+            pass
+
+        return skipped_run_script
+
+    def cache(run_script: Callable) -> Callable:
+        def cached_run_script(script_path: str, cwd: str, context: Dict[str, Any]):
+            start = perf_counter()
+            before = get_manifest(Path(cwd))
+            key = get_hook_key(Path(script_path), before, context)
+            if replay_hook(key, Path(cwd)):
+                profile = active_profile()
+                if profile is not None and profile.template_files:
+                    hook_name = os.path.join("hooks", os.path.basename(script_path))
+                    profile.add_file(hook_name, "cached hook", perf_counter() - start)
+                return
+            run_script(script_path, cwd, context)
+            record_hook(key, Path(cwd), before)
+
+        return cached_run_script
+
+    with patching(hooks, "run_script_with_context", cache if policy == "cache" else skip):
+        yield
+
+
+def get_hook_key(script_file: Path, tree: Manifest, context: Dict[str, Any]) -> str:
+    """What the changes made by a hook depend on: its script, the files it runs on, and the
+    variables it is rendered with."""
+    tree_hash = sha256(
+        "\n".join(f"{path} {entry}" for path, entry in sorted(tree.items())).encode()
+    ).hexdigest()
+    context_hash = sha256(json.dumps(context, sort_keys=True, default=str).encode()).hexdigest()
+    script_hash = sha256(script_file.read_bytes()).hexdigest()
+    return sha256(
+        "\0".join([str(_VERSION), script_file.name, script_hash, tree_hash, context_hash]).encode()
+    ).hexdigest()
+
+
+def record_hook(key: str, directory: Path, before: Manifest):
+    """Store the changes a hook made to the files of directory, given the files before."""
+    if not get_cache_size():
+        return
+    after = get_manifest(directory)
+    changes = {
+        "removed": sorted(set(before) - set(after)),
+        "written": sorted(path for path, entry in after.items() if before.get(path) != entry),
+    }
+    hook_dir = get_hook_cache_dir() / key
+    try:
+        with writing_aside(hook_dir, directory=True) as partial_dir:
+            for path in changes["written"]:
+                _copy_file(directory / path, partial_dir / _FILES / path)
+            (partial_dir / _CHANGES).write_text(json.dumps(changes))
+        store_entry(hook_dir)
+    except OSError:
+        # The cache is only an optimization, the hook will run again next time
+        pass
+
+
+def replay_hook(key: str, directory: Path) -> bool:
+    """Make the changes stored for a hook to the files of directory, if any were stored."""
+    hook_dir = get_hook_cache_dir() / key
+    if not get_cache_size():
+        return False
+    try:
+        changes = json.loads((hook_dir / _CHANGES).read_text())
+    except (OSError, ValueError):
+        return False
+    use_entry(hook_dir)
+    for path in changes["removed"]:
+        _remove_file(directory, path)
+    for path in changes["written"]:
+        _copy_file(hook_dir / _FILES / path, directory / path)
+    return True
+
+
+def _copy_file(source: Path, destination: Path):
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    if destination.is_symlink() or destination.is_file():
+        destination.unlink()
+    copy2(str(source), str(destination), follow_symlinks=False)
+
+
+def _remove_file(directory: Path, relative_path: str):
+    path = directory / relative_path
+    if path.is_symlink() or path.is_file():
+        path.unlink()
+    parent = path.parent
+    while parent != directory and parent.is_dir() and not any(parent.iterdir()):
+        parent.rmdir()
+        parent = parent.parent
+
+
+def get_hook_names(template_dir: Path) -> List[str]:
+    """The hooks of a template, as cookiecutter finds them."""
+    hooks_dir = template_dir / "hooks"
+    if not hooks_dir.is_dir():
+        return []
+    return sorted(
+        path.name
+        for path in hooks_dir.iterdir()
+        if path.stem in ("pre_gen_project", "post_gen_project") and not path.name.endswith("~")
+    )
@@ -0,0 +1,250 @@
+import os
+from pathlib import Path
+from shutil import copy2
+from typing import Dict, NamedTuple, Optional, Set
+
+from cookiecutter.generate import generate_files, is_copy_only_path
+from cookiecutter.utils import create_env_with_context
+from git import Repo
+
+from .cookiecutter import CookiecutterContext, generate_cookiecutter_context
+from .cruft import CruftState, get_extra_context
+from .dependencies import TemplateIndex, get_affected_files, get_template_index
+from .hooks import get_hook_names, get_hook_policy
+from .iohelper import AltTemporaryDirectory, link_tree, rendering
+from .parallel import parallel_rendering
+from .profiling import span, timing_template_files
+
+# The variables of cookiecutter changing which files are rendered, and how
+GENERATION_VARIABLES = ("_copy_without_render", "_extensions", "_jinja2_env_vars", "_new_lines")
+_MISSING = object()
+
+
+class PreviousRender(NamedTuple):
+    """A render of the template at another commit, before any path was removed from it."""
+
+    commit: str
+    directory: Path
+    context: CookiecutterContext
+
+
+class TemplateDiff(NamedTuple):
+    """The status of the files changed in a template between two commits, A, M or D, by
+    path relative to its directory, and why the change may affect every file of its
+    renders, if it may."""
+
+    files: Dict[str, str]
+    everything: Optional[str]
+
+
+def get_template_diff(
+    repo: Repo, previous_commit: str, commit: str, directory: str = ""
+) -> TemplateDiff:
+    """The files changed in the template between two commits. Every file of the renders may
+    change when the hooks, Python modules such as the local extensions, or submodules change.
+    """
+    prefix = f"{directory.strip('/')}/" if directory else ""
+    output = repo.git.diff(
+        "--raw", "-z", "--no-renames", previous_commit, commit, "--", directory or "."
+    )
+    fields = output.split("\0")
+    files, everything = {}, None
+    for info, path in zip(fields[::2], fields[1::2]):
+        old_mode, new_mode, _, _, status = info.lstrip(":").split(" ")
+        path = path[len(prefix) :]
+        if "160000" in (old_mode, new_mode) or path == ".gitmodules":
+            everything = "submodules of the template changed"
+        elif path.startswith("hooks/"):
+            everything = "hooks of the template changed"
+        elif path.endswith(".py") and "{{" not in path.split("/")[0]:
+            everything = "Python modules of the template changed"
+        files[path] = status
+    return TemplateDiff(files, everything)
+
+
+def get_template_changes(
+    repo: Repo, previous_commit: str, commit: str, directory: str = ""
+) -> Optional[Dict[str, str]]:
+    """The status of the files changed in the template between two commits, by path relative
+    to its directory.
+
+    None when the change may affect every file of the render, see `get_template_diff`, or
+    when `cookiecutter.json` changes."""
+    diff = get_template_diff(repo, previous_commit, commit, directory)
+    if diff.everything is not None or "cookiecutter.json" in diff.files:
+        return None
+    return diff.files
+
+
+def render_changes(
+    repo: Repo,
+    cruft_state: CruftState,
+    previous: PreviousRender,
+    commit: str,
+    output_dir: Path,
+) -> Optional[CookiecutterContext]:
+    """Render the template at `commit` in output_dir by only rendering again the files
+    affected by the changes since a previous render, reusing it for every other file.
+
+    The affected files are the changed ones, the ones using variables whose value changed,
+    the commit of the template being one of them, and the ones including any of these,
+    directly or not, see `dependencies.get_affected_files`. The files whose path uses a
+    changed variable are removed from where the previous render generated them.
+
+    None is returned, without touching output_dir, when the template must be rendered in
+    full instead: when the template has hooks which aren't skipped, when variables
+    changing how cookiecutter generates files change, or when `get_template_changes` finds
+    changes affecting everything."""
+    assert repo.working_dir is not None  # nosec B101 (allow assert for type checking)
+    inner_dir = Path(repo.working_dir) / (cruft_state.get("directory") or "")
+    template_dir = find_template_dir(inner_dir)
+    # Unless skipped, the hooks of the previous render may have changed any of its files
+    if template_dir is None or (get_hook_names(inner_dir) and get_hook_policy() != "skip"):
+        return None
+    changes = get_template_changes(
+        repo, previous.commit, repo.commit(commit).hexsha, cruft_state.get("directory") or ""
+    )
+    if changes is None or any(
+        "{{" in path.split("/")[0] and not path.startswith(f"{template_dir.name}/")
+        for path in changes
+    ):
+        return None
+
+    context = generate_cookiecutter_context(
+        cruft_state["template"],
+        commit,
+        inner_dir,
+        extra_context=get_extra_context(cruft_state),
+        no_input=True,
+    )
+    changed_variables = _get_changed_variables(previous.context, context)
+    if changed_variables is None:
+        return None
+
+    prefix = f"{template_dir.name}/"
+    changed_files = {
+        path[len(prefix) :]: status for path, status in changes.items() if path.startswith(prefix)
+    }
+    changed_templates = {
+        path[len("templates/") :] for path in changes if path.startswith("templates/")
+    }
+
+    with rendering(inner_dir):
+        environment = create_env_with_context(context)
+        with span("index"):
+            index = get_template_index(repo, commit, inner_dir, template_dir, environment)
+        copied_files = {path for path in index.files if is_copied(path, context)}
+        affected = get_affected_files(
+            index, set(changed_files) | changed_templates, changed_variables, copied_files
+        )
+        moved_files = {
+            path
+            for path, dependencies in index.files.items()
+            if dependencies.path_variables is None
+            or changed_variables.intersection(dependencies.path_variables)
+        }
+
+        if output_dir.exists():
+            output_dir.rmdir()
+        link_tree(previous.directory, output_dir)
+        removed_files = {path for path, status in changed_files.items() if status == "D"}
+        removed_files.update(path for path in moved_files if changed_files.get(path) != "A")
+        for path in sorted(removed_files):
+            _remove_output(output_dir, environment.from_string(path).render(**previous.context))
+        render_files = {path for path in affected | moved_files if path in index.files}
+        if render_files:
+            _render_files(inner_dir, template_dir, render_files, index, context, output_dir)
+    return context
+
+
+def find_template_dir(inner_dir: Path) -> Optional[Path]:
+    """The directory of the project template in a template, like
+    `cookiecutter.find.find_template`, None when there is none."""
+    for path in sorted(inner_dir.iterdir()):
+        if path.is_dir() and "cookiecutter" in path.name and "{{" in path.name:
+            return path
+    return None
+
+
+def _get_changed_variables(
+    previous_context: CookiecutterContext, context: CookiecutterContext
+) -> Optional[Set[str]]:
+    previous_variables, variables = previous_context["cookiecutter"], context["cookiecutter"]
+    changed = {
+        name
+        for name in set(previous_variables) | set(variables)
+        if previous_variables.get(name, _MISSING) != variables.get(name, _MISSING)
+    }
+    if changed.intersection(GENERATION_VARIABLES) or any(
+        previous_context.get(key) != context.get(key) for key in context if key != "cookiecutter"
+    ):
+        return None
+    return changed
+
+
+def is_copied(path: str, context: CookiecutterContext) -> bool:
+    """Whether a template file is copied without being rendered, along with the directory
+    holding it or not."""
+    parts = path.split("/")
+    return any(
+        is_copy_only_path("/".join(parts[:length]), context) for length in range(1, len(parts) + 1)
+    )
+
+
+def _remove_output(output_dir: Path, relative_path: str):
+    path = output_dir / relative_path
+    if not relative_path or not (path.is_file() or path.is_symlink()):
+        # Rendered to an empty name, the file was never generated
+        return
+    path.unlink()
+    parent = path.parent
+    while parent != output_dir and not any(parent.iterdir()):
+        parent.rmdir()
+        parent = parent.parent
+
+
+def _render_files(
+    inner_dir: Path,
+    template_dir: Path,
+    render_files: Set[str],
+    index: TemplateIndex,
+    context: CookiecutterContext,
+    output_dir: Path,
+):
+    # The files to render are laid out in a sparse copy of the template, along with the
+    # files they include, and rendered on top of the previous render
+    included = set(render_files)
+    pending = list(render_files)
+    while pending:
+        dependencies = index.files.get(pending.pop())
+        for include in (dependencies and dependencies.includes) or ():
+            if include not in included and (template_dir / include).is_file():
+                included.add(include)
+                pending.append(include)
+
+    with AltTemporaryDirectory() as tmpdir:
+        sparse_dir = Path(tmpdir) / "template" / template_dir.name
+        for root, _, _ in os.walk(template_dir):
+            (sparse_dir / Path(root).relative_to(template_dir)).mkdir(parents=True, exist_ok=True)
+        for path in included:
+            try:
+                os.link(str(template_dir / path), str(sparse_dir / path))
+            except OSError:
+                copy2(str(template_dir / path), str(sparse_dir / path), follow_symlinks=False)
+        if (inner_dir / "templates").is_dir():
+            link_tree(inner_dir / "templates", sparse_dir.parent / "templates")
+
+        with timing_template_files(), parallel_rendering():
+            rendered_dir = Path(
+                generate_files(
+                    repo_dir=str(sparse_dir.parent),
+                    context=context,
+                    overwrite_if_exists=True,
+                    output_dir=str(Path(tmpdir) / "output"),
+                )
+            )
+        for root, dirs, files in os.walk(rendered_dir):
+            relative_root = Path(root).relative_to(rendered_dir)
+            (output_dir / relative_root).mkdir(parents=True, exist_ok=True)
+            for name in files + [name for name in dirs if os.path.islink(Path(root, name))]:
+                os.replace(str(Path(root, name)), str(output_dir / relative_root / name))
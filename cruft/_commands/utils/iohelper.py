@@ -1,35 +1,294 @@
+import atexit
+import os
+import stat
 import sys
+from contextlib import contextmanager
 from pathlib import Path
-from tempfile import TemporaryDirectory
+from queue import Queue
+from shutil import copytree, rmtree
+from tempfile import mkdtemp, mkstemp
+from threading import Lock, RLock, Thread
 from time import sleep
-from typing import Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .config import get_setting
+from .resources import active_tracker
+
+# Rendering a template may import its local Jinja extensions, and cookiecutter changes the
+# working directory of the process while it generates files. Both are process wide, so
+# renders are run one at a time.
+_RENDER_LOCK = RLock()
+
+DEFAULT_SCRATCH_POOL_SIZE = 4
+_CLEANUP_ATTEMPTS = 5
+
+_pools: Dict[Tuple[Optional[Path], int], "ScratchPool"] = {}
+_pools_pid: Optional[int] = None
+_POOLS_LOCK = Lock()
+
+
+class ScratchPool:
+    """The scratch directories of cruft under `root`, the system default when None.
+
+    A released directory is emptied in a background thread, and kept for reuse unless
+    `size` directories are already waiting to be reused, so that commands don't wait for
+    their scratch directories to be deleted."""
+
+    def __init__(self, root: Optional[Path], size: int, background: bool = True):
+        self.root = root
+        self.size = size
+        self.background = background
+        self._idle: List[str] = []
+        self._lock = Lock()
+        self._queue: "Queue[str]" = Queue()
+        self._thread: Optional[Thread] = None
+
+    def acquire(self) -> str:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        if self.root is not None:
+            self.root.mkdir(parents=True, exist_ok=True)
+        return mkdtemp(prefix="cruft-", dir=None if self.root is None else str(self.root))
+
+    def release(self, path: str):
+        if not self.background:
+            self._recycle(path)
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="cruft-scratch", daemon=True)
+                self._thread.start()
+        self._queue.put(path)
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            try:
+                self._recycle(path)
+            finally:
+                self._queue.task_done()
+
+    def _recycle(self, path: str):
+        with self._lock:
+            reuse = len(self._idle) < self.size
+        if not reuse:
+            _remove(path)
+        elif _remove(path, contents_only=True):
+            with self._lock:
+                self._idle.append(path)
+
+    def drain(self):
+        """Wait for the released directories to be emptied."""
+        self._queue.join()
+
+    def close(self):
+        """Delete every directory of the pool, once the released ones are emptied."""
+        self.drain()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for path in idle:
+            _remove(path)
+
+
+def get_scratch_dir() -> Optional[Path]:
+    """The directory holding the scratch directories of cruft, set with CRUFT_SCRATCH_DIR or
+    `scratch_dir` in the configuration file. Defaults to the temporary directory of the
+    system."""
+    scratch_dir = get_setting("scratch_dir", "CRUFT_SCRATCH_DIR")
+    return Path(scratch_dir).expanduser() if scratch_dir else None
+
+
+def get_scratch_pool_size() -> int:
+    """The empty scratch directories kept for reuse, set with CRUFT_SCRATCH_POOL_SIZE or
+    `scratch_pool_size` in the configuration file."""
+    size = get_setting("scratch_pool_size", "CRUFT_SCRATCH_POOL_SIZE")
+    return max(int(size), 0) if size else DEFAULT_SCRATCH_POOL_SIZE
+
+
+def get_scratch_pool() -> ScratchPool:
+    """The pool of scratch directories for the current settings."""
+    global _pools_pid
+    key = (get_scratch_dir(), get_scratch_pool_size())
+    with _POOLS_LOCK:
+        if _pools_pid != os.getpid():
+            # A forked process inherits the pools, but neither their threads nor directories
+            _pools.clear()
+            _pools_pid = os.getpid()
+        if key not in _pools:
+            _pools[key] = ScratchPool(*key, background=not _in_worker_process())
+        return _pools[key]
+
+
+@atexit.register
+def close_scratch_pools():
+    """Delete the scratch directories of the process, waiting for their cleanup."""
+    with _POOLS_LOCK:
+        pools = list(_pools.values()) if _pools_pid == os.getpid() else []
+        _pools.clear()
+    for pool in pools:
+        pool.close()
 
 
 class AltTemporaryDirectory:
-    def __init__(self, directory: Optional[str] = None):
-        self.tmpdir = TemporaryDirectory()
-        self._extended_path = False
-        self._directory = directory or ""
-        name = str(Path(self.tmpdir.name) / self._directory)
-        if name not in sys.path:
-            self._extended_path = True
-            sys.path.append(name)
+    """A scratch directory from the pool of `get_scratch_pool`, handed back to it on exit."""
+
+    def __init__(self):
+        self.pool = get_scratch_pool()
+        self.name = self.pool.acquire()
+        self.tracker = active_tracker()
 
     def __enter__(self):
-        return self.tmpdir.name
-
-    def cleanup(self, cnt=0):
-        if self._extended_path:
-            name = str(Path(self.tmpdir.name) / self._directory)
-            if name in sys.path:
-                sys.path.remove(name)
-        if cnt >= 5:  # pragma: no cover
-            raise RuntimeError("Could not delete TemporaryDirectory!")
-        try:
-            self.tmpdir.cleanup()
-        except IOError:  # pragma: no cov_4_nix
-            sleep(1)
-            self.cleanup(cnt + 1)
+        if self.tracker is not None:
+            try:
+                self.tracker.add_temp_dir(self.name)
+            except BaseException:
+                self.pool.release(self.name)
+                raise
+        return self.name
+
+    def cleanup(self):
+        self.pool.release(self.name)
 
     def __exit__(self, exc, value, tb):
+        if self.tracker is not None:
+            self.tracker.remove_temp_dir(self.name)
         self.cleanup()
+
+
+def _in_worker_process() -> bool:
+    # The workers of multiprocessing exit without running the atexit handlers, so they
+    # clean up their scratch directories before returning
+    multiprocessing = sys.modules.get("multiprocessing")
+    return (
+        multiprocessing is not None and multiprocessing.current_process().name != "MainProcess"  # type: ignore
+    )
+
+
+def _remove(path: str, contents_only: bool = False) -> bool:
+    for attempt in range(_CLEANUP_ATTEMPTS):
+        try:
+            if not contents_only:
+                rmtree(path)
+                return True
+            for entry in os.scandir(path):
+                if entry.is_dir(follow_symlinks=False):
+                    rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+            return True
+        except FileNotFoundError:
+            # Deleted meanwhile, with the directory itself or not
+            if not os.path.isdir(path):
+                return not contents_only
+        except OSError:  # pragma: no cov_4_nix
+            # Git makes its objects read only, and Windows may hold files open for a while
+            _make_writable(path)
+            sleep(attempt)
+    return False  # pragma: no cover
+
+
+def _make_writable(path: str):
+    for directory, _, files in os.walk(path):
+        for name in [directory, *(os.path.join(directory, file) for file in files)]:
+            try:
+                os.chmod(name, os.stat(name).st_mode | stat.S_IWRITE)
+            except OSError:
+                continue
+
+
+@contextmanager
+def rendering(template_dir: Path) -> Iterator[None]:
+    """Serialize the rendering of a template, making the local extensions of the template
+    importable for its duration, see `importing_from`. The templates compiled meanwhile are
+    cached, see `bytecode.caching_templates`."""
+    from .bytecode import caching_templates
+
+    with _RENDER_LOCK, importing_from(template_dir), caching_templates():
+        yield
+
+
+@contextmanager
+def patching(module: Any, name: str, patch: Callable[[Any], Any]) -> Iterator[None]:
+    """Replace the attribute `name` of a module of cookiecutter in the block with what
+    `patch` returns when passed the current one, restoring it on exit.
+
+    Cookiecutter has no extension points for how it renders templates, so the profiling,
+    the hook policies, the limiting to a pathspec, the parallel renders and the bytecode
+    cache all go through here to patch its functions. Patches entered in turn wrap each
+    other. The modules are shared by the whole process, so this must be entered while
+    holding the render lock, see `rendering`, or in a worker process of its own."""
+    original = getattr(module, name)
+    setattr(module, name, patch(original))
+    try:
+        yield
+    finally:
+        setattr(module, name, original)
+
+
+@contextmanager
+def writing_aside(path: Path, directory: bool = False) -> Iterator[Path]:
+    """Write a file, or a directory, of the cache shared by the processes of cruft: the
+    block writes it at the path yielded, next to `path`, and it is moved in place once
+    complete, so that other processes never read it partially written. A directory stored
+    by another process meanwhile is kept."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if directory:
+        partial = mkdtemp(prefix=".", dir=str(path.parent))
+    else:
+        descriptor, partial = mkstemp(prefix=".", dir=str(path.parent))
+        os.close(descriptor)
+    try:
+        yield Path(partial)
+        if not directory:
+            os.replace(partial, str(path))
+        else:
+            try:
+                os.rename(partial, str(path))
+            except OSError:
+                if not path.is_dir():
+                    raise
+    finally:
+        if os.path.isdir(partial):
+            rmtree(partial, ignore_errors=True)
+        elif os.path.lexists(partial):
+            os.unlink(partial)
+
+
+@contextmanager
+def importing_from(template_dir: Path) -> Iterator[None]:
+    """Make the local extensions of a template importable in the block.
+
+    The extension modules are forgotten afterwards, so that templates using the same module
+    names don't pick up each other's extensions."""
+    path = str(Path(template_dir).resolve())
+    extended = path not in sys.path
+    if extended:
+        sys.path.append(path)
+    try:
+        yield
+    finally:
+        if extended:
+            sys.path.remove(path)
+            for name, module in list(sys.modules.items()):
+                module_file = getattr(module, "__file__", None) or ""
+                if module_file.startswith(path + os.sep):
+                    del sys.modules[name]
+
+
+def link_tree(source_dir: Path, destination_dir: Path):
+    """Copy a directory by hard linking its files, or copying them across filesystems.
+
+    The files are shared, so they must be replaced rather than modified in place."""
+    try:
+        copytree(str(source_dir), str(destination_dir), symlinks=True, copy_function=os.link)
+    except OSError:
+        rmtree(destination_dir, ignore_errors=True)
+        copytree(str(source_dir), str(destination_dir), symlinks=True)
+
+
+def absolute_path(path: Path) -> Path:
+    """Make a path absolute, without being affected by a render in another thread
+    temporarily changing the working directory."""
+    with _RENDER_LOCK:
+        return path.absolute()
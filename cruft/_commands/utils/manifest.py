@@ -0,0 +1,193 @@
+import json
+import os
+import stat
+from fnmatch import fnmatchcase
+from hashlib import sha256
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple, Union
+
+from .cache import get_render_key
+from .cruft import CruftState, get_extra_context
+
+MANIFEST_FILE = ".cruft-manifest.json"
+_VERSION = 1
+
+
+class FileEntry(NamedTuple):
+    """A rendered file, with its mode normalized like git does."""
+
+    mode: int
+    size: int
+    sha256: str
+
+    def __str__(self) -> str:
+        return f"{self.mode:o} {self.size} {self.sha256}"
+
+    @classmethod
+    def parse(cls, text: str) -> "FileEntry":
+        mode, size, digest = text.split(" ")
+        return cls(int(mode, 8), int(size), digest)
+
+
+Manifest = Dict[str, FileEntry]
+# Whether each skipped path is a glob pattern, and its parts
+SkipParts = List[Tuple[bool, Tuple[str, ...]]]
+
+
+class Drift(NamedTuple):
+    """The paths of a project differing from its rendered template."""
+
+    drifted: List[str]
+    deleted: List[str]
+    extra: List[str]
+
+    def __bool__(self) -> bool:
+        return bool(self.drifted or self.deleted or self.extra)
+
+
+def get_manifest_file(project_dir: Path) -> Path:
+    return project_dir / MANIFEST_FILE
+
+
+def get_manifest(directory: Path) -> Manifest:
+    """The mode, size and content hash of every file of a rendered template, by relative
+    path. The files of cruft itself are left out."""
+    manifest: Manifest = {}
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files) + [name for name in dirs if os.path.islink(Path(root, name))]:
+            path = Path(root, name)
+            relative_path = path.relative_to(directory).as_posix()
+            if not is_cruft_file(relative_path):
+                path_stat = path.lstat()
+                manifest[relative_path] = FileEntry(
+                    _get_mode(path_stat), path_stat.st_size, get_file_hash(path)
+                )
+    return manifest
+
+
+def get_file_hash(path: Path) -> str:
+    if path.is_symlink():
+        return sha256(os.readlink(str(path)).encode()).hexdigest()
+    digest = sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_state_key(cruft_state: CruftState, commit: str) -> List[str]:
+    """What a render depends on: the template, its directory and commit, and the variables."""
+    return list(get_render_key(cruft_state, commit, get_extra_context(cruft_state)))
+
+
+def save_manifest(project_dir: Path, manifest: Manifest, cruft_state: CruftState):
+    """Store the manifest of the template rendered for the cruft state of the project."""
+    content = {
+        "version": _VERSION,
+        "key": get_state_key(cruft_state, cruft_state["commit"]),
+        "files": {path: str(entry) for path, entry in sorted(manifest.items())},
+    }
+    get_manifest_file(project_dir).write_text(json.dumps(content, indent=2) + "\n")
+
+
+def load_manifest(project_dir: Path, cruft_state: CruftState) -> Optional[Manifest]:
+    """The manifest of the project, unless it is missing or was written for another cruft
+    state, for instance by an older version of cruft."""
+    try:
+        content = json.loads(get_manifest_file(project_dir).read_text())
+        if content.get("version") != _VERSION or content.get("key") != get_state_key(
+            cruft_state, cruft_state["commit"]
+        ):
+            return None
+        return {path: FileEntry.parse(entry) for path, entry in content["files"].items()}
+    except (OSError, ValueError, KeyError, AttributeError):
+        return None
+
+
+def get_drift(
+    project_dir: Path, manifest: Manifest, skip_paths: Optional[Set[Union[str, Path]]] = None
+) -> Drift:
+    """Compare the project to the manifest of its template, in a single pass.
+
+    Only the files whose size matches are hashed. Extra files are only looked for in the
+    directories holding files of the template, and paths skipped by cruft are left out."""
+    skip_parts = get_skip_parts(skip_paths or ())
+    drifted, deleted = [], []
+    directories: Set[str] = set()
+    for relative_path, entry in manifest.items():
+        directories.update(parent.as_posix() for parent in PurePosixPath(relative_path).parents)
+        if is_skipped(relative_path, skip_parts):
+            continue
+        path = project_dir / relative_path
+        try:
+            path_stat = path.lstat()
+        except FileNotFoundError:
+            deleted.append(relative_path)
+            continue
+        if (_get_mode(path_stat), path_stat.st_size) != (entry.mode, entry.size):
+            drifted.append(relative_path)
+        elif get_file_hash(path) != entry.sha256:
+            drifted.append(relative_path)
+
+    extra = []
+    for directory in sorted(directories | {"."}):
+        try:
+            entries = list(os.scandir(project_dir / directory))
+        except OSError:
+            continue
+        for dir_entry in entries:
+            relative_path = (PurePosixPath(directory) / dir_entry.name).as_posix()
+            if (
+                relative_path not in manifest
+                and not dir_entry.is_dir(follow_symlinks=False)
+                and dir_entry.name != ".git"
+                and not is_cruft_file(relative_path)
+                and not is_skipped(relative_path, skip_parts)
+            ):
+                extra.append(relative_path)
+    return Drift(drifted, deleted, sorted(extra))
+
+
+def _get_mode(path_stat: os.stat_result) -> int:
+    # Git only tracks links and the executable bit, which umasks and checkouts don't change
+    if stat.S_ISLNK(path_stat.st_mode):
+        return 0o120000
+    return 0o100755 if path_stat.st_mode & stat.S_IXUSR else 0o100644
+
+
+def is_cruft_file(relative_path: str) -> bool:
+    """Whether a path holds the state of cruft rather than a file of the project."""
+    return relative_path == ".cruft.json" or (
+        relative_path.startswith(".cruft-") and "/" not in relative_path
+    )
+
+
+def get_skip_parts(skip_paths: Iterable[Union[str, Path]]) -> SkipParts:
+    """The parts of skipped paths, see `generate.get_skip_paths`, for `is_skipped`."""
+    return [
+        (isinstance(skip, str), PurePosixPath(Path(skip).as_posix()).parts) for skip in skip_paths
+    ]
+
+
+def is_skipped(relative_path: str, skip_parts: SkipParts) -> bool:
+    """Whether a path relative to the project is one of the skipped paths or below one, the
+    paths given as strings being glob patterns."""
+    parts = PurePosixPath(relative_path).parts
+    for is_pattern, skip in skip_parts:
+        if is_pattern and _matches(parts, skip):
+            return True
+        if not is_pattern and parts[: len(skip)] == skip:
+            return True
+    return False
+
+
+def _matches(parts: Sequence[str], pattern: Sequence[str]) -> bool:
+    # Like the glob patterns of skipped paths, which skip the content of matched directories
+    if not pattern:
+        return True
+    if not parts:
+        return False
+    if pattern[0] == "**":
+        return any(_matches(parts[index:], pattern[1:]) for index in range(len(parts) + 1))
+    return fnmatchcase(parts[0], pattern[0]) and _matches(parts[1:], pattern[1:])
@@ -0,0 +1,249 @@
+import filecmp
+import os
+import stat
+from hashlib import sha256
+from pathlib import Path, PurePosixPath
+from shutil import copy2
+from tempfile import mkstemp
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Union
+
+from .config import get_setting
+from .manifest import (
+    FileEntry,
+    Manifest,
+    get_file_hash,
+    get_skip_parts,
+    is_cruft_file,
+    is_skipped,
+)
+
+# The files larger than this are kept on disk rather than in memory
+SPILL_SIZE = 1024 * 1024
+
+
+def is_memory_render_enabled() -> bool:
+    """Whether templates are rendered in memory, set with CRUFT_MEMORY_RENDERS or
+    `memory_renders` in the configuration file."""
+    setting = get_setting("memory_renders", "CRUFT_MEMORY_RENDERS")
+    return (setting or "0").lower() not in ("0", "false", "no", "off")
+
+
+class MemoryFile(NamedTuple):
+    """A rendered file: its mode, and its content or the file holding it once spilled. The
+    content of links is their target."""
+
+    mode: int
+    data: Optional[bytes]
+    spilled: Optional[Path]
+
+    @property
+    def size(self) -> int:
+        return len(self.data) if self.data is not None else os.path.getsize(self.spilled)  # type: ignore
+
+    def read(self) -> bytes:
+        return self.data if self.data is not None else self.spilled.read_bytes()  # type: ignore
+
+    def same_content(self, path: Union[Path, "MemoryFile"]) -> bool:
+        """Whether a file, or another rendered file, has the same content."""
+        if isinstance(path, MemoryFile):
+            if path.spilled is None:
+                return path.size == self.size and path.read() == self.read()
+            path = path.spilled
+        if self.spilled is not None:
+            return filecmp.cmp(str(self.spilled), str(path), shallow=False)
+        return os.path.getsize(path) == self.size and path.read_bytes() == self.data
+
+
+class MemoryTree:
+    """A render held in memory, as its files and directories by path relative to the
+    generated project.
+
+    Only the files which differ from another render or from the project are written to
+    disk, see `write_changes` and `write_drift`."""
+
+    def __init__(self, spill_dir: Path):
+        self.spill_dir = spill_dir
+        self.files: Dict[str, MemoryFile] = {}
+        self.directories: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def copy(self) -> "MemoryTree":
+        # The content of the files is shared, as it is never modified
+        tree = MemoryTree(self.spill_dir)
+        tree.files, tree.directories = dict(self.files), set(self.directories)
+        return tree
+
+    def add(self, path: str, data: bytes, mode: int):
+        spilled = None
+        if len(data) > SPILL_SIZE:
+            spilled = self._spill_path()
+            spilled.write_bytes(data)
+        self._add(path, MemoryFile(mode, None if spilled else data, spilled))
+
+    def add_file(self, path: str, source: Path, move: bool = False):
+        """Add the file or link `source` at path, moving it aside if large and asked to."""
+        source_stat = source.lstat()
+        if stat.S_ISLNK(source_stat.st_mode):
+            target = os.readlink(str(source)).encode()
+            self._add(path, MemoryFile(stat.S_IFLNK | 0o777, target, None))
+        elif source_stat.st_size > SPILL_SIZE:
+            spilled = self._spill_path()
+            if move:
+                os.replace(str(source), str(spilled))
+            else:
+                copy2(str(source), str(spilled))
+            self._add(path, MemoryFile(source_stat.st_mode, None, spilled))
+        else:
+            self._add(path, MemoryFile(source_stat.st_mode, source.read_bytes(), None))
+
+    def load(self, directory: Path):
+        """Add the files generated in directory which the tree doesn't hold, moving them."""
+        for root, dirs, names in os.walk(directory):
+            relative_root = Path(root).relative_to(directory)
+            for name in list(dirs):
+                relative_path = (relative_root / name).as_posix()
+                if os.path.islink(os.path.join(root, name)):
+                    # Generated as links to directories, which aren't walked through
+                    names.append(name)
+                    dirs.remove(name)
+                else:
+                    self.directories.add(relative_path)
+            for name in names:
+                relative_path = (relative_root / name).as_posix()
+                if relative_path not in self.files:
+                    self.add_file(relative_path, Path(root, name), move=True)
+
+    def paths(self) -> Iterator[str]:
+        """The files and directories of the tree, like the paths of a render on disk."""
+        yield from self.directories
+        yield from self.files
+
+    def remove(self, paths: Iterable[Union[str, Path]]):
+        """Remove files and directories with their content, by path or glob pattern, like
+        `generate.remove_unwanted_paths` on disk."""
+        skip_parts = get_skip_parts(paths)
+        if not skip_parts:
+            return
+        for relative_path in [path for path in self.files if is_skipped(path, skip_parts)]:
+            del self.files[relative_path]
+        self.directories = {path for path in self.directories if not is_skipped(path, skip_parts)}
+
+    def clear(self):
+        self.files.clear()
+        self.directories.clear()
+
+    def get_manifest(self) -> Manifest:
+        """The manifest of the render, like `manifest.get_manifest` on disk."""
+        manifest = {}
+        for relative_path in sorted(self.files):
+            if is_cruft_file(relative_path):
+                continue
+            file = self.files[relative_path]
+            digest = (
+                sha256(file.data).hexdigest()
+                if file.data is not None
+                else get_file_hash(file.spilled)  # type: ignore
+            )
+            manifest[relative_path] = FileEntry(_get_git_mode(file.mode), file.size, digest)
+        return manifest
+
+    def write(self, directory: Path, paths: Optional[Iterable[str]] = None):
+        """Write the files of the tree, or only the given ones, to directory."""
+        for relative_path in sorted(self.files if paths is None else paths):
+            file = self.files[relative_path]
+            path = directory / relative_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if stat.S_ISLNK(file.mode):
+                os.symlink(file.read().decode(), str(path))
+            elif file.spilled is not None:
+                copy2(str(file.spilled), str(path))
+            else:
+                path.write_bytes(file.data)  # type: ignore
+            if not stat.S_ISLNK(file.mode):
+                os.chmod(str(path), stat.S_IMODE(file.mode))
+        if paths is None:
+            for relative_path in self.directories:
+                (directory / relative_path).mkdir(parents=True, exist_ok=True)
+
+    def _add(self, path: str, file: MemoryFile):
+        self.files[path] = file
+        self.directories.update(
+            parent.as_posix() for parent in PurePosixPath(path).parents if parent.name
+        )
+
+    def _spill_path(self) -> Path:
+        # The renders of a command may share their spill directory
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        descriptor, path = mkstemp(dir=str(self.spill_dir))
+        os.close(descriptor)
+        return Path(path)
+
+
+def write_changes(
+    old_tree: MemoryTree, new_tree: MemoryTree, old_dir: Path, new_dir: Path
+) -> List[str]:
+    """Write the files differing between two renders to old_dir and new_dir, so that their
+    diff is the diff of the renders, and return their paths."""
+    changed = sorted(
+        path
+        for path in set(old_tree.files) | set(new_tree.files)
+        if not _same_file(old_tree.files.get(path), new_tree.files.get(path))
+    )
+    for tree, directory in ((old_tree, old_dir), (new_tree, new_dir)):
+        directory.mkdir(parents=True, exist_ok=True)
+        tree.write(directory, [path for path in changed if path in tree.files])
+    return changed
+
+
+def write_drift(
+    tree: MemoryTree, project_dir: Path, remote_dir: Path, local_dir: Path
+) -> List[str]:
+    """Write the files of a render differing in the project to remote_dir, and their version
+    in the project to local_dir, so that their diff is the diff of the project with the
+    render, and return their paths."""
+    drifted = []
+    for relative_path, file in sorted(tree.files.items()):
+        local_path = project_dir / relative_path
+        if _matches_project(file, local_path):
+            continue
+        drifted.append(relative_path)
+        destination = local_dir / relative_path
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        copy2(str(local_path), str(destination), follow_symlinks=False)
+    remote_dir.mkdir(parents=True, exist_ok=True)
+    local_dir.mkdir(parents=True, exist_ok=True)
+    tree.write(remote_dir, drifted)
+    return drifted
+
+
+def _same_file(old: Optional[MemoryFile], new: Optional[MemoryFile]) -> bool:
+    if old is None or new is None:
+        return old is new
+    return old.mode == new.mode and new.same_content(old)
+
+
+def _matches_project(file: MemoryFile, local_path: Path) -> bool:
+    try:
+        local_stat = local_path.lstat()
+    except OSError:
+        return False
+    if _get_git_mode(local_stat.st_mode) != _get_git_mode(file.mode):
+        return False
+    if stat.S_ISLNK(local_stat.st_mode):
+        return os.readlink(str(local_path)).encode() == file.read()
+    return stat.S_ISREG(local_stat.st_mode) and file.same_content(local_path)
+
+
+def _get_git_mode(mode: int) -> int:
+    # Like `manifest._get_mode`, from a mode rather than a stat
+    if stat.S_ISLNK(mode):
+        return 0o120000
+    return 0o100755 if mode & stat.S_IXUSR else 0o100644
+
+
+def get_deleted_paths(tree: MemoryTree, project_dir: Path) -> Set[Path]:
+    """The files and directories of a render missing from the project, like
+    `generate._get_deleted_files` on disk."""
+    return {Path(path) for path in tree.paths() if not (project_dir / path).exists()}
@@ -0,0 +1,328 @@
+import atexit
+import json
+import os
+import shutil
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack, contextmanager
+from hashlib import sha256
+from multiprocessing import get_context
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .config import get_setting
+from .iohelper import _in_worker_process, importing_from, patching
+from .profiling import active_profile
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .memtree import MemoryTree
+
+# The files sent to a worker at once, as cookiecutter walks the template
+_BATCH_SIZE = 16
+# The environments kept by each worker, for the renders of update and batch-update
+_ENVIRONMENTS_SIZE = 4
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_key: Optional[Tuple[int, int]] = None
+_pool_lock = Lock()
+_environments: "OrderedDict[str, Any]" = OrderedDict()
+
+
+def get_render_workers() -> int:
+    """The processes rendering the content of template files, set with CRUFT_RENDER_WORKERS
+    or `render_workers` in the configuration file. 1, the default, renders the files one by
+    one like cookiecutter, and 0 starts a process per CPU."""
+    setting = get_setting("render_workers", "CRUFT_RENDER_WORKERS")
+    workers = int(setting) if setting else 1
+    return workers if workers > 0 else os.cpu_count() or 1
+
+
+def get_render_pool(workers: int) -> ProcessPoolExecutor:
+    """The pool of processes rendering template files, started once and reused by the renders
+    of the process."""
+    global _pool, _pool_key
+    key = (workers, os.getpid())
+    with _pool_lock:
+        if _pool is None or _pool_key != key:
+            if _pool is not None and _pool_key is not None and _pool_key[1] == os.getpid():
+                _pool.shutdown(wait=False)
+            # Spawned rather than forked, as the threads of cruft may hold locks meanwhile
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+            _pool_key = key
+        return _pool
+
+
+@atexit.register
+def shutdown_render_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None and _pool_key is not None and _pool_key[1] == os.getpid():
+        pool.shutdown()
+
+
+def _discard_render_pool(pool: ProcessPoolExecutor):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+class _File(NamedTuple):
+    infile: str
+    outfile: str
+
+
+class _Rendered(NamedTuple):
+    """The content of a rendered file, None for binary files copied as is."""
+
+    content: Optional[str]
+    newline: Optional[str]
+    duration: float
+    failed: bool = False
+
+
+@contextmanager
+def parallel_rendering(tree: Optional["MemoryTree"] = None) -> Iterator[None]:
+    """Render the content of the template files generated by cookiecutter in the block in a
+    pool of processes, see `get_render_workers`, and into tree rather than on disk if given.
+
+    Cookiecutter still walks the template, rendering the paths of the directories and files
+    and copying the ones copied without being rendered. The content of the other files is
+    rendered in the pool meanwhile, and written in the same order and with the same
+    permissions as cookiecutter would, before the post generation hook runs. The files
+    failing to render in the pool are rendered again by cookiecutter, to fail the same way.
+    The hooks run on disk, so the files of tree are written to disk before the post
+    generation hook runs, and the tree is emptied."""
+    workers = 1 if _in_worker_process() else get_render_workers()
+    if workers == 1 and tree is None:
+        yield
+        return
+
+    from cookiecutter import generate
+
+    generate_file: Callable = generate.generate_file
+    pool = get_render_pool(workers) if workers > 1 else None
+    files = _DeferredFiles(pool, generate_file, tree)
+
+    def defer(generate_file: Callable) -> Callable:
+        def deferred_generate_file(
+            project_dir: str, infile: str, context, env, skip_if_file_exists: bool = False
+        ):
+            if skip_if_file_exists:
+                # Whether the file exists depends on the files generated before
+                files.flush()
+                generate_file(project_dir, infile, context, env, skip_if_file_exists)
+            else:
+                files.add(project_dir, infile, context, env)
+
+        return deferred_generate_file
+
+    def flush(run_hook: Callable) -> Callable:
+        def flushing_run_hook(repo_dir, hook_name, project_dir, context, delete_project_on_failure):
+            if hook_name == "post_gen_project":
+                files.flush(str(project_dir) if delete_project_on_failure else None)
+                if tree is not None:
+                    tree.write(Path(project_dir))
+                    tree.clear()
+            run_hook(repo_dir, hook_name, project_dir, context, delete_project_on_failure)
+
+        return flushing_run_hook
+
+    with ExitStack() as stack:
+        stack.enter_context(patching(generate, "generate_file", defer))
+        if hasattr(generate, "run_hook_from_repo_dir"):
+            stack.enter_context(patching(generate, "run_hook_from_repo_dir", flush))
+        try:
+            yield
+            files.flush()
+        finally:
+            files.cancel()
+
+
+class _DeferredFiles:
+    """The files of a render sent to the pool, in the order cookiecutter generates them.
+    Without a pool, they are rendered right away."""
+
+    def __init__(
+        self,
+        pool: Optional[ProcessPoolExecutor],
+        generate_file: Callable,
+        tree: Optional["MemoryTree"] = None,
+    ):
+        self.pool = pool
+        self.generate_file = generate_file
+        self.tree = tree
+        self.batches: List[Tuple[Optional["Future[List[_Rendered]]"], List[_File]]] = []
+        self.pending: List[_File] = []
+        self.project_dir = ""
+        self.template_dir = ""
+        self.context: Dict[str, Any] = {}
+        self.environment: Any = None
+        self.key = ""
+
+    def add(self, project_dir: str, infile: str, context: Dict[str, Any], environment: Any):
+        # Cookiecutter generates the files from the directory of the template
+        template_dir = os.getcwd()
+        if (project_dir, template_dir) != (self.project_dir, self.template_dir) or (
+            context is not self.context or environment is not self.environment
+        ):
+            self.flush()
+            self.project_dir, self.template_dir = project_dir, template_dir
+            self.context, self.environment = context, environment
+            self.key = sha256(
+                json.dumps([template_dir, context], sort_keys=True, default=str).encode()
+            ).hexdigest()
+
+        outfile = os.path.join(project_dir, environment.from_string(infile).render(**context))
+        if os.path.isdir(outfile):
+            # The name of the file is empty
+            return
+        if self.pool is None:
+            # From the directory of the template, with the environment of cookiecutter
+            future: "Future[List[_Rendered]]" = Future()
+            future.set_result([_render_file(environment, template_dir, infile, context)])
+            self.batches.append((future, [_File(infile, outfile)]))
+            return
+        self.pending.append(_File(infile, outfile))
+        if len(self.pending) >= _BATCH_SIZE:
+            self._submit()
+
+    def _submit(self):
+        if not self.pending or self.pool is None:
+            return
+        future: Optional["Future[List[_Rendered]]"]
+        try:
+            future = self.pool.submit(
+                _render_files,
+                self.key,
+                self.template_dir,
+                self.context,
+                [file.infile for file in self.pending],
+            )
+        except (BrokenProcessPool, RuntimeError):
+            future = None
+        self.batches.append((future, self.pending))
+        self.pending = []
+
+    def flush(self, delete_project_dir: Optional[str] = None):
+        """Write the files rendered so far, in order."""
+        self._submit()
+        batches, self.batches = self.batches, []
+        profile = active_profile()
+        for future, files in batches:
+            try:
+                results: List[Optional[_Rendered]] = list(future.result()) if future else []
+            except BrokenProcessPool:
+                _discard_render_pool(self.pool)  # type: ignore
+                results = []
+            for file, rendered in zip(files, results + [None] * (len(files) - len(results))):
+                if rendered is None or rendered.failed:
+                    self._generate(file, delete_project_dir)
+                    continue
+                size = self._write(file, rendered)
+                if profile is not None and profile.template_files:
+                    profile.add_file(file.infile, "file", rendered.duration, size)
+
+    def cancel(self):
+        for future, _ in self.batches:
+            if future is not None:
+                future.cancel()
+        self.batches, self.pending = [], []
+
+    def _write(self, file: _File, rendered: _Rendered) -> int:
+        infile = os.path.join(self.template_dir, file.infile)
+        if self.tree is not None:
+            path = os.path.relpath(file.outfile, self.project_dir).replace(os.path.sep, "/")
+            if rendered.content is None:
+                self.tree.add_file(path, Path(os.path.realpath(infile)))
+            else:
+                # Like a file opened with this newline translates the line endings
+                newline = os.linesep if rendered.newline is None else rendered.newline
+                content = rendered.content
+                if newline not in ("", "\n"):
+                    content = content.replace("\n", newline)
+                self.tree.add(path, content.encode("utf-8"), os.stat(infile).st_mode)
+            return self.tree.files[path].size
+
+        if rendered.content is None:
+            shutil.copyfile(infile, file.outfile)
+        else:
+            with open(file.outfile, "w", encoding="utf-8", newline=rendered.newline) as output:
+                output.write(rendered.content)
+        shutil.copymode(infile, file.outfile)
+        return os.path.getsize(file.outfile)
+
+    def _generate(self, file: _File, delete_project_dir: Optional[str]):
+        from cookiecutter.exceptions import UndefinedVariableInTemplate
+        from cookiecutter.utils import rmtree, work_in
+        from jinja2.exceptions import UndefinedError
+
+        with work_in(self.template_dir):
+            try:
+                self.generate_file(self.project_dir, file.infile, self.context, self.environment)
+            except UndefinedError as error:
+                # Like cookiecutter, which fails on the first file it can't render
+                if delete_project_dir:
+                    rmtree(delete_project_dir)
+                raise UndefinedVariableInTemplate(
+                    f"Unable to create file '{file.infile}'", error, self.context
+                ) from error
+
+
+def _render_files(
+    key: str, template_dir: str, context: Dict[str, Any], infiles: List[str]
+) -> List[_Rendered]:
+    # Run by the workers of the pool
+    environment = _get_environment(key, template_dir, context)
+    return [_render_file(environment, template_dir, infile, context) for infile in infiles]
+
+
+def _get_environment(key: str, template_dir: str, context: Dict[str, Any]) -> Any:
+    # Created once per render by each worker, like cookiecutter creates one per render
+    environment = _environments.get(key)
+    if environment is not None:
+        _environments.move_to_end(key)
+        return environment
+
+    from cookiecutter.utils import create_env_with_context
+    from jinja2 import FileSystemLoader
+
+    from .bytecode import caching_templates
+
+    with importing_from(Path(template_dir).parent), caching_templates():
+        environment = create_env_with_context(context)
+    environment.loader = FileSystemLoader(
+        [template_dir, os.path.join(template_dir, os.pardir, "templates")]
+    )
+    _environments[key] = environment
+    while len(_environments) > _ENVIRONMENTS_SIZE:
+        _environments.popitem(last=False)
+    return environment
+
+
+def _render_file(
+    environment: Any, template_dir: str, infile: str, context: Dict[str, Any]
+) -> _Rendered:
+    # Like `cookiecutter.generate.generate_file`
+    from binaryornot.check import is_binary
+
+    start = perf_counter()
+    path = os.path.join(template_dir, infile)
+    try:
+        if is_binary(path):
+            return _Rendered(None, None, perf_counter() - start)
+        template = environment.get_template(infile.replace(os.path.sep, "/"))
+        content = template.render(**context)
+        newline = context["cookiecutter"].get("_new_lines", False)
+        if not newline:
+            with open(path, encoding="utf-8") as source:
+                source.readline()
+            newline = source.newlines[0] if isinstance(source.newlines, tuple) else source.newlines
+    except Exception:
+        return _Rendered(None, None, 0.0, failed=True)
+    return _Rendered(content, newline, perf_counter() - start)
@@ -0,0 +1,92 @@
+import os
+from contextlib import contextmanager
+from fnmatch import fnmatchcase
+from pathlib import Path, PurePosixPath
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Optional, Sequence
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .memtree import MemoryTree
+
+
+def get_pathspec(patterns: Optional[Iterable[str]]) -> Optional[List[str]]:
+    """The patterns limiting a command to some paths of the project, relative to it, or None
+    when the command covers every path."""
+    pathspec = []
+    for pattern in patterns or ():
+        pattern = PurePosixPath(Path(pattern).as_posix()).as_posix().strip("/")
+        if pattern in (".", ""):
+            return None
+        pathspec.append(pattern)
+    return pathspec or None
+
+
+def matches_pathspec(relative_path: str, pathspec: Optional[Sequence[str]]) -> bool:
+    """Whether a path relative to the project, or one of its directories, matches one of the
+    patterns of pathspec. Like in the pathspecs of git, `*` matches `/` as well, so that
+    `.github/*` matches every file below `.github`."""
+    if pathspec is None:
+        return True
+    path = PurePosixPath(relative_path)
+    candidates = [path.as_posix()] + [parent.as_posix() for parent in path.parents if parent.name]
+    return any(fnmatchcase(candidate, pattern) for candidate in candidates for pattern in pathspec)
+
+
+def limit_render(directory: Path, pathspec: Optional[Sequence[str]]):
+    """Remove the files of a render on disk which don't match pathspec, along with the
+    directories left empty."""
+    if pathspec is None:
+        return
+    for root, dirs, names in os.walk(directory, topdown=False):
+        relative_root = Path(root).relative_to(directory)
+        for name in names + [name for name in dirs if os.path.islink(os.path.join(root, name))]:
+            if not matches_pathspec((relative_root / name).as_posix(), pathspec):
+                os.unlink(os.path.join(root, name))
+        if (
+            relative_root.name
+            and not os.listdir(root)
+            and not matches_pathspec(relative_root.as_posix(), pathspec)
+        ):
+            os.rmdir(root)
+
+
+def limit_tree(tree: "MemoryTree", pathspec: Optional[Sequence[str]]):
+    """Remove the files of a render in memory which don't match pathspec, like `limit_render`
+    on disk."""
+    if pathspec is None:
+        return
+    tree.remove([Path(path) for path in tree.files if not matches_pathspec(path, pathspec)])
+    tree.directories = {
+        directory
+        for directory in tree.directories
+        if matches_pathspec(directory, pathspec)
+        or any(path.startswith(f"{directory}/") for path in tree.files)
+    }
+
+
+@contextmanager
+def limiting_render(pathspec: Optional[Sequence[str]]) -> Iterator[None]:
+    """Only render the template files generated by cookiecutter in the block whose path in
+    the project matches pathspec.
+
+    The files copied without being rendered are still copied, and the directories created,
+    see `limit_render` to remove them."""
+    if pathspec is None:
+        yield
+        return
+
+    from cookiecutter import generate
+
+    from .iohelper import patching
+
+    def limit(generate_file: Callable) -> Callable:
+        def limited_generate_file(
+            project_dir: str, infile: str, context, env, skip_if_file_exists: bool = False
+        ):
+            relative_path = env.from_string(infile).render(**context).replace(os.path.sep, "/")
+            if matches_pathspec(relative_path, pathspec):
+                generate_file(project_dir, infile, context, env, skip_if_file_exists)
+
+        return limited_generate_file
+
+    with patching(generate, "generate_file", limit):
+        yield
@@ -0,0 +1,246 @@
+import json
+import os
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from threading import Lock, current_thread, local
+from time import perf_counter
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+)
+
+from . import resources
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .resources import ResourceTracker
+
+_active_profile: Optional["Profile"] = None
+
+# The phases each thread is in, e.g. ["render new", "render new/generate"]
+_phases = local()
+
+# Returned by span when nothing is profiled, so that an unprofiled span costs a global lookup
+_NO_SPAN: ContextManager[None] = nullcontext()
+
+
+class Span(NamedTuple):
+    """A timed phase. Nested phases are named after their parents, e.g. `clone/fetch`."""
+
+    name: str
+    start: float
+    duration: float
+    thread: str
+
+
+class RenderedFile(NamedTuple):
+    """A template file rendered, or a hook run, in the phase `phase`."""
+
+    name: str
+    kind: str
+    phase: str
+    duration: float
+    # The size of the rendered file, None for hooks
+    size: Optional[int]
+
+
+class PhaseTotal(NamedTuple):
+    name: str
+    calls: int
+    total: float
+    max: float
+    first_start: float
+
+
+class Profile:
+    """The phases timed while a profile is active, see `profiling`.
+
+    With `template_files`, the rendering of each template file and hook is timed as well."""
+
+    def __init__(self, template_files: bool = False):
+        self.start = perf_counter()
+        self.template_files = template_files
+        self.spans: List[Span] = []
+        self.files: List[RenderedFile] = []
+        self._lock = Lock()
+
+    def add_span(self, name: str, start: float, duration: float):
+        with self._lock:
+            self.spans.append(Span(name, start - self.start, duration, current_thread().name))
+
+    def add_file(self, name: str, kind: str, duration: float, size: Optional[int] = None):
+        phase = current_phase() or ""
+        with self._lock:
+            self.files.append(RenderedFile(name, kind, phase, duration, size))
+
+    def slowest_files(self, count: int = 10) -> List[RenderedFile]:
+        with self._lock:
+            files = list(self.files)
+        return sorted(files, key=lambda file: file.duration, reverse=True)[:count]
+
+    def phases(self) -> List[PhaseTotal]:
+        """The spans aggregated by name, in the order the phases were first entered."""
+        totals: Dict[str, PhaseTotal] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            phase = totals.get(span.name)
+            if phase is None:
+                totals[span.name] = PhaseTotal(
+                    span.name, 1, span.duration, span.duration, span.start
+                )
+            else:
+                totals[span.name] = PhaseTotal(
+                    span.name,
+                    phase.calls + 1,
+                    phase.total + span.duration,
+                    max(phase.max, span.duration),
+                    min(phase.first_start, span.start),
+                )
+        return sorted(totals.values(), key=lambda phase: (phase.first_start, phase.name))
+
+    def table(self) -> str:
+        """A human readable table of the time spent in each phase."""
+        rows = [f"{'Phase':<44} {'Calls':>5} {'Total':>9} {'Max':>9}"]
+        for phase in self.phases():
+            *parents, name = phase.name.split("/")
+            rows.append(
+                f"{'  ' * len(parents) + name:<44} {phase.calls:>5}"
+                f" {phase.total:>8.3f}s {phase.max:>8.3f}s"
+            )
+        rows.append(f"{'total':<44} {'':>5} {perf_counter() - self.start:>8.3f}s")
+        return "\n".join(rows)
+
+    def files_table(self, count: int = 10) -> str:
+        """A human readable table of the `count` slowest template files and hooks."""
+        rows = [f"{'Slowest template files':<44} {'Phase':<24} {'Time':>9} {'Size':>10}"]
+        for file in self.slowest_files(count):
+            name = file.name if file.kind == "file" else f"{file.name} ({file.kind})"
+            size = "" if file.size is None else f"{file.size}B"
+            rows.append(f"{name:<44} {file.phase:<24} {file.duration:>8.3f}s {size:>10}")
+        return "\n".join(rows)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "total": perf_counter() - self.start,
+            "phases": [phase._asdict() for phase in self.phases()],
+            "spans": [span._asdict() for span in spans],
+            "files": [file._asdict() for file in self.slowest_files(len(self.files))],
+        }
+
+    def write_json(self, path: Path):
+        path.write_text(json.dumps(self.to_dict(), indent=2) + "\n")
+
+
+class _SpanTimer:
+    __slots__ = ("profile", "tracker", "name", "start")
+
+    def __init__(self, profile: Optional[Profile], tracker: Optional["ResourceTracker"], name: str):
+        self.profile = profile
+        self.tracker = tracker
+        self.name = name
+
+    def __enter__(self):
+        stack = _phase_stack()
+        phase = f"{stack[-1]}/{self.name}" if stack else self.name
+        stack.append(phase)
+        if self.tracker is not None:
+            self.tracker.enter_phase(phase)
+        self.start = perf_counter()
+
+    def __exit__(self, exc, value, tb):
+        duration = perf_counter() - self.start
+        phase = _phase_stack().pop()
+        if self.profile is not None:
+            self.profile.add_span(phase, self.start, duration)
+        if self.tracker is not None:
+            # Raises when a budget was exceeded during the phase, unless it already failed
+            self.tracker.exit_phase(phase, check=exc is None)
+
+
+def _phase_stack() -> List[str]:
+    stack = getattr(_phases, "stack", None)
+    if stack is None:
+        stack = _phases.stack = []
+    return stack
+
+
+def current_phase() -> Optional[str]:
+    """The innermost phase the current thread is in, if any."""
+    stack = _phase_stack()
+    return stack[-1] if stack else None
+
+
+def span(name: str) -> ContextManager[None]:
+    """Time the enclosed block as the phase `name` of the active profile, if any, and track
+    the resources it uses if resources are tracked."""
+    profile = _active_profile
+    tracker = resources._active_tracker
+    if profile is None and tracker is None:
+        return _NO_SPAN
+    return _SpanTimer(profile, tracker, name)
+
+
+def active_profile() -> Optional[Profile]:
+    return _active_profile
+
+
+@contextmanager
+def profiling(profile: Optional[Profile] = None) -> Iterator[Profile]:
+    """Time the phases of the commands run in the block."""
+    global _active_profile
+    profile = profile or Profile()
+    previous, _active_profile = _active_profile, profile
+    try:
+        yield profile
+    finally:
+        _active_profile = previous
+
+
+@contextmanager
+def timing_template_files() -> Iterator[None]:
+    """Time each template file rendered and hook run by cookiecutter in the block, if the
+    active profile asks for it."""
+    profile = _active_profile
+    if profile is None or not profile.template_files:
+        yield
+        return
+
+    from cookiecutter import generate, hooks
+
+    from .iohelper import patching
+
+    def time_generate_file(generate_file: Callable) -> Callable:
+        def timed_generate_file(project_dir: str, infile: str, context, env, *args, **kwargs):
+            start = perf_counter()
+            generate_file(project_dir, infile, context, env, *args, **kwargs)
+            duration = perf_counter() - start
+            outfile = os.path.join(project_dir, env.from_string(infile).render(**context))
+            size = os.path.getsize(outfile) if os.path.isfile(outfile) else None
+            profile.add_file(infile, "file", duration, size)  # type: ignore
+
+        return timed_generate_file
+
+    def time_run_script(run_script: Callable) -> Callable:
+        def timed_run_script(script_path: str, *args, **kwargs):
+            start = perf_counter()
+            try:
+                run_script(script_path, *args, **kwargs)
+            finally:
+                hook_name = os.path.join("hooks", os.path.basename(script_path))
+                profile.add_file(hook_name, "hook", perf_counter() - start)  # type: ignore
+
+        return timed_run_script
+
+    with patching(generate, "generate_file", time_generate_file), patching(
+        hooks, "run_script_with_context", time_run_script
+    ):
+        yield
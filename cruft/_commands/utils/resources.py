@@ -0,0 +1,239 @@
+import os
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import ContextManager, Dict, Iterator, List, NamedTuple, Optional, Union
+
+from cruft.exceptions import ResourceBudgetExceeded
+
+_active_tracker: Optional["ResourceTracker"] = None
+
+MEMORY = "memory"
+TEMPORARY_DISK = "temporary disk"
+
+
+class ResourceUsage(NamedTuple):
+    rss_bytes: int
+    temp_bytes: int
+
+    def peak(self, other: "ResourceUsage") -> "ResourceUsage":
+        return ResourceUsage(
+            max(self.rss_bytes, other.rss_bytes), max(self.temp_bytes, other.temp_bytes)
+        )
+
+
+class ResourceTracker:
+    """The peak memory and temporary disk usage of each phase, see `tracking`.
+
+    The resident memory of the process and the bytes held in the temporary directories of
+    cruft are sampled in a background thread every `interval` seconds, and when a phase
+    starts or ends. A budget exceeded aborts the command with `ResourceBudgetExceeded` at
+    the end of the current phase, or when it next creates a temporary directory."""
+
+    def __init__(
+        self,
+        max_rss_bytes: Optional[int] = None,
+        max_temp_bytes: Optional[int] = None,
+        interval: float = 0.1,
+    ):
+        self.max_rss_bytes = max_rss_bytes
+        self.max_temp_bytes = max_temp_bytes
+        self.interval = interval
+        self.peak = ResourceUsage(0, 0)
+        self.phases: Dict[str, ResourceUsage] = {}
+        self._open_phases: Dict[str, int] = {}
+        self._temp_dirs: Dict[str, int] = {}
+        self._exceeded: Optional[ResourceBudgetExceeded] = None
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = Thread(target=self._run, name="cruft-resources", daemon=True)
+
+    def start(self):
+        self.sample()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> ResourceUsage:
+        with self._lock:
+            temp_dirs = list(self._temp_dirs)
+        usage = ResourceUsage(
+            get_rss_bytes(), sum(get_tree_size(Path(temp_dir)) for temp_dir in temp_dirs)
+        )
+        with self._lock:
+            self.peak = self.peak.peak(usage)
+            for phase in self._open_phases:
+                self.phases[phase] = self.phases.get(phase, usage).peak(usage)
+            if self._exceeded is None:
+                self._exceeded = self._over_budget(usage)
+        return usage
+
+    def _over_budget(self, usage: ResourceUsage) -> Optional[ResourceBudgetExceeded]:
+        phases = sorted(self._open_phases, key=len)
+        phase = phases[-1] if phases else None
+        if self.max_rss_bytes is not None and usage.rss_bytes > self.max_rss_bytes:
+            return ResourceBudgetExceeded(MEMORY, usage.rss_bytes, self.max_rss_bytes, phase)
+        if self.max_temp_bytes is not None and usage.temp_bytes > self.max_temp_bytes:
+            return ResourceBudgetExceeded(
+                TEMPORARY_DISK, usage.temp_bytes, self.max_temp_bytes, phase
+            )
+        return None
+
+    def check(self):
+        """Raise if a budget was exceeded since the tracking started."""
+        if self._exceeded is not None:
+            raise self._exceeded
+
+    def enter_phase(self, phase: str):
+        with self._lock:
+            self._open_phases[phase] = self._open_phases.get(phase, 0) + 1
+        self.sample()
+        self.check()
+
+    def exit_phase(self, phase: str, check: bool = True):
+        self.sample()
+        with self._lock:
+            self._open_phases[phase] -= 1
+            if not self._open_phases[phase]:
+                del self._open_phases[phase]
+        if check:
+            self.check()
+
+    def add_temp_dir(self, path: str):
+        self.check()
+        with self._lock:
+            self._temp_dirs[path] = self._temp_dirs.get(path, 0) + 1
+
+    def remove_temp_dir(self, path: str):
+        # Measured one last time before being deleted
+        self.sample()
+        with self._lock:
+            self._temp_dirs[path] -= 1
+            if not self._temp_dirs[path]:
+                del self._temp_dirs[path]
+
+    def table(self) -> str:
+        """A human readable table of the peak usage of each phase."""
+        rows = [f"{'Phase':<44} {'Peak memory':>12} {'Peak temp':>12}"]
+        with self._lock:
+            phases: List[str] = list(self.phases)
+            usages = dict(self.phases)
+        for phase in phases:
+            *parents, name = phase.split("/")
+            usage = usages[phase]
+            rows.append(
+                f"{'  ' * len(parents) + name:<44} {format_size(usage.rss_bytes):>12}"
+                f" {format_size(usage.temp_bytes):>12}"
+            )
+        rows.append(
+            f"{'peak':<44} {format_size(self.peak.rss_bytes):>12}"
+            f" {format_size(self.peak.temp_bytes):>12}"
+        )
+        return "\n".join(rows)
+
+    def to_dict(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            phases = dict(self.phases)
+        return {
+            "peak": self.peak._asdict(),
+            **{phase: usage._asdict() for phase, usage in phases.items()},
+        }
+
+
+def active_tracker() -> Optional[ResourceTracker]:
+    return _active_tracker
+
+
+@contextmanager
+def tracking(tracker: Optional[ResourceTracker] = None) -> Iterator[ResourceTracker]:
+    """Track the memory and temporary disk used by the commands run in the block, enforcing
+    the budgets of the tracker if any."""
+    global _active_tracker
+    tracker = tracker or ResourceTracker()
+    previous, _active_tracker = _active_tracker, tracker
+    tracker.start()
+    try:
+        yield tracker
+    finally:
+        _active_tracker = previous
+        tracker.stop()
+
+
+def resource_limits(
+    max_memory: Optional[Union[int, str]] = None, max_temp: Optional[Union[int, str]] = None
+) -> ContextManager[ResourceTracker]:
+    """Abort the commands run in the block when they use more memory or temporary disk than
+    allowed, given in bytes or as sizes such as `512M` or `2G`.
+
+    Yields the tracker, holding the peak usage of each phase once the block completes."""
+    return tracking(
+        ResourceTracker(
+            None if max_memory is None else parse_size(str(max_memory)),
+            None if max_temp is None else parse_size(str(max_temp)),
+        )
+    )
+
+
+def get_rss_bytes() -> int:
+    """The resident memory of this process, git processes excluded."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:  # pragma: no cover
+        return 0
+    # Only the peak is available elsewhere, in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def get_tree_size(directory: Path) -> int:
+    """The bytes held by the files of a directory, which may change while it is measured."""
+    size = 0
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                size += get_tree_size(Path(entry.path))
+            else:
+                size += entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            continue
+    return size
+
+
+_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(size: str) -> int:
+    """Parse a number of bytes such as `512M` or `2G`."""
+    text = size.strip().upper()
+    if text.endswith("B"):
+        text = text[:-1]
+    unit = text[-1:] if text[-1:] in _UNITS else ""
+    try:
+        return int(float(text[: len(text) - len(unit)]) * _UNITS[unit])
+    except ValueError:
+        raise ValueError(f"Invalid size {size!r}, expected e.g. 512M or 2G")
+
+
+def format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024  # type: ignore
+    return f"{size:.1f}TB"
@@ -0,0 +1,115 @@
+import io
+import json
+import os
+import stat
+import tarfile
+from pathlib import Path
+from shutil import copyfileobj, rmtree
+from typing import Optional
+
+from .cache import CookiecutterContext
+from .cruft import CruftState
+from .manifest import Manifest, get_manifest, get_state_key, is_cruft_file
+
+SNAPSHOT_FILE = ".cruft-snapshot.tar.gz"
+_MANIFEST = "manifest.json"
+_FILES = "files"
+_VERSION = 1
+
+
+def get_snapshot_file(project_dir: Path) -> Path:
+    return project_dir / SNAPSHOT_FILE
+
+
+def save_snapshot(
+    project_dir: Path,
+    render_dir: Path,
+    cruft_state: CruftState,
+    context: CookiecutterContext,
+    manifest: Optional[Manifest] = None,
+):
+    """Store the render of the template the project is linked to, as described by its cruft
+    state, next to the project.
+
+    The render is kept whole, before any skipped or deleted path is removed, along with a
+    manifest of its files, so that later updates and diffs can restore it instead of
+    checking out and rendering the template again."""
+    if manifest is None:
+        manifest = get_manifest(render_dir)
+    content = {
+        "version": _VERSION,
+        "key": get_state_key(cruft_state, cruft_state["commit"]),
+        "context": context,
+        "files": {path: str(entry) for path, entry in manifest.items()},
+    }
+    snapshot_file = get_snapshot_file(project_dir)
+    # Excluded from the render along with the other files of cruft, see `get_manifest`
+    partial_file = snapshot_file.with_name(f"{SNAPSHOT_FILE}.partial")
+    with tarfile.open(str(partial_file), "w:gz") as snapshot:
+        data = json.dumps(content, sort_keys=True, default=str).encode()
+        info = tarfile.TarInfo(_MANIFEST)
+        info.size = len(data)
+        snapshot.addfile(info, io.BytesIO(data))
+        snapshot.add(
+            str(render_dir),
+            arcname=_FILES,
+            filter=lambda info: None if is_cruft_file(info.name[len(_FILES) + 1 :]) else info,
+        )
+    os.replace(str(partial_file), str(snapshot_file))
+
+
+def restore_snapshot(
+    snapshot_file: Path, cruft_state: CruftState, commit: str, output_dir: Path
+) -> Optional[CookiecutterContext]:
+    """Extract the render of the template at `commit` into output_dir and return its
+    context, if the snapshot holds this render."""
+    if not snapshot_file.is_file():
+        return None
+    key = get_state_key(cruft_state, commit)
+    try:
+        # Read as a stream, the manifest first, as seeking back in a compressed file is slow
+        with tarfile.open(str(snapshot_file), "r|gz") as snapshot:
+            member = snapshot.next()
+            manifest_file = snapshot.extractfile(member) if member else None
+            if member is None or member.name != _MANIFEST or manifest_file is None:
+                return None
+            manifest = json.loads(manifest_file.read())
+            if manifest.get("version") != _VERSION or manifest.get("key") != key:
+                return None
+            output_dir.mkdir(parents=True, exist_ok=True)
+            for member in snapshot:
+                if member.name.startswith(f"{_FILES}/"):
+                    _extract(snapshot, member, output_dir, member.name[len(_FILES) + 1 :])
+    except (OSError, EOFError, ValueError, tarfile.TarError):
+        # Rendered again instead, like any outdated snapshot
+        rmtree(output_dir, ignore_errors=True)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        return None
+    return manifest["context"]
+
+
+def _extract(snapshot: tarfile.TarFile, member: tarfile.TarInfo, output_dir: Path, name: str):
+    # Like the `data` filter of tarfile: nothing is written outside output_dir, even through
+    # the symbolic links extracted before, and no link points outside of it
+    root = os.path.realpath(output_dir)
+    path = Path(os.path.realpath(output_dir / name))
+    if Path(name).is_absolute() or not _is_within(root, str(path)):
+        raise ValueError(f"Unsafe path {member.name} in the snapshot")
+    if member.isdir():
+        path.mkdir(parents=True, exist_ok=True)
+        path.chmod(stat.S_IMODE(member.mode) | stat.S_IWUSR)
+    elif member.issym():
+        target = os.path.join(os.path.dirname(path), member.linkname)
+        if os.path.isabs(member.linkname) or not _is_within(root, os.path.realpath(target)):
+            raise ValueError(f"Unsafe link {member.name} in the snapshot")
+        os.symlink(member.linkname, str(path))
+    elif member.isfile():
+        source = snapshot.extractfile(member)
+        assert source is not None  # nosec B101 (allow assert for type checking)
+        with source, open(path, "wb") as destination:
+            copyfileobj(source, destination)
+        path.chmod(stat.S_IMODE(member.mode))
+
+
+def _is_within(root: str, path: str) -> bool:
+    return path == root or path.startswith(root + os.sep)
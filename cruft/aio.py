@@ -0,0 +1,307 @@
+"""Asyncio counterparts of the cruft commands.
+
+These coroutines let a single event loop drive many cruft operations at once. Git is run
+through asyncio subprocesses, which are killed if the calling task is cancelled, while the
+CPU bound template rendering is offloaded to the loop's default executor. Every coroutine
+accepts an optional `limiter`, any async context manager such as an `asyncio.Semaphore`
+shared between calls, to bound the number of operations running concurrently.
+
+Only the git work overlaps: cookiecutter changes the working directory of the process while
+it renders, so the renders of every coroutine, and of any other thread, run one at a time.
+Many projects of the same template are better updated with `cruft.batch_update`.
+"""
+
+import asyncio
+import json
+import os
+import signal
+from contextlib import asynccontextmanager
+from pathlib import Path
+from subprocess import PIPE, CalledProcessError  # nosec
+from time import perf_counter
+from typing import Any, AsyncContextManager, AsyncIterator, Dict, List, Optional
+
+import typer
+
+from cruft._commands import utils
+from cruft._commands.diff import _diff_snapshot, _diff_with_repo, _quick_diff
+from cruft._commands.update import _load_update_inputs, _update_with_repo
+from cruft._commands.utils.gitrunner import Repo, active_accounting, get_timeout
+from cruft._commands.utils.iohelper import AltTemporaryDirectory, absolute_path
+from cruft.exceptions import GitTimeout, InvalidCookiecutterRepository
+
+__all__ = ["check", "diff", "update"]
+
+
+async def check(
+    project_dir: Path = Path("."),
+    checkout: Optional[str] = None,
+    strict: bool = True,
+    *,
+    limiter: Optional[AsyncContextManager] = None,
+) -> bool:
+    """Checks to see if there have been any updates to the Cookiecutter template
+    used to generate this project. See `cruft.check`."""
+    project_dir = absolute_path(project_dir)
+    cruft_file = utils.cruft.get_cruft_file(project_dir)
+    cruft_state = json.loads(cruft_file.read_text())
+    async with _limit(limiter):
+        with AltTemporaryDirectory() as repo_dir_:
+            repo_dir = Path(repo_dir_)
+            await _clone(cruft_state["template"], repo_dir, "--filter=blob:none", "--no-checkout")
+            last_commit = await _resolve_commit(cruft_state["template"], repo_dir, checkout)
+            is_updated = await _is_project_updated(
+                repo_dir, cruft_state["commit"], last_commit, checkout is not None, strict
+            )
+
+    if is_updated:
+        typer.secho(
+            "SUCCESS: Good work! Project's cruft is up to date and as clean as possible :).",
+            fg=typer.colors.GREEN,
+        )
+        return True
+    typer.secho(
+        "FAILURE: Project's cruft is out of date! Run `cruft update` to clean this mess up.",
+        fg=typer.colors.RED,
+    )
+    return False
+
+
+async def diff(
+    project_dir: Path = Path("."),
+    exit_code: bool = False,
+    checkout: Optional[str] = None,
+    quick: bool = False,
+    paths: Optional[List[str]] = None,
+    *,
+    limiter: Optional[AsyncContextManager] = None,
+) -> bool:
+    """Show the diff between the project and the linked Cookiecutter template.
+    See `cruft.diff`."""
+    project_dir = absolute_path(project_dir)
+    cruft_file = utils.cruft.get_cruft_file(project_dir)
+    cruft_state = json.loads(cruft_file.read_text())
+    pathspec = utils.pathspec.get_pathspec(paths)
+    if quick:
+        async with _limit(limiter):
+            return await _run_step(
+                _quick_diff, project_dir, cruft_state, exit_code, checkout, pathspec
+            )
+    checkout = checkout or cruft_state.get("commit")
+
+    async with _limit(limiter):
+        with AltTemporaryDirectory() as tmpdir_:
+            tmpdir = Path(tmpdir_)
+            result = await _run_step(
+                _diff_snapshot, tmpdir, cruft_state, project_dir, exit_code, checkout, pathspec
+            )
+            if result is not None:
+                return result
+            await _get_cookiecutter_repo(cruft_state["template"], tmpdir / "repo", checkout)
+            return await _run_with_repo(
+                tmpdir / "repo",
+                _diff_with_repo,
+                tmpdir,
+                cruft_state,
+                project_dir,
+                exit_code,
+                checkout,
+                pathspec,
+            )
+
+
+async def update(
+    project_dir: Path = Path("."),
+    template_path: Optional[Path] = None,
+    refresh_private_variables: bool = False,
+    skip_update: bool = False,
+    checkout: Optional[str] = None,
+    strict: bool = True,
+    allow_untracked_files: bool = False,
+    extra_context: Optional[Dict[str, Any]] = None,
+    extra_context_file: Optional[Path] = None,
+    manifest: bool = False,
+    snapshot: bool = False,
+    incremental: bool = False,
+    only: Optional[List[str]] = None,
+    advance_state: bool = False,
+    *,
+    limiter: Optional[AsyncContextManager] = None,
+) -> bool:
+    """Update specified project's cruft to the latest and greatest release.
+    See `cruft.update`, the updates are always applied without prompting."""
+    project_dir = absolute_path(project_dir)
+    async with _limit(limiter):
+        inputs = await _run_step(
+            _load_update_inputs,
+            project_dir,
+            allow_untracked_files,
+            extra_context,
+            extra_context_file,
+        )
+        if inputs is None:
+            return False
+        cruft_file, cruft_state, extra_context = inputs
+
+        if template_path is None:
+            template_git_str = cruft_state["template"]
+        else:
+            template_git_str = utils.cookiecutter.resolve_template_url(str(template_path))
+
+        with AltTemporaryDirectory() as tmpdir_:
+            tmpdir = Path(tmpdir_)
+            await _get_cookiecutter_repo(template_git_str, tmpdir / "repo", checkout)
+            return await _run_with_repo(
+                tmpdir / "repo",
+                _update_with_repo,
+                tmpdir,
+                cruft_file,
+                cruft_state,
+                project_dir,
+                False,
+                refresh_private_variables,
+                True,
+                skip_update,
+                checkout,
+                strict,
+                allow_untracked_files,
+                extra_context,
+                manifest,
+                snapshot,
+                incremental,
+                utils.pathspec.get_pathspec(only),
+                advance_state,
+            )
+
+
+@asynccontextmanager
+async def _limit(limiter: Optional[AsyncContextManager]) -> AsyncIterator[None]:
+    if limiter is None:
+        yield
+    else:
+        async with limiter:
+            yield
+
+
+async def _run_step(function, *args):
+    """Run a synchronous command step in the default executor.
+
+    The step cannot be interrupted once started: if the calling task is cancelled, the
+    step keeps running in its thread until it completes."""
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+async def _run_with_repo(repo_dir: Path, function, *args):
+    """Run a synchronous command step on the template clone, see `_run_step`."""
+
+    def run_with_repo(*args):
+        with Repo(repo_dir) as repo:
+            return function(repo, *args)
+
+    return await _run_step(run_with_repo, *args)
+
+
+async def _git(*args: str, cwd: Optional[Path] = None) -> str:
+    # Git spawns helper processes of its own (transports, index-pack, hooks...), on POSIX
+    # they share a new process group so that they can all be killed on cancellation.
+    accounted = active_accounting()
+    timeout = get_timeout()
+    start = perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        "git",
+        *args,
+        cwd=None if cwd is None else str(cwd),
+        stdout=PIPE,
+        stderr=PIPE,
+        start_new_session=os.name == "posix",
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except (asyncio.CancelledError, asyncio.TimeoutError) as error:
+        _kill(process)
+        await process.wait()
+        if accounted is not None:
+            accounted.record(["git", *args], cwd, start, None)
+        if isinstance(error, asyncio.TimeoutError):
+            raise GitTimeout(["git", *args], timeout)  # type: ignore
+        raise
+    if accounted is not None:
+        accounted.record(["git", *args], cwd, start, process.returncode, 0, len(stdout))
+    if process.returncode:
+        raise CalledProcessError(process.returncode, ["git", *args], stdout, stderr)
+    return stdout.decode().strip()
+
+
+def _kill(process: asyncio.subprocess.Process):
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:  # pragma: no cov_4_nix
+            process.kill()
+    except ProcessLookupError:  # pragma: no cover
+        pass
+
+
+async def _clone(template_git_url: str, repo_dir: Path, *clone_args: str):
+    try:
+        await _git("clone", *clone_args, template_git_url, str(repo_dir), cwd=repo_dir.parent)
+    except CalledProcessError as error:
+        raise InvalidCookiecutterRepository(
+            template_git_url, f"Failed to clone the repo. {error.stderr.decode().strip()}"
+        )
+
+
+async def _get_cookiecutter_repo(
+    template_git_url: str, repo_dir: Path, checkout: Optional[str] = None
+):
+    """The asynchronous counterpart of `utils.cookiecutter.get_cookiecutter_repo`."""
+    await _clone(template_git_url, repo_dir)
+    if checkout is not None:
+        try:
+            await _git("checkout", checkout, cwd=repo_dir)
+        except CalledProcessError as error:
+            raise InvalidCookiecutterRepository(
+                template_git_url,
+                f"Failed to check out the reference {checkout}. {error.stderr.decode().strip()}",
+            )
+    await _git("submodule", "update", "--init", "--recursive", "--force", cwd=repo_dir)
+
+
+async def _resolve_commit(template_git_url: str, repo_dir: Path, checkout: Optional[str]) -> str:
+    if checkout is None:
+        return await _git("rev-parse", "HEAD", cwd=repo_dir)
+    # Branches of a fresh clone only exist as remote branches
+    for reference in (checkout, f"origin/{checkout}"):
+        try:
+            return await _git("rev-parse", "--verify", f"{reference}^{{commit}}", cwd=repo_dir)
+        except CalledProcessError:
+            continue
+    raise InvalidCookiecutterRepository(
+        template_git_url, f"Failed to check out the reference {checkout}."
+    )
+
+
+async def _is_project_updated(
+    repo_dir: Path, current_commit: str, latest_commit: str, compare_trees: bool, strict: bool
+) -> bool:
+    """The asynchronous counterpart of `utils.cruft.is_project_updated`.
+
+    Like in `cruft.check`, the tree of the project commit is only compared with the tree
+    of the latest commit when a reference was explicitly checked out."""
+    if latest_commit == current_commit:
+        return True
+    if compare_trees:
+        try:
+            await _git("diff", "--quiet", current_commit, latest_commit, cwd=repo_dir)
+            return True
+        except CalledProcessError as error:
+            if error.returncode != 1:
+                raise
+    if not strict:
+        try:
+            await _git("merge-base", "--is-ancestor", latest_commit, current_commit, cwd=repo_dir)
+            return True
+        except CalledProcessError as error:
+            if error.returncode != 1:
+                raise
+    return False
@@ -1,7 +1,7 @@
 """Contains all custom exceptions raised by cruft."""
 
 from pathlib import Path
-from typing import Union
+from typing import List, Optional, Union
 
 from click import ClickException
 
@@ -60,3 +60,79 @@ class ChangesetUnicodeError(CruftError):
                 "unicode. Typically a result of hidden binary files in project folder."
             )
         )
+
+
+class InvalidContextsFile(CruftError):
+    """Raised when a file of contexts given to `cruft batch-create` cannot be parsed."""
+
+    def __init__(self, file_location: Union[str, Path], line_number: int, details: str = ""):
+        if not isinstance(file_location, str):
+            file_location = str(file_location)
+        super().__init__(
+            f"Invalid entry on line {line_number} of `{file_location}` ! {details.strip()}"
+        )
+        self.file_location = file_location
+        self.line_number = line_number
+
+
+class InvalidConfigFile(CruftError):
+    """Raised when the configuration file of cruft cannot be parsed."""
+
+    def __init__(self, file_location: Union[str, Path], details: str = ""):
+        if not isinstance(file_location, str):
+            file_location = str(file_location)
+        super().__init__(f"Invalid configuration file `{file_location}` ! {details.strip()}")
+        self.file_location = file_location
+
+
+class DaemonAlreadyRunning(CruftError):
+    """Raised when `cruft serve` is started while another daemon listens on its socket."""
+
+    def __init__(self, socket_path: Union[str, Path]):
+        if not isinstance(socket_path, str):
+            socket_path = str(socket_path)
+        super().__init__(f"A cruft daemon is already listening on `{socket_path}` !")
+        self.socket_path = socket_path
+
+
+class GitTimeout(CruftError):
+    """Raised when a git command runs for longer than the CRUFT_GIT_TIMEOUT seconds."""
+
+    def __init__(self, command: List[str], timeout: float):
+        super().__init__(f"`{' '.join(command)}` did not complete within {timeout:g} seconds !")
+        self.command = command
+        self.timeout = timeout
+
+
+class ResourceBudgetExceeded(CruftError):
+    """Raised when a command uses more memory or temporary disk than its budget allows."""
+
+    def __init__(self, resource: str, used: int, budget: int, phase: Optional[str] = None):
+        during = f" during `{phase}`" if phase else ""
+        super().__init__(
+            f"cruft used {used:,} bytes of {resource}{during},"
+            f" over its budget of {budget:,} bytes !"
+        )
+        self.resource = resource
+        self.used = used
+        self.budget = budget
+        self.phase = phase
+
+
+class InvalidHookPolicy(CruftError):
+    """Raised when the policy for running the hooks of templates is not a known one."""
+
+    def __init__(self, policy: str, policies: List[str]):
+        super().__init__(f"Invalid hook policy `{policy}`, expected one of {', '.join(policies)} !")
+        self.policy = policy
+
+
+class InvalidRevisionRange(CruftError):
+    """Raised when a range of template revisions is not of the form `<from>..<to>`."""
+
+    def __init__(self, revision_range: str):
+        super().__init__(
+            f"Invalid revision range `{revision_range}`, expected `<from>..<to>` such as"
+            " `v1.0..v1.1` !"
+        )
+        self.revision_range = revision_range
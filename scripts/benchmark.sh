@@ -0,0 +1,4 @@
+#!/bin/bash
+set -euxo pipefail
+
+uv run python -m benchmarks ${@-}
@@ -1,5 +1,5 @@
 #!/bin/bash
 set -euxo pipefail
 
-uv run ruff format cruft/ tests/
-uv run ruff check --fix --unsafe-fixes cruft/ tests/
+uv run ruff format cruft/ tests/ benchmarks/
+uv run ruff check --fix --unsafe-fixes cruft/ tests/ benchmarks/
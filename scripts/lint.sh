@@ -2,5 +2,5 @@
 set -euxo pipefail
 
 uv run cruft check
-uv run ruff check cruft/ tests/
-uv run ruff format --check cruft/ tests/
+uv run ruff check cruft/ tests/ benchmarks/
+uv run ruff format --check cruft/ tests/ benchmarks/
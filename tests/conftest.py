@@ -1,4 +1,7 @@
+import json
 import os
+from pathlib import Path
+from subprocess import PIPE, run  # nosec
 
 import pytest
 
@@ -6,3 +9,64 @@ import pytest
 @pytest.fixture()
 def project_dir():
     yield os.path.abspath(os.path.join(__file__, os.pardir, os.pardir))
+
+
+def _git(*args: str, cwd: Path) -> str:
+    return run(
+        ["git", "-c", "user.name=cruft", "-c", "user.email=cruft@example.com", *args],
+        cwd=cwd,
+        stdout=PIPE,
+        stderr=PIPE,
+        check=True,
+    ).stdout.decode()
+
+
+def _write_template_files(template_dir: Path, files: dict):
+    for name, content in files.items():
+        path = template_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+
+@pytest.fixture()
+def local_template(tmp_path_factory):
+    """A local git repository holding a small cookiecutter template.
+
+    The template has two commits, tagged `v1` and `v2`, and `main` points at `v2`."""
+    template_dir = tmp_path_factory.mktemp("local_template")
+    _git("init", "-q", cwd=template_dir)
+    _git("symbolic-ref", "HEAD", "refs/heads/main", cwd=template_dir)
+
+    _write_template_files(
+        template_dir,
+        {
+            "cookiecutter.json": json.dumps(
+                {"project_slug": "example", "description": "An example project"}
+            ),
+            "{{cookiecutter.project_slug}}/README.md": (
+                "# {{ cookiecutter.project_slug }}\n\n{{ cookiecutter.description }}\n"
+            ),
+            "{{cookiecutter.project_slug}}/setup.cfg": (
+                "[metadata]\nname = {{ cookiecutter.project_slug }}\n"
+            ),
+        },
+    )
+    _git("add", "-A", cwd=template_dir)
+    _git("commit", "-q", "-m", "Initial template", cwd=template_dir)
+    _git("tag", "v1", cwd=template_dir)
+
+    _write_template_files(
+        template_dir,
+        {
+            "{{cookiecutter.project_slug}}/README.md": (
+                "# {{ cookiecutter.project_slug }}\n\n{{ cookiecutter.description }}\n\n"
+                "Generated with cruft.\n"
+            ),
+            "{{cookiecutter.project_slug}}/CHANGES.md": "# Changes\n",
+        },
+    )
+    _git("add", "-A", cwd=template_dir)
+    _git("commit", "-q", "-m", "Update template", cwd=template_dir)
+    _git("tag", "v2", cwd=template_dir)
+
+    yield template_dir
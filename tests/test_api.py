@@ -1,16 +1,24 @@
+import asyncio
 import json
 import os
 import re
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from subprocess import run
+from shutil import rmtree
+from subprocess import PIPE, run
+from threading import Thread
 
 import pytest
+from cookiecutter import generate as cookiecutter_generate
 from examples import verify_and_test_examples
 from git import Repo
+from jinja2 import TemplateSyntaxError
 
 import cruft
-from cruft import exceptions
+import cruft.aio
+from cruft import _commands, exceptions
 from cruft._commands import utils
 
 
@@ -339,3 +347,841 @@ def test_diff_git_subdir(capfd, tmpdir):
     )
 
     assert cruft.update(project_dir, checkout="updated")
+
+
+def _create_local_projects(template: Path, root: Path, descriptions):
+    return [
+        cruft.create(
+            str(template),
+            root / f"project{i}",
+            checkout="v1",
+            extra_context={"description": description},
+        )
+        for i, description in enumerate(descriptions)
+    ]
+
+
+def test_batch_update(local_template, tmp_path, mocker):
+    projects = _create_local_projects(local_template, tmp_path, ["one", "one", "two"])
+    render_template = mocker.spy(utils.generate, "render_template")
+
+    reports = cruft.batch_update(projects, workers=2)
+
+    assert [report.project_dir for report in reports] == [p.resolve() for p in projects]
+    assert [report.status for report in reports] == ["applied"] * 3
+    # Two revisions of the template, each rendered once per distinct context
+    assert render_template.call_count == 4
+    latest_commit = (
+        run(["git", "rev-parse", "v2"], cwd=local_template, stdout=PIPE).stdout.decode().strip()
+    )
+    for project, description in zip(projects, ["one", "one", "two"]):
+        assert (
+            (project / "README.md")
+            .read_text()
+            .endswith(f"{description}\n\nGenerated with cruft.\n")
+        )
+        assert (project / "CHANGES.md").exists()
+        cruft_state = json.loads((project / ".cruft.json").read_text())
+        assert cruft_state["commit"] == latest_commit
+        assert cruft_state["context"]["cookiecutter"]["description"] == description
+
+    reports = cruft.batch_update(projects)
+    assert [report.status for report in reports] == ["skipped"] * 3
+
+
+def test_batch_update_skip_update(local_template, tmp_path, mocker):
+    projects = _create_local_projects(local_template, tmp_path, ["one", "one", "two"])
+    render_template = mocker.spy(utils.generate, "render_template")
+
+    reports = cruft.batch_update(projects, skip_update=True)
+
+    assert [report.status for report in reports] == ["skipped"] * 3
+    # Only the new revision is rendered, once per distinct context
+    assert render_template.call_count == 2
+    for project in projects:
+        assert not (project / "CHANGES.md").exists()
+        assert json.loads((project / ".cruft.json").read_text())["commit"] == reports[0].commit
+
+
+def test_batch_update_reports_conflicts_and_failures(local_template, tmp_path):
+    clean, conflicting = _create_local_projects(local_template, tmp_path, ["one", "two"])
+    (conflicting / "README.md").write_text("conflicts\n")
+    not_a_project = tmp_path / "not_a_project"
+    not_a_project.mkdir()
+
+    reports = cruft.batch_update([clean, conflicting, not_a_project])
+
+    assert [report.status for report in reports] == ["applied", "conflicts", "failed"]
+    assert "Was unable to locate a `.cruft.json`" in reports[2].message
+    assert set(conflicting.glob("**/*.rej"))
+
+
+def test_batch_create(local_template, tmp_path, mocker):
+    contexts_file = tmp_path / "contexts.jsonl"
+    contexts_file.write_text(
+        "\n".join(
+            json.dumps(item)
+            for item in [
+                {"output_dir": str(tmp_path / "a"), "extra_context": {"project_slug": "billing"}},
+                {"output_dir": str(tmp_path / "a"), "extra_context": {"project_slug": "orders"}},
+                {"output_dir": str(tmp_path / "b")},
+                {"output_dir": str(tmp_path / "c")},
+            ]
+        )
+    )
+    cruft.create(str(local_template), tmp_path / "c", checkout="v1")
+    clone = mocker.spy(utils.cookiecutter, "get_cookiecutter_repo")
+
+    reports = cruft.batch_create(str(local_template), contexts_file, checkout="v1", workers=2)
+
+    assert clone.call_count == 1
+    assert [report.project_dir for report in reports[:3]] == [
+        tmp_path / "a" / "billing",
+        tmp_path / "a" / "orders",
+        tmp_path / "b" / "example",
+    ]
+    assert all(report.error is None for report in reports[:3])
+    # The last project exists already
+    assert reports[3].project_dir is None
+    assert "already exists" in reports[3].error
+
+    for report in reports[:3]:
+        created = json.loads((report.project_dir / ".cruft.json").read_text())
+        expected = json.loads(
+            (
+                cruft.create(
+                    str(local_template),
+                    tmp_path / "expected",
+                    checkout="v1",
+                    extra_context=created["context"]["cookiecutter"],
+                )
+                / ".cruft.json"
+            ).read_text()
+        )
+        assert created == expected
+        rmtree(tmp_path / "expected")
+
+
+def test_batch_create_invalid_contexts_file(local_template, tmp_path):
+    contexts_file = tmp_path / "contexts.jsonl"
+    contexts_file.write_text('{"output_dir": "a"}\n\n["not", "an", "object"]\n')
+
+    with pytest.raises(exceptions.InvalidContextsFile) as error:
+        cruft.batch_create(str(local_template), contexts_file)
+    assert error.value.line_number == 3
+
+    # Both lines would generate the same project
+    contexts_file.write_text(
+        f'{{"output_dir": "{tmp_path}", "extra_context": {{"project_slug": "billing"}}}}\n'
+        f'{{"output_dir": "{tmp_path}/b"}}\n'
+        f'{{"output_dir": "{tmp_path}", "extra_context": {{"project_slug": "billing"}}}}\n'
+    )
+    with pytest.raises(exceptions.InvalidContextsFile) as error:
+        cruft.batch_create(str(local_template), contexts_file, checkout="v1")
+    assert error.value.line_number == 3
+    assert "like line 1" in error.value.message
+    assert not (tmp_path / "billing").exists()
+
+
+def test_aio_check_and_update(local_template, tmp_path):
+    project = cruft.create(str(local_template), tmp_path, checkout="v1")
+
+    assert not asyncio.run(cruft.aio.check(project))
+    assert asyncio.run(cruft.aio.check(project, checkout="v1"))
+    assert asyncio.run(cruft.aio.check(project, checkout="v1", strict=False))
+
+    assert asyncio.run(cruft.aio.update(project))
+    assert (project / "CHANGES.md").exists()
+    assert asyncio.run(cruft.aio.check(project))
+
+
+def test_aio_diff_with_limiter(local_template, tmp_path, capfd):
+    projects = [
+        cruft.create(str(local_template), tmp_path / str(i), checkout="v1") for i in range(4)
+    ]
+    for project in projects[:2]:
+        (project / "README.md").write_text("changed\n")
+    running = 0
+    max_running = 0
+
+    class Limiter:
+        def __init__(self):
+            self.semaphore = asyncio.Semaphore(2)
+
+        async def __aenter__(self):
+            nonlocal running, max_running
+            await self.semaphore.acquire()
+            running += 1
+            max_running = max(max_running, running)
+
+        async def __aexit__(self, *exc):
+            nonlocal running
+            running -= 1
+            self.semaphore.release()
+
+    async def diff_all():
+        limiter = Limiter()
+        return await asyncio.gather(
+            *(cruft.aio.diff(project, exit_code=True, limiter=limiter) for project in projects)
+        )
+
+    assert asyncio.run(diff_all()) == [False, False, True, True]
+    assert max_running == 2
+    assert capfd.readouterr().out.count("-changed") == 2
+
+
+def test_aio_diff_and_update_options(local_template, tmp_path, capfd):
+    project = cruft.create(str(local_template), tmp_path, checkout="v1", manifest=True)
+    (project / "README.md").write_text("# example\n\nA changed description\n")
+    (project / "setup.cfg").write_text("[metadata]\nname = changed\n")
+    capfd.readouterr()
+
+    assert not asyncio.run(cruft.aio.diff(project, exit_code=True, paths=["README.md"]))
+    output = capfd.readouterr().out
+    assert "A changed description" in output
+    assert "setup.cfg" not in output
+    assert not asyncio.run(cruft.aio.diff(project, exit_code=True, quick=True, paths=["setup.cfg"]))
+    assert capfd.readouterr().out == "drifted  setup.cfg\n"
+    (project / "README.md").write_text("# example\n\nAn example project\n")
+    (project / "setup.cfg").write_text("[metadata]\nname = example\n")
+
+    assert asyncio.run(cruft.aio.update(project, only=["CHANGES.md"]))
+    assert (project / "CHANGES.md").is_file()
+    assert "Generated with cruft." not in (project / "README.md").read_text()
+    state = json.loads((project / ".cruft.json").read_text())
+    assert state["commit"] == Repo(local_template).commit("v1").hexsha
+
+    assert asyncio.run(cruft.aio.update(project, snapshot=True))
+    assert "Generated with cruft." in (project / "README.md").read_text()
+    assert utils.snapshot.get_snapshot_file(project).is_file()
+
+
+def test_aio_cancellation_kills_git(tmp_path):
+    async def cancel_hanging_git():
+        task = asyncio.ensure_future(
+            cruft.aio._git("-c", "alias.hang=!exec sleep 30", "hang", cwd=tmp_path)
+        )
+        await asyncio.sleep(0.5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    start = time.monotonic()
+    asyncio.run(cancel_hanging_git())
+    assert time.monotonic() - start < 10
+
+
+def test_commands_from_several_threads(local_template, tmp_path):
+    projects = [
+        cruft.create(str(local_template), tmp_path / str(i), checkout="v1") for i in range(8)
+    ]
+    for project in projects[1::2]:
+        (project / "README.md").write_text("changed\n")
+    cwd = os.getcwd()
+    sys_path = list(sys.path)
+
+    def run_commands(project):
+        if projects.index(project) % 2:
+            return cruft.diff(project, exit_code=True), cruft.check(project, checkout="v1")
+        return cruft.update(project), cruft.check(project)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(run_commands, projects))
+
+    assert results == [(True, True), (False, True)] * 4
+    for project in projects[::2]:
+        assert (project / "CHANGES.md").exists()
+    assert os.getcwd() == cwd
+    assert sys.path == sys_path
+
+
+def test_serve(local_template, tmp_path, monkeypatch, mocker):
+    socket_path = tmp_path / "cruft.sock"
+    monkeypatch.setenv("CRUFT_SOCKET", str(socket_path))
+    project = cruft.create(str(local_template), tmp_path / "project", checkout="v1")
+    (project / "README.md").write_text("changed\n")
+    generate_output = mocker.spy(utils.generate, "_generate_output")
+
+    server = Thread(target=_commands.serve, args=(socket_path, tmp_path / "cache"))
+    server.start()
+    try:
+        connection = utils.daemon.connect()
+        while connection is None:
+            time.sleep(0.01)
+            connection = utils.daemon.connect()
+        connection.close()
+
+        response = utils.daemon.call("check", project_dir=project)
+        assert response.exit_code == 1
+        assert response.output.startswith("FAILURE")
+        assert len(list((tmp_path / "cache" / "mirrors").iterdir())) == 1
+
+        for _ in range(2):
+            response = utils.daemon.call("diff", project_dir=project, exit_code=True)
+            assert response.exit_code == 1
+            assert "-changed" in response.output
+        # The template is only rendered once at the revision of the project
+        assert generate_output.call_count == 1
+
+        (project / "README.md").write_text("# example\n\nAn example project\n")
+        response = utils.daemon.call("update", project_dir=project)
+        assert response.exit_code == 0
+        assert (project / "CHANGES.md").exists()
+        assert generate_output.call_count == 2
+
+        response = utils.daemon.call("check", project_dir=tmp_path)
+        assert response.exit_code == 1
+        assert "Was unable to locate a `.cruft.json`" in response.error
+
+        # The requests run with the settings of the client
+        settings = mocker.patch.object(
+            utils.daemon, "get_settings", return_value={"git_timeout": "0.000001"}
+        )
+        response = utils.daemon.call("check", project_dir=project)
+        # The clone times out
+        assert "Failed to clone the repo" in response.error
+        mocker.stop(settings)
+
+        # What the commands write to the standard error is sent back on its own
+        conflicting = cruft.create(str(local_template), tmp_path / "conflicting", checkout="v1")
+        (conflicting / "README.md").write_text("conflicts\n")
+        response = utils.daemon.call("update", project_dir=conflicting)
+        assert "patch failed" in response.error_output
+        assert "patch failed" not in response.output
+
+        with pytest.raises(exceptions.DaemonAlreadyRunning):
+            _commands.serve(socket_path)
+    finally:
+        assert _commands.stop_daemon(socket_path)
+        server.join()
+
+    assert not socket_path.exists()
+    assert utils.daemon.call("check", project_dir=project) is None
+
+
+def test_lazy_public_api(project_dir):
+    script = "import sys, cruft; print('cruft._commands' in sys.modules)"
+    result = run([sys.executable, "-c", script], stdout=PIPE, check=True, cwd=project_dir)
+    assert result.stdout.strip() == b"False"
+
+    assert cruft.check is _commands.check
+    assert cruft.__version__ == cruft._version.__version__
+    with pytest.raises(AttributeError):
+        cruft.not_a_command  # noqa: B018
+
+
+def test_resource_limits(local_template, tmp_path):
+    with cruft.resource_limits() as tracker:
+        project = cruft.create(str(local_template), tmp_path / "project", checkout="v1")
+        cruft.update(project, skip_apply_ask=True)
+    assert {"clone", "render new/generate", "apply"} <= set(tracker.phases)
+    assert tracker.phases["clone"].temp_bytes > 0
+    assert tracker.peak.rss_bytes >= tracker.phases["clone"].rss_bytes
+
+    with cruft.resource_limits(max_temp=1024):
+        with pytest.raises(exceptions.ResourceBudgetExceeded) as error:
+            cruft.create(str(local_template), tmp_path / "other")
+    assert error.value.resource == utils.resources.TEMPORARY_DISK
+    assert not (tmp_path / "other" / "example").exists()
+
+
+def test_snapshot(local_template, tmp_path, mocker, capfd):
+    project = cruft.create(str(local_template), tmp_path / "project", checkout="v1", snapshot=True)
+    snapshot_file = utils.snapshot.get_snapshot_file(project)
+    assert snapshot_file.is_file()
+    (project / "README.md").write_text("# A local change\n")
+
+    # The snapshot stands for the template at the commit of the project, without any clone
+    get_cookiecutter_repo = mocker.spy(utils.cookiecutter, "get_cookiecutter_repo")
+    assert not cruft.diff(project, exit_code=True)
+    assert "A local change" in capfd.readouterr().out
+    assert get_cookiecutter_repo.call_count == 0
+
+    # Updates render the latest template only, and refresh the snapshot
+    (project / "README.md").write_text("# example\n\nAn example project\n")
+    generate_output = mocker.spy(utils.generate, "_generate_output")
+    assert cruft.update(project, skip_apply_ask=True)
+    assert generate_output.call_count == 1
+    assert (project / "CHANGES.md").is_file()
+    cruft_state = json.loads((project / ".cruft.json").read_text())
+    with utils.iohelper.AltTemporaryDirectory() as restored:
+        assert utils.snapshot.restore_snapshot(
+            snapshot_file, cruft_state, cruft_state["commit"], Path(restored)
+        )
+        assert sorted(os.listdir(restored)) == ["CHANGES.md", "README.md", "setup.cfg"]
+    assert cruft.diff(project, exit_code=True)
+
+    unlinked = cruft.create(str(local_template), tmp_path / "unlinked", checkout="v1")
+    (unlinked / ".cruft.json").unlink()
+    assert cruft.link(str(local_template), unlinked, checkout="v1", snapshot=True)
+    assert utils.snapshot.get_snapshot_file(unlinked).is_file()
+
+
+def test_quick_diff(local_template, tmp_path, capfd):
+    project = cruft.create(str(local_template), tmp_path / "default", checkout="v1")
+    assert not utils.manifest.get_manifest_file(project).exists()
+    project = cruft.create(str(local_template), tmp_path / "project", checkout="v1", manifest=True)
+    assert utils.manifest.get_manifest_file(project).is_file()
+    assert cruft.diff(project, exit_code=True, quick=True)
+    assert capfd.readouterr().out == ""
+
+    (project / "README.md").write_text("# A local change\n")
+    (project / "setup.cfg").unlink()
+    (project / "notes.txt").write_text("Notes\n")
+    assert not cruft.diff(project, exit_code=True, quick=True)
+    assert capfd.readouterr().out.splitlines() == [
+        "drifted  README.md",
+        "deleted  setup.cfg",
+        "extra    notes.txt",
+    ]
+
+    cruft_state = json.loads((project / ".cruft.json").read_text())
+    cruft_state["skip"] = ["README.md", "*.txt"]
+    (project / ".cruft.json").write_text(json.dumps(cruft_state))
+    assert not cruft.diff(project, exit_code=True, quick=True)
+    assert capfd.readouterr().out == "deleted  setup.cfg\n"
+
+    # Updates rewrite the manifest for the latest template
+    (project / "setup.cfg").write_text("[metadata]\nname = example\n")
+    assert cruft.update(project, skip_apply_ask=True)
+    capfd.readouterr()
+    assert cruft.diff(project, exit_code=True, quick=True)
+
+    utils.manifest.get_manifest_file(project).unlink()
+    assert not cruft.diff(project, quick=True)
+    assert "No up to date" in capfd.readouterr().out
+
+
+def test_incremental_update(local_template, tmp_path, mocker):
+    full = cruft.create(str(local_template), tmp_path / "full", checkout="v1")
+    assert cruft.update(full, skip_apply_ask=True)
+
+    project = cruft.create(str(local_template), tmp_path / "project", checkout="v1")
+    generate_output = mocker.spy(utils.generate, "_generate_output")
+    with utils.profiling.profiling(utils.profiling.Profile(template_files=True)) as profile:
+        assert cruft.update(project, skip_apply_ask=True, incremental=True)
+    # Only the current commit is rendered in full, then the files changed since
+    assert generate_output.call_count == 1
+    assert sorted(file.name for file in profile.files if file.phase.startswith("render new")) == [
+        "CHANGES.md",
+        "README.md",
+    ]
+    assert sorted(os.listdir(project)) == sorted(os.listdir(full))
+    for name in os.listdir(full):
+        assert (project / name).read_text() == (full / name).read_text()
+
+    repo = utils.gitrunner.Repo(local_template)
+    assert utils.incremental.get_template_changes(repo, "v1", "v2") == {
+        "{{cookiecutter.project_slug}}/CHANGES.md": "A",
+        "{{cookiecutter.project_slug}}/README.md": "M",
+    }
+    # Changing the variables of the template, from the empty tree, changes every file
+    empty_tree = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+    assert utils.incremental.get_template_changes(repo, empty_tree, "v1") is None
+
+
+def test_incremental_variables_update(local_template, tmp_path):
+    project = cruft.create(str(local_template), tmp_path / "project")
+    with utils.profiling.profiling(utils.profiling.Profile(template_files=True)) as profile:
+        assert cruft.update(
+            project,
+            skip_apply_ask=True,
+            extra_context={"description": "Another description"},
+            incremental=True,
+        )
+    # Only the files using the variable are rendered again
+    assert [file.name for file in profile.files if file.phase.startswith("render new")] == [
+        "README.md"
+    ]
+    assert "Another description" in (project / "README.md").read_text()
+    assert (
+        json.loads((project / ".cruft.json").read_text())["context"]["cookiecutter"]["description"]
+        == "Another description"
+    )
+
+
+def test_hook_policy(local_template, tmp_path, monkeypatch):
+    monkeypatch.setenv("CRUFT_CACHE_DIR", str(tmp_path / "cache"))
+    runs = tmp_path / "runs"
+    (local_template / "hooks").mkdir()
+    (local_template / "hooks" / "post_gen_project.py").write_text(
+        "from pathlib import Path\n"
+        f"with open({str(runs)!r}, 'a') as runs:\n"
+        "    runs.write('run')\n"
+        "Path('setup.cfg').unlink()\n"
+        "Path('README.md').write_text(Path('README.md').read_text() + 'Hooked')\n"
+    )
+    run(["git", "add", "."], cwd=local_template)
+    run(
+        ["git", "-c", "user.name=test", "-c", "user.email=user@test.com", "commit", "-qm", "Hook"],
+        cwd=local_template,
+    )
+    # The hooks of new projects always run
+    with cruft.hook_policy("skip"):
+        project = cruft.create(str(local_template), tmp_path / "project")
+    assert runs.read_text() == "run"
+    assert not (project / "setup.cfg").exists()
+    assert "Hooked" in (project / "README.md").read_text()
+
+    # The changes made by the hook are replayed once recorded
+    with cruft.hook_policy("cache"):
+        assert cruft.diff(project, exit_code=True)
+        assert cruft.diff(project, exit_code=True)
+    assert runs.read_text() == "runrun"
+
+    with cruft.hook_policy("skip"):
+        assert not cruft.diff(project, exit_code=True)
+    assert runs.read_text() == "runrun"
+
+    monkeypatch.setenv("CRUFT_HOOKS", "sometimes")
+    with pytest.raises(exceptions.InvalidHookPolicy):
+        cruft.diff(project)
+
+
+def _commit_template(template_dir: Path, message: str):
+    run(["git", "add", "-A"], cwd=template_dir)
+    run(
+        ["git", "-c", "user.name=test", "-c", "user.email=user@test.com", "commit", "-qm", message],
+        cwd=template_dir,
+    )
+
+
+def test_binary_update(local_template, tmp_path, mocker):
+    template_dir = local_template / "{{cookiecutter.project_slug}}"
+    (template_dir / "logo.png").write_bytes(b"\x89PNG\0old")
+    (template_dir / "font.woff").write_bytes(b"wOFF\0old")
+    (template_dir / "old.bin").write_bytes(b"\0old")
+    _commit_template(local_template, "Add assets")
+    project = cruft.create(str(local_template), tmp_path / "project")
+    for command in (["init", "-q"], ["add", "-A"], ["commit", "-qm", "Create"]):
+        run(
+            ["git", "-c", "user.name=test", "-c", "user.email=user@test.com", *command], cwd=project
+        )
+    (project / "font.woff").write_bytes(b"wOFF\0custom")
+    run(
+        ["git", "-c", "user.name=test", "-c", "user.email=u@t.com", "commit", "-qam", "Font"],
+        cwd=project,
+    )
+
+    (template_dir / "logo.png").write_bytes(b"\x89PNG\0new")
+    (template_dir / "font.woff").write_bytes(b"wOFF\0new")
+    (template_dir / "old.bin").unlink()
+    (template_dir / "new.bin").write_bytes(b"\0new")
+    (template_dir / "README.md").write_text("# {{ cookiecutter.project_slug }}\n\nUpdated\n")
+    _commit_template(local_template, "Update assets")
+    get_diff = mocker.spy(utils.diff, "get_diff")
+
+    assert cruft.update(project, skip_apply_ask=True)
+    # The binary files are left out of the patch, and changed in the project as a whole
+    assert "GIT binary patch" not in get_diff.spy_return
+    assert (project / "README.md").read_text().endswith("Updated\n")
+    assert (project / "logo.png").read_bytes() == b"\x89PNG\0new"
+    assert (project / "new.bin").read_bytes() == b"\0new"
+    assert not (project / "old.bin").exists()
+    # The binary files changed in the project are kept
+    assert (project / "font.woff").read_bytes() == b"wOFF\0custom"
+    staged = run(["git", "diff", "--cached", "--name-status"], cwd=project, stdout=PIPE)
+    assert staged.stdout.decode().split() == [
+        "M",
+        "README.md",
+        "M",
+        "logo.png",
+        "A",
+        "new.bin",
+        "D",
+        "old.bin",
+    ]
+
+
+def test_parallel_rendering(tmp_path, monkeypatch):
+    template = tmp_path / "template"
+    inner = template / "{{cookiecutter.project_slug}}"
+    (inner / "assets").mkdir(parents=True)
+    (inner / "raw").mkdir()
+    (template / "templates").mkdir()
+    (template / "cookiecutter.json").write_text(
+        json.dumps(
+            {"project_slug": "example", "license": "", "_copy_without_render": ["raw", "*.j2"]}
+        )
+    )
+    (template / "templates" / "header.txt").write_text("# {{ cookiecutter.project_slug }}\n")
+    for index in range(80):
+        (inner / f"module_{index}.py").write_text(
+            f'{{% include "header.txt" %}}VALUE = "{{{{ cookiecutter.project_slug }}}}-{index}"\n'
+        )
+    (inner / "windows.bat").write_bytes(b"echo {{ cookiecutter.project_slug }}\r\n")
+    (inner / "run.sh").write_text("#!/bin/sh\necho {{ cookiecutter.project_slug }}\n")
+    (inner / "run.sh").chmod(0o755)
+    (inner / "assets" / "logo.png").write_bytes(b"\x89PNG\0{{ cookiecutter.project_slug }}")
+    (inner / "raw" / "kept.txt").write_text("{{ cookiecutter.project_slug }}\n")
+    (inner / "layout.j2").write_text("{{ cookiecutter.project_slug }}\n")
+    (inner / "{% if cookiecutter.license %}LICENSE{% endif %}").write_text("MIT\n")
+    run(["git", "init", "-q"], cwd=template)
+    _commit_template(template, "Template")
+
+    serial = cruft.create(str(template), tmp_path / "serial")
+    monkeypatch.setenv("CRUFT_RENDER_WORKERS", "2")
+    parallel = cruft.create(str(template), tmp_path / "parallel")
+    # The same files, with the same content and permissions
+    assert utils.manifest.get_manifest(parallel) == utils.manifest.get_manifest(serial)
+    assert (parallel / "windows.bat").read_bytes() == b"echo example\r\n"
+    assert (parallel / "raw" / "kept.txt").read_text() == "{{ cookiecutter.project_slug }}\n"
+    assert not (parallel / "LICENSE").exists()
+    assert cruft.check(parallel)
+
+    # The files failing to render fail like cookiecutter
+    (inner / "module_40.py").write_text("{{ cookiecutter.missing }}\n")
+    _commit_template(template, "Break the template")
+    errors = []
+    for workers in ("1", "2"):
+        monkeypatch.setenv("CRUFT_RENDER_WORKERS", workers)
+        with pytest.raises(Exception) as error:
+            cruft.create(str(template), tmp_path / f"failed-{workers}")
+        errors.append((type(error.value), str(error.value)))
+        assert not (tmp_path / f"failed-{workers}" / "example").exists()
+    assert errors[0] == errors[1]
+
+
+def test_memory_renders(local_template, tmp_path, monkeypatch, mocker, capfd):
+    monkeypatch.setattr(utils.memtree, "SPILL_SIZE", 16)
+    projects = {}
+    for mode in ("0", "1"):
+        monkeypatch.setenv("CRUFT_MEMORY_RENDERS", mode)
+        project = cruft.create(str(local_template), tmp_path / mode, checkout="v1")
+        (project / "README.md").write_text("# example\n\nA changed description\n")
+        (project / "setup.cfg").unlink()
+        capfd.readouterr()
+        assert not cruft.diff(project, exit_code=True)
+        projects[mode] = (project, capfd.readouterr().out)
+    # The same diff, without writing the unchanged files
+    assert projects["0"][1] == projects["1"][1]
+    assert "A changed description" in projects["1"][1]
+
+    write_changes = mocker.spy(utils.memtree, "write_changes")
+    for mode, (project, _) in projects.items():
+        monkeypatch.setenv("CRUFT_MEMORY_RENDERS", mode)
+        assert cruft.update(project, skip_apply_ask=True)
+    assert write_changes.spy_return == ["CHANGES.md", "README.md"]
+    disk_project, memory_project = projects["0"][0], projects["1"][0]
+    assert sorted(os.listdir(memory_project)) == sorted(os.listdir(disk_project))
+    for name in os.listdir(disk_project):
+        if name != ".cruft.json":
+            assert (memory_project / name).read_bytes() == (disk_project / name).read_bytes()
+
+
+def test_pathspec_diff_and_update(local_template, tmp_path, monkeypatch, mocker, capfd):
+    # Rendered by cookiecutter, one file at a time
+    monkeypatch.delenv("CRUFT_RENDER_WORKERS", raising=False)
+    monkeypatch.delenv("CRUFT_MEMORY_RENDERS", raising=False)
+    project = cruft.create(str(local_template), tmp_path, checkout="v1", manifest=True)
+    (project / "README.md").write_text("# example\n\nA changed description\n")
+    (project / "setup.cfg").write_text("[metadata]\nname = changed\n")
+    capfd.readouterr()
+    assert not cruft.diff(project, exit_code=True, paths=["README.md"])
+    output = capfd.readouterr().out
+    assert "A changed description" in output
+    assert "setup.cfg" not in output
+    assert not cruft.diff(project, exit_code=True, quick=True, paths=["setup.cfg"])
+    assert capfd.readouterr().out == "drifted  setup.cfg\n"
+    (project / "README.md").write_text("# example\n\nAn example project\n")
+    (project / "setup.cfg").write_text("[metadata]\nname = example\n")
+
+    # Only the matching files are rendered, and the cruft state is left as is
+    generate_file = mocker.spy(cookiecutter_generate, "generate_file")
+    assert cruft.update(project, skip_apply_ask=True, only=["CHANGES.md"])
+    assert [call.args[1] for call in generate_file.call_args_list] == ["CHANGES.md"]
+    assert (project / "CHANGES.md").read_text() == "# Changes\n"
+    assert "Generated with cruft." not in (project / "README.md").read_text()
+    state = json.loads((project / ".cruft.json").read_text())
+    assert state["commit"] == Repo(local_template).commit("v1").hexsha
+
+    assert cruft.update(project, skip_apply_ask=True, only=["README.md"], advance_state=True)
+    assert "Generated with cruft." in (project / "README.md").read_text()
+    state = json.loads((project / ".cruft.json").read_text())
+    assert state["commit"] == Repo(local_template).commit("v2").hexsha
+    assert cruft.diff(project, exit_code=True, quick=True)
+
+
+def test_link_detect_commit(local_template, tmp_path, mocker, capfd):
+    readme = local_template / "{{cookiecutter.project_slug}}" / "README.md"
+    for version in range(3, 11):
+        readme.write_text(f"# {{{{ cookiecutter.project_slug }}}}\n\nVersion {version}\n")
+        _commit_template(local_template, f"Version {version}")
+    template = Repo(local_template)
+    version_5 = template.commit("HEAD~5").hexsha
+    project = cruft.create(str(local_template), tmp_path, checkout=version_5)
+    (project / ".cruft.json").unlink()
+    (project / "setup.cfg").write_text("[metadata]\nname = changed\n")
+    capfd.readouterr()
+
+    render_template = mocker.spy(utils.detect, "render_template")
+    assert cruft.link(str(local_template), project, detect_commit=True, max_renders=6)
+    assert render_template.call_count <= 6
+    state = json.loads((project / ".cruft.json").read_text())
+    assert state["commit"] == version_5
+    assert state["context"]["cookiecutter"]["_commit"] == version_5
+    output = capfd.readouterr().out
+    assert re.search(r"Rendered \d of 10 template commits in [\d.]+s", output)
+    assert f"{version_5[:10]}  " in output.splitlines()[1]
+    assert "Version 5" in output.splitlines()[1]
+    # Nothing else is rendered, nor stored, unless asked to
+    assert not utils.manifest.get_manifest_file(project).exists()
+
+    (project / ".cruft.json").unlink()
+    with pytest.raises(ValueError, match="max_renders must be at least 1"):
+        cruft.link(str(local_template), project, detect_commit=True, max_renders=0)
+    assert not (project / ".cruft.json").exists()
+
+
+def test_link_records_without_hooks(local_template, tmp_path, capfd):
+    project = cruft.create(str(local_template), tmp_path / "project")
+    (project / ".cruft.json").unlink()
+    assert cruft.link(str(local_template), project, manifest=True, snapshot=True)
+    assert cruft.diff(project, exit_code=True, quick=True)
+    assert utils.snapshot.get_snapshot_file(project).is_file()
+    for path in project.glob(".cruft*"):
+        path.unlink()
+
+    runs = tmp_path / "runs"
+    (local_template / "hooks").mkdir()
+    (local_template / "hooks" / "post_gen_project.py").write_text(
+        f"with open({str(runs)!r}, 'a') as runs:\n    runs.write('run')\n"
+    )
+    _commit_template(local_template, "Hook")
+    capfd.readouterr()
+    assert cruft.link(
+        str(local_template), project, manifest=True, snapshot=True, detect_commit=True
+    )
+    assert not runs.exists()
+    assert "were not stored" in capfd.readouterr().out
+    assert not utils.manifest.get_manifest_file(project).exists()
+    assert not utils.snapshot.get_snapshot_file(project).exists()
+    (project / ".cruft.json").unlink()
+
+    # A failed render leaves no cruft state behind
+    (local_template / "hooks" / "post_gen_project.py").unlink()
+    (local_template / "{{cookiecutter.project_slug}}" / "broken.txt").write_text("{% if %}")
+    _commit_template(local_template, "Break")
+    with pytest.raises(TemplateSyntaxError):
+        cruft.link(str(local_template), project, manifest=True)
+    assert not (project / ".cruft.json").exists()
+
+
+def test_impact(local_template, tmp_path, mocker):
+    projects = [
+        cruft.create(str(local_template), tmp_path / str(index), checkout="v1", manifest=index != 3)
+        for index in range(5)
+    ]
+    projects.append(cruft.create(str(local_template), tmp_path / "5", checkout="v2", manifest=True))
+    for project in projects[1:4]:
+        (project / "README.md").write_text("# example\n\nA changed description\n")
+    # Skipped paths come from the cruft state and from pyproject.toml
+    state = json.loads((projects[2] / ".cruft.json").read_text())
+    (projects[2] / ".cruft.json").write_text(json.dumps(dict(state, skip=["README.md"])))
+    (projects[4] / "pyproject.toml").write_text('[tool.cruft]\nskip = ["*.md"]\n')
+    # Without a manifest, the project is rendered at its commit
+    render_template = mocker.spy(utils.generate, "render_template")
+
+    reports = cruft.impact(str(local_template), "v1..v2", projects + [tmp_path / "missing"])
+
+    assert render_template.call_count == 1
+    assert [(report.status, report.files, report.conflicts) for report in reports] == [
+        ("clean-apply-likely", ("CHANGES.md", "README.md"), ()),
+        ("conflict-likely", ("CHANGES.md", "README.md"), ("README.md",)),
+        ("clean-apply-likely", ("CHANGES.md",), ()),
+        ("conflict-likely", ("CHANGES.md", "README.md"), ("README.md",)),
+        ("unaffected", (), ()),
+        ("unaffected", (), ()),
+        ("failed", (), ()),
+    ]
+    assert reports[5].message == f"already at {Repo(local_template).commit('v2').hexsha[:10]}"
+
+    with pytest.raises(exceptions.InvalidRevisionRange):
+        cruft.impact(str(local_template), "v1", projects)
+    with pytest.raises(exceptions.InvalidCookiecutterRepository, match="Unknown revision v9"):
+        cruft.impact(str(local_template), "v1..v9", projects)
+
+
+def test_impact_broken_projects(local_template, tmp_path):
+    projects = [
+        cruft.create(str(local_template), tmp_path / str(index), checkout="v1", manifest=True)
+        for index in range(3)
+    ]
+    state = json.loads((projects[1] / ".cruft.json").read_text())
+    (projects[1] / ".cruft.json").write_text(json.dumps(dict(state, commit="0" * 40)))
+    del state["context"]
+    (projects[2] / ".cruft.json").write_text(json.dumps(state))
+
+    reports = cruft.impact(str(local_template), "v1..v2", projects)
+
+    assert [report.status for report in reports] == ["clean-apply-likely", "failed", "failed"]
+    assert "0" * 40 in reports[1].message
+    assert reports[2].message == "'context'"
+
+
+def test_impact_without_manifests(local_template, tmp_path, mocker):
+    license_file = local_template / "{{cookiecutter.project_slug}}" / "LICENSE"
+    license_file.write_text("MIT\n")
+    _commit_template(local_template, "Add a license")
+    projects = [
+        cruft.create(
+            str(local_template), tmp_path / str(index), extra_context={"description": str(index)}
+        )
+        for index in range(3)
+    ]
+    (projects[0] / "LICENSE").write_text("Apache-2.0\n")
+    license_file.write_text("MIT License\n")
+    _commit_template(local_template, "Change the license")
+    render_template = mocker.spy(utils.generate, "render_template")
+
+    reports = cruft.impact(str(local_template), "main~1..main", projects)
+
+    # The license is generated as is, so it is compared to the template without rendering it
+    assert render_template.call_count == 0
+    assert [(report.status, report.files, report.conflicts) for report in reports] == [
+        ("conflict-likely", ("LICENSE",), ("LICENSE",)),
+        ("clean-apply-likely", ("LICENSE",), ()),
+        ("clean-apply-likely", ("LICENSE",), ()),
+    ]
+
+
+def test_impact_local_extensions(local_template, tmp_path):
+    (local_template / "local_extensions.py").write_text(
+        "from jinja2.ext import Extension\n\n\n"
+        "class Shout(Extension):\n"
+        "    def __init__(self, environment):\n"
+        "        super().__init__(environment)\n"
+        "        environment.filters['shout'] = str.upper\n"
+    )
+    cookiecutter_json = json.loads((local_template / "cookiecutter.json").read_text())
+    cookiecutter_json["_extensions"] = ["local_extensions.Shout"]
+    (local_template / "cookiecutter.json").write_text(json.dumps(cookiecutter_json))
+    _commit_template(local_template, "Add an extension")
+    project = cruft.create(str(local_template), tmp_path, manifest=True)
+    docs_dir = local_template / "{{cookiecutter.project_slug}}" / "docs"
+    docs_dir.mkdir()
+    (docs_dir / "{{ cookiecutter.project_slug | shout }}.md").write_text("# Docs\n")
+    _commit_template(local_template, "Add docs")
+
+    (report,) = cruft.impact(str(local_template), "main~1..main", [project])
+
+    assert (report.status, report.files) == ("clean-apply-likely", ("docs/EXAMPLE.md",))
+
+
+def test_impact_templated_paths(local_template, tmp_path):
+    project = cruft.create(
+        str(local_template), tmp_path, checkout="v2", extra_context={"project_slug": "other"}
+    )
+    docs_dir = local_template / "{{cookiecutter.project_slug}}" / "docs"
+    docs_dir.mkdir()
+    (docs_dir / "{{ cookiecutter.project_slug }}.md").write_text(
+        "# {{ cookiecutter.description }}\n"
+    )
+    (docs_dir / "{% if cookiecutter.project_slug == 'example' %}example.md{% endif %}").write_text(
+        ""
+    )
+    _commit_template(local_template, "Add docs")
+
+    (report,) = cruft.impact(str(local_template), "v2..main", [project])
+
+    assert (report.status, report.files) == ("clean-apply-likely", ("docs/other.md",))
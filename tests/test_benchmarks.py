@@ -0,0 +1,62 @@
+import json
+import sys
+from subprocess import PIPE, run  # nosec
+
+
+def _run_benchmarks(project_dir, *args: str):
+    return run(  # nosec
+        [sys.executable, "-m", "benchmarks", "-s", "small", "-n", "1", "--set", "files=2", *args],
+        cwd=project_dir,
+        stdout=PIPE,
+        stderr=PIPE,
+    )
+
+
+def test_benchmarks_compare_to_baseline(project_dir, tmp_path):
+    baseline = tmp_path / "baseline.json"
+    output = tmp_path / "results.json"
+
+    saved = _run_benchmarks(project_dir, "--baseline", str(baseline), "--save-baseline")
+    assert saved.returncode == 0, saved.stderr.decode()
+    results = json.loads(baseline.read_text())
+    commands = results["scenarios"]["small"]["commands"]
+    assert set(commands) == {"create", "check", "diff", "link", "update"}
+    assert "render new/generate" in commands["update"]["phases"]
+    assert results["scenarios"]["small"]["template"]["files"] == 2
+
+    for command in commands.values():
+        command["median"] /= 100
+    baseline.write_text(json.dumps(results))
+    compared = _run_benchmarks(
+        project_dir, "--baseline", str(baseline), "--output", str(output), "--threshold", "0.5"
+    )
+    assert compared.returncode == 1
+    assert "small/update" in compared.stdout.decode()
+    assert "REGRESSION" in compared.stdout.decode()
+    assert json.loads(output.read_text())["repeat"] == 1
+
+
+def test_stress_fleet(project_dir, tmp_path):
+    output = tmp_path / "stress.json"
+
+    result = run(  # nosec
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.stress",
+            *("--projects", "3", "--releases", "1", "--conflict-rate", "0.34", "--workers", "2"),
+            *("--set", "files=2", "--output", str(output)),
+        ],
+        cwd=project_dir,
+        stdout=PIPE,
+        stderr=PIPE,
+    )
+
+    assert result.returncode == 0, result.stderr.decode()
+    check, update = json.loads(output.read_text())["phases"]
+    assert (check["name"], update["name"]) == ("check 1", "update 1")
+    assert (update["operations"], update["failures"], update["conflicts"]) == (3, 0, 1)
+    assert update["latency"]["p50"] <= update["latency"]["max"]
+    assert update["throughput"] > 0
+    assert update["peak_rss_bytes"] > 0
+    assert "Peak RSS" in result.stdout.decode()
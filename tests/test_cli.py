@@ -1,13 +1,16 @@
 import json
+import os
+import sys
 from functools import partial
 from pathlib import Path
-from subprocess import run  # nosec
+from subprocess import PIPE, run  # nosec
 from textwrap import dedent
 
 import pytest
 from typer.testing import CliRunner
 
 import cruft
+from cruft import exceptions
 from cruft._cli import app
 from cruft._commands import utils
 
@@ -250,6 +253,18 @@ def test_link_checkout(cruft_runner, cookiecutter_dir_updated):
     assert cruft_config_from_create == cruft_config_from_link
 
 
+def test_link_detect_commit(cruft_runner, local_template, tmp_path):
+    project = cruft.create(str(local_template), tmp_path / "project", checkout="v1")
+    utils.cruft.get_cruft_file(project).unlink()
+    result = cruft_runner(
+        ["link", str(local_template), "--project-dir", str(project), "-y", "--detect-commit"]
+    )
+    assert result.exit_code == 0
+    assert "Rendered 2 of 2 template commits" in result.stdout
+    state = json.loads(utils.cruft.get_cruft_file(project).read_text())
+    assert state["commit"] == utils.gitrunner.Repo(str(local_template)).commit("v1").hexsha
+
+
 def test_update_noop(cruft_runner, cookiecutter_dir):
     result = cruft_runner(["update", "--project-dir", cookiecutter_dir.as_posix(), "-y"])
     assert "Nothing to do" in result.stdout
@@ -853,3 +868,271 @@ def test_submodule_diff_includes_submodule(cruft_runner, cookiecutter_dir_submod
     assert "@@ -1 +1 @@" in result.stdout
     assert "-revision 3" in result.stdout
     assert "+revision 1" in result.stdout
+
+
+def test_batch_update(cruft_runner, local_template, tmp_path):
+    projects = [
+        cruft.create(str(local_template), tmp_path / name, checkout="v1")
+        for name in ("first", "second")
+    ]
+    report_file = tmp_path / "report.json"
+
+    result = cruft_runner(["batch-update", *map(str, projects), "--report-json", str(report_file)])
+
+    assert result.exit_code == 0
+    assert result.stdout.count("APPLIED") == 2
+    report = json.loads(report_file.read_text())
+    assert [item["status"] for item in report] == ["applied", "applied"]
+    assert [item["project_dir"] for item in report] == [str(p.resolve()) for p in projects]
+
+
+def test_batch_create(cruft_runner, local_template, tmp_path):
+    contexts_file = tmp_path / "contexts.jsonl"
+    contexts_file.write_text(
+        json.dumps({"output_dir": str(tmp_path), "extra_context": {"project_slug": "one"}})
+        + "\n"
+        + json.dumps({"output_dir": str(tmp_path), "extra_context": {"project_slug": "two"}})
+        + "\n"
+    )
+    # The second project exists already
+    (tmp_path / "two").mkdir()
+
+    result = cruft_runner(["batch-create", str(local_template), str(contexts_file)])
+
+    assert result.exit_code == 1
+    assert "CREATED" in result.stdout
+    assert "FAILED" in result.stdout
+    assert (tmp_path / "one" / ".cruft.json").is_file()
+
+
+def test_commands_routed_to_daemon(cruft_runner, mocker, tmp_path):
+    call = mocker.patch.object(
+        utils.daemon,
+        "call",
+        return_value=utils.daemon.DaemonResponse(1, "FAILURE\n", error_output="warning\n"),
+    )
+    check = mocker.patch.object(cruft._commands, "check")
+
+    result = cruft_runner(["check", "--project-dir", str(tmp_path)])
+
+    assert result.exit_code == 1
+    assert result.stdout == "FAILURE\n"
+    assert result.stderr == "warning\n"
+    call.assert_called_once_with("check", project_dir=tmp_path, checkout=None, strict=True)
+    check.assert_not_called()
+
+    # Updates prompting for confirmation are not routed
+    update = mocker.patch.object(cruft._commands, "update", return_value=True)
+    result = cruft_runner(["update", "--project-dir", str(tmp_path)])
+    assert result.exit_code == 0
+    assert call.call_count == 1
+    update.assert_called_once()
+
+
+def test_serve_stop_without_daemon(cruft_runner, monkeypatch, tmp_path):
+    monkeypatch.setenv("CRUFT_SOCKET", str(tmp_path / "cruft.sock"))
+    result = cruft_runner(["serve", "--stop"])
+    assert result.exit_code == 1
+    assert "No cruft daemon is running" in result.stdout
+
+
+def test_cli_startup_does_not_import_heavy_dependencies(project_dir):
+    script = dedent(
+        """
+        import json, sys
+        from typer.testing import CliRunner
+        from cruft._cli import app
+        CliRunner().invoke(app, ["--help"])
+        print(json.dumps(sorted(sys.modules)))
+        """
+    )
+    modules = json.loads(
+        run([sys.executable, "-c", script], stdout=PIPE, check=True, cwd=project_dir).stdout
+    )
+    assert not {"git", "cookiecutter", "examples", "jinja2", "toml"} & set(modules)
+
+
+def test_cli_import_time_budget(project_dir):
+    # The budget is relative to importing typer, which the CLI can't do without, so that
+    # it holds on slow or busy machines. Eagerly importing GitPython and cookiecutter again
+    # would take the CLI well over it.
+    budget = float(os.environ.get("CRUFT_IMPORT_BUDGET", "4"))
+
+    def cumulative_import_time(stderr: str, module: str) -> int:
+        for line in stderr.splitlines():
+            _, cumulative, name = line.split("|")
+            if name.strip() == module:
+                return int(cumulative)
+        raise AssertionError(f"{module} was not imported")
+
+    # Measurements are noisy when other processes compete for the CPU, retry a few times
+    ratios = []
+    for _ in range(10):
+        stderr = run(
+            [sys.executable, "-X", "importtime", "-c", "import cruft._cli"],
+            stderr=PIPE,
+            check=True,
+            cwd=project_dir,
+        ).stderr.decode()
+        ratios.append(
+            cumulative_import_time(stderr, "cruft._cli") / cumulative_import_time(stderr, "typer")
+        )
+        if ratios[-1] < budget:
+            break
+    assert min(ratios) < budget, ratios
+
+
+def test_profile(cruft_runner, local_template, tmp_path):
+    project = cruft.create(str(local_template), tmp_path / "project", checkout="v1")
+    profile_json = tmp_path / "profile.json"
+
+    result = cruft_runner(
+        [
+            "--profile",
+            "--profile-json",
+            str(profile_json),
+            "update",
+            "--project-dir",
+            str(project),
+            "--skip-apply-ask",
+        ]
+    )
+
+    assert result.exit_code == 0
+    assert "render current" in result.stderr
+    assert "render current" not in result.stdout
+    profile = json.loads(profile_json.read_text())
+    phases = [phase["name"] for phase in profile["phases"]]
+    assert phases[:3] == ["load state", "clone", "compare"]
+    assert "render new/generate" in phases
+    assert "apply" in phases
+    assert profile["total"] >= sum(
+        span["duration"] for span in profile["spans"] if "/" not in span["name"]
+    )
+    assert utils.profiling.active_profile() is None
+
+
+def test_git_summary_and_trace(cruft_runner, local_template, tmp_path):
+    project = cruft.create(str(local_template), tmp_path / "project", checkout="v1")
+    git_trace = tmp_path / "git.jsonl"
+
+    result = cruft_runner(
+        [
+            "--git-summary",
+            "--git-trace",
+            str(git_trace),
+            "update",
+            "--project-dir",
+            str(project),
+            "--skip-apply-ask",
+        ]
+    )
+
+    assert result.exit_code == 0
+    assert "Git command" in result.stderr
+    assert "Git command" not in result.stdout
+    invocations = [json.loads(line) for line in git_trace.read_text().splitlines()]
+    commands = {utils.gitrunner.get_command_name(entry["command"]) for entry in invocations}
+    assert {"clone", "diff", "apply"} <= commands
+    apply = next(entry for entry in invocations if "apply" in entry["command"])
+    assert apply["exit_code"] == 0
+    assert apply["stdin_bytes"] > 0
+    assert all(entry["duration"] >= 0 for entry in invocations)
+    assert utils.gitrunner.active_accounting() is None
+
+
+def test_profile_templates(cruft_runner, local_template, tmp_path):
+    project = cruft.create(str(local_template), tmp_path / "project", checkout="v1")
+    profile_json = tmp_path / "profile.json"
+
+    result = cruft_runner(
+        [
+            "--profile-templates",
+            "--profile-json",
+            str(profile_json),
+            "update",
+            "--project-dir",
+            str(project),
+            "--skip-apply-ask",
+        ]
+    )
+
+    assert result.exit_code == 0
+    # The table of the phases is only printed with --profile
+    assert result.stderr.startswith("Slowest template files")
+    files = json.loads(profile_json.read_text())["files"]
+    new_readme = next(
+        file
+        for file in files
+        if file["phase"] == "render new/generate" and "README" in file["name"]
+    )
+    assert new_readme["kind"] == "file"
+    assert new_readme["size"] == len("# example\n\nAn example project\n\nGenerated with cruft.\n")
+    assert {"render current/generate", "render new/generate"} <= {file["phase"] for file in files}
+
+
+def test_track_resources(cruft_runner, local_template, tmp_path):
+    project = cruft.create(str(local_template), tmp_path / "project", checkout="v1")
+
+    result = cruft_runner(
+        ["--track-resources", "update", "--project-dir", str(project), "--skip-apply-ask"]
+    )
+    assert result.exit_code == 0
+    assert "Peak memory" in result.stderr
+    assert "render new" in result.stderr
+
+    result = cruft_runner(["--max-memory", "1K", "check", "--project-dir", str(project)])
+    assert result.exit_code != 0
+    assert isinstance(result.exception, exceptions.ResourceBudgetExceeded)
+
+    result = cruft_runner(["--max-temp", "lots", "check", "--project-dir", str(project)])
+    assert result.exit_code == 2
+
+
+def test_diff_quick(cruft_runner, local_template, tmp_path):
+    project = cruft.create(str(local_template), tmp_path / "project", checkout="v1", manifest=True)
+    (project / "README.md").write_text("# A local change\n")
+
+    result = cruft_runner(["diff", "--project-dir", str(project), "--quick", "--exit-code"])
+    assert result.exit_code == 1
+    assert result.stdout == "drifted  README.md\n"
+
+    result = cruft_runner(["diff", "--project-dir", str(project), "-q", "--checkout", "v2"])
+    assert result.exit_code == 1
+    assert "cannot be combined with --checkout" in result.stdout
+
+
+def test_diff_and_update_pathspec(cruft_runner, local_template, tmp_path):
+    project = cruft.create(str(local_template), tmp_path / "project", checkout="v1")
+    (project / "setup.cfg").write_text("[metadata]\nname = changed\n")
+
+    result = cruft_runner(["diff", "--project-dir", str(project), "--exit-code", "--", "README.md"])
+    assert result.exit_code == 0
+    result = cruft_runner(["diff", "--project-dir", str(project), "--exit-code", "--", "*.cfg"])
+    assert result.exit_code == 1
+    assert "name = changed" in result.stdout
+    (project / "setup.cfg").write_text("[metadata]\nname = example\n")
+
+    result = cruft_runner(
+        ["update", "--project-dir", str(project), "-y", "--only", "README.md", "--advance-state"]
+    )
+    assert result.exit_code == 0
+    assert "Generated with cruft." in (project / "README.md").read_text()
+    assert not (project / "CHANGES.md").exists()
+
+
+def test_impact(cruft_runner, local_template, tmp_path):
+    project = cruft.create(str(local_template), tmp_path / "project", checkout="v1")
+    (project / "README.md").write_text("# A local change\n")
+    report_json = tmp_path / "report.json"
+
+    result = cruft_runner(
+        ["impact", str(local_template), "v1..v2", str(project), "--report-json", str(report_json)]
+    )
+    assert result.exit_code == 0
+    assert f"CONFLICT-LIKELY     {project}: 2 files; conflicts in README.md" in result.stdout
+    (report,) = json.loads(report_json.read_text())
+    assert report["status"] == "conflict-likely"
+
+    result = cruft_runner(["impact", str(local_template), "v1", str(project)])
+    assert isinstance(result.exception, exceptions.InvalidRevisionRange)
@@ -31,3 +31,51 @@ def test_cruft_already_present():
     instance = exceptions.CruftAlreadyPresent(".")
     assert instance.file_location == "."
     assert isinstance(instance, exceptions.CruftError)
+
+
+def test_invalid_contexts_file():
+    instance = exceptions.InvalidContextsFile(Path("contexts.jsonl"), 3)
+    assert instance.file_location == "contexts.jsonl"
+    assert instance.line_number == 3
+    assert isinstance(instance, exceptions.CruftError)
+
+
+def test_invalid_config_file():
+    instance = exceptions.InvalidConfigFile(Path("config.json"), "Expected a JSON object.")
+    assert instance.file_location == "config.json"
+    assert "Expected a JSON object." in instance.message
+    assert isinstance(instance, exceptions.CruftError)
+
+
+def test_daemon_already_running():
+    instance = exceptions.DaemonAlreadyRunning(Path("cruft.sock"))
+    assert instance.socket_path == "cruft.sock"
+    assert isinstance(instance, exceptions.CruftError)
+
+
+def test_git_timeout():
+    instance = exceptions.GitTimeout(["git", "status"], 5)
+    assert instance.command == ["git", "status"]
+    assert "`git status` did not complete within 5 seconds" in instance.message
+    assert isinstance(instance, exceptions.CruftError)
+
+
+def test_resource_budget_exceeded():
+    instance = exceptions.ResourceBudgetExceeded("memory", 2048, 1024, "render new")
+    assert (instance.used, instance.budget, instance.phase) == (2048, 1024, "render new")
+    assert "2,048 bytes of memory during `render new`" in instance.message
+    assert isinstance(instance, exceptions.CruftError)
+
+
+def test_invalid_hook_policy():
+    instance = exceptions.InvalidHookPolicy("sometimes", ["run", "skip", "cache"])
+    assert instance.policy == "sometimes"
+    assert "run, skip, cache" in instance.message
+    assert isinstance(instance, exceptions.CruftError)
+
+
+def test_invalid_revision_range():
+    instance = exceptions.InvalidRevisionRange("v1")
+    assert instance.revision_range == "v1"
+    assert "expected `<from>..<to>`" in instance.message
+    assert isinstance(instance, exceptions.CruftError)
@@ -1,7 +1,11 @@
+import json
+import os
+import time
 from pathlib import Path
 from textwrap import dedent
 
 import pytest
+from git import GitCommandError
 
 from cruft import exceptions
 from cruft._commands import utils
@@ -43,6 +47,94 @@ def test_get_diff_with_unicode(project_dir):
         )
 
 
+def test_set_aside_binary_changes(tmp_path: Path):
+    old, new, project = tmp_path / "old", tmp_path / "new", tmp_path / "project"
+    for directory in (old, new, project):
+        directory.mkdir()
+    (old / "image.png").write_bytes(b"\0old")
+    (new / "image.png").write_bytes(b"\0new")
+    for directory, content in ((old, "old"), (new, "new")):
+        (directory / "data.csv").write_text(content)
+        (directory / "README.md").write_text(content)
+    # Text files marked not to diff by the project are binary as well
+    utils.gitrunner.run_git("init", "-q", cwd=project)
+    (project / ".gitattributes").write_text("*.csv -diff\n")
+
+    changes = utils.binary.set_aside_binary_changes(old, new, tmp_path / "binary", project)
+
+    assert [(change.path, change.status) for change in changes] == [
+        ("data.csv", "modified"),
+        ("image.png", "modified"),
+    ]
+    assert sorted(os.listdir(old)) == sorted(os.listdir(new)) == ["README.md"]
+
+
+@pytest.mark.parametrize("linkname", ["..", "/tmp", "sub/../../outside"])
+def test_restore_snapshot_stays_in_output_dir(tmp_path: Path, linkname):
+    import io
+    import tarfile
+
+    cruft_state = {
+        "template": "https://example.com/template",
+        "commit": "1234",
+        "context": {"cookiecutter": {}},
+    }
+    render_dir = tmp_path / "render"
+    (render_dir / "sub").mkdir(parents=True)
+    (render_dir / "README.md").write_text("Hello\n")
+    project_dir = tmp_path / "project"
+    project_dir.mkdir()
+    utils.snapshot.save_snapshot(project_dir, render_dir, cruft_state, {})
+    snapshot_file = utils.snapshot.get_snapshot_file(project_dir)
+    assert (
+        utils.snapshot.restore_snapshot(snapshot_file, cruft_state, "1234", tmp_path / "ok") == {}
+    )
+    assert (tmp_path / "ok" / "README.md").read_text() == "Hello\n"
+
+    # A link leaving the output directory, followed by a file written through it
+    with tarfile.open(str(snapshot_file), "r:gz") as snapshot:
+        members = [(member, snapshot.extractfile(member)) for member in snapshot.getmembers()]
+        members = [(member, source and source.read()) for member, source in members]
+    with tarfile.open(str(snapshot_file), "w:gz") as snapshot:
+        for member, data in members:
+            snapshot.addfile(member, io.BytesIO(data) if data is not None else None)
+        link = tarfile.TarInfo("files/escape")
+        link.type, link.linkname = tarfile.SYMTYPE, linkname
+        snapshot.addfile(link)
+        evil = tarfile.TarInfo("files/escape/evil")
+        evil.size = 4
+        snapshot.addfile(evil, io.BytesIO(b"evil"))
+
+    output_dir = tmp_path / "output"
+    assert utils.snapshot.restore_snapshot(snapshot_file, cruft_state, "1234", output_dir) is None
+    assert list(output_dir.iterdir()) == []
+    assert not (tmp_path / "evil").exists()
+    assert not (tmp_path / "outside").exists()
+
+
+def test_limit_render_to_pathspec(tmp_path: Path):
+    pathspec = utils.pathspec.get_pathspec(["./.github/*", "pyproject.toml", "docs/"])
+    assert pathspec == [".github/*", "pyproject.toml", "docs"]
+    assert utils.pathspec.get_pathspec(["."]) is None
+    for path in (".github/workflows/ci.yml", "pyproject.toml", "docs/index.md"):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).touch()
+    for path in ("src/pyproject.toml", "src/module.py", "README.md"):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).touch()
+
+    utils.pathspec.limit_render(tmp_path, pathspec)
+
+    assert sorted(path.relative_to(tmp_path).as_posix() for path in tmp_path.glob("**/*")) == [
+        ".github",
+        ".github/workflows",
+        ".github/workflows/ci.yml",
+        "docs",
+        "docs/index.md",
+        "pyproject.toml",
+    ]
+
+
 def test_remove_paths_with_pathlib(tmp_path: Path):
     repo0 = tmp_path / "repo0"
     (repo0 / "tests").mkdir(parents=True)
@@ -113,7 +205,7 @@ def test_remove_paths_with_glob_pattern_and_string(tmp_path: Path):
 def test_warn_if_cant_read_pyproject_toml(monkeypatch):
     monkeypatch.setattr(utils.generate, "tomllib", None)
     with pytest.warns(UserWarning, match="`toml` package is not installed"):
-        utils.generate._get_skip_paths({}, Path(__file__))
+        utils.generate.get_skip_paths({}, Path(__file__))
 
 
 def test_get_extra_context_from_file():
@@ -171,7 +263,7 @@ def test_remove_paths_with_get_skip_paths_from_cruft_state_and_pyproject_toml(tm
             )
         )
 
-    paths_to_remove = utils.generate._get_skip_paths({"skip": [".git"]}, pyproject)
+    paths_to_remove = utils.generate.get_skip_paths({"skip": [".git"]}, pyproject)
     utils.generate._remove_paths(repo0, paths_to_remove)
 
     assert (repo0 / "file0").exists()
@@ -191,3 +283,284 @@ def test_remove_paths_with_get_skip_paths_from_cruft_state_and_pyproject_toml(tm
 
     assert not (repo0 / ".mypy_cache").exists()
     assert not (repo0 / ".ruff_cache").exists()
+
+
+def test_profiling_spans():
+    assert utils.profiling.span("unprofiled") is utils.profiling.span("other")
+
+    with utils.profiling.profiling() as profile:
+        for _ in range(2):
+            with utils.profiling.span("render"):
+                with utils.profiling.span("generate"):
+                    pass
+        with utils.profiling.span("diff"):
+            pass
+
+    phases = profile.phases()
+    assert [(phase.name, phase.calls) for phase in phases] == [
+        ("render", 2),
+        ("render/generate", 2),
+        ("diff", 1),
+    ]
+    assert phases[0].total >= phases[1].total
+    table = profile.table()
+    assert "  generate" in table
+    assert table.splitlines()[-1].startswith("total")
+    assert utils.profiling.active_profile() is None
+
+
+def test_git_runner_accounting(tmp_path, monkeypatch):
+    assert utils.gitrunner.get_command_name(["git", "-c", "a=b", "diff", "--no-index"]) == "diff"
+
+    with utils.gitrunner.accounting() as accounted:
+        utils.gitrunner.run_git("init", str(tmp_path))
+        with utils.gitrunner.Repo(tmp_path) as repo:
+            with pytest.raises(GitCommandError):
+                repo.git.rev_parse("--verify", "HEAD")
+        monkeypatch.setenv("CRUFT_GIT_MAX_PROCESSES", "1")
+        assert utils.gitrunner.run_git("status", cwd=tmp_path, check=True).stdout
+
+    commands = {command.name: command for command in accounted.commands()}
+    assert commands["rev-parse"].failures == 1
+    assert commands["status"].failures == 0
+    assert commands["status"].stdout_bytes > 0
+    assert accounted.summary().splitlines()[-1].startswith("total")
+    assert utils.gitrunner.active_accounting() is None
+
+    monkeypatch.setenv("CRUFT_GIT_TIMEOUT", "0.000001")
+    with pytest.raises(exceptions.GitTimeout):
+        utils.gitrunner.run_git("status", cwd=tmp_path)
+
+
+def test_timing_template_files(tmp_path):
+    from cookiecutter.generate import generate_files
+
+    template_dir = tmp_path / "template"
+    (template_dir / "hooks").mkdir(parents=True)
+    (template_dir / "hooks" / "post_gen_project.py").write_text("print('done')\n")
+    (template_dir / "{{cookiecutter.name}}").mkdir()
+    (template_dir / "{{cookiecutter.name}}" / "{{cookiecutter.name}}.txt").write_text(
+        "{% for i in range(100) %}{{ cookiecutter.name }}{% endfor %}"
+    )
+    context = {"cookiecutter": {"name": "ab"}}
+
+    # Without a profile asking for the template files, cookiecutter is left untouched
+    with utils.profiling.profiling() as profile:
+        with utils.iohelper.rendering(template_dir), utils.profiling.timing_template_files():
+            generate_files(str(template_dir), context, str(tmp_path / "plain"))
+    assert profile.files == []
+
+    with utils.profiling.profiling(utils.profiling.Profile(template_files=True)) as profile:
+        with utils.profiling.span("generate"):
+            with utils.iohelper.rendering(template_dir), utils.profiling.timing_template_files():
+                generate_files(str(template_dir), context, str(tmp_path / "output"))
+
+    files = {file.name: file for file in profile.files}
+    assert files["{{cookiecutter.name}}.txt"].size == 200
+    assert files["{{cookiecutter.name}}.txt"].phase == "generate"
+    assert files[os.path.join("hooks", "post_gen_project.py")].kind == "hook"
+    assert "(hook)" in profile.files_table()
+
+
+def test_resource_tracking():
+    assert utils.resources.parse_size("512") == 512
+    assert utils.resources.parse_size("2k") == 2048
+    assert utils.resources.parse_size("1.5GB") == 3 * 1024**3 // 2
+    with pytest.raises(ValueError):
+        utils.resources.parse_size("lots")
+
+    with utils.resources.tracking() as tracker:
+        with utils.profiling.span("render"):
+            with utils.iohelper.AltTemporaryDirectory() as tmpdir:
+                (Path(tmpdir) / "rendered").write_bytes(b"x" * 10000)
+                with utils.profiling.span("generate"):
+                    pass
+        with utils.profiling.span("diff"):
+            pass
+    assert tracker.phases["render"].temp_bytes >= 10000
+    assert tracker.phases["render/generate"].temp_bytes >= 10000
+    assert tracker.phases["diff"].temp_bytes == 0
+    assert tracker.peak.rss_bytes > 0
+    assert "  generate" in tracker.table()
+    assert utils.resources.active_tracker() is None
+
+    with utils.resources.resource_limits(max_temp="1K"):
+        with pytest.raises(exceptions.ResourceBudgetExceeded) as error:
+            with utils.profiling.span("render"):
+                with utils.iohelper.AltTemporaryDirectory() as tmpdir:
+                    (Path(tmpdir) / "rendered").write_bytes(b"x" * 10000)
+    assert error.value.phase == "render"
+    assert error.value.budget == 1024
+
+
+def test_scratch_pool(tmp_path, monkeypatch):
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps({"scratch_dir": str(tmp_path / "configured")}))
+    monkeypatch.setenv("CRUFT_CONFIG", str(config_file))
+    assert utils.iohelper.get_scratch_dir() == tmp_path / "configured"
+
+    monkeypatch.setenv("CRUFT_SCRATCH_DIR", str(tmp_path / "scratch"))
+    monkeypatch.setenv("CRUFT_SCRATCH_POOL_SIZE", "1")
+    pool = utils.iohelper.get_scratch_pool()
+    with utils.iohelper.AltTemporaryDirectory() as tmpdir:
+        assert Path(tmpdir).parent == tmp_path / "scratch"
+        (Path(tmpdir) / "nested").mkdir()
+        (Path(tmpdir) / "nested" / "rendered").write_text("rendered")
+    pool.drain()
+    # Emptied in the background and reused, while the pool holds one directory at most
+    assert os.listdir(tmpdir) == []
+    with utils.iohelper.AltTemporaryDirectory() as reused:
+        with utils.iohelper.AltTemporaryDirectory() as other:
+            assert reused == tmpdir
+    pool.drain()
+    assert os.listdir(tmp_path / "scratch") == [os.path.basename(other)]
+    pool.close()
+    assert os.listdir(tmp_path / "scratch") == []
+
+    config_file.write_text("[]")
+    monkeypatch.delenv("CRUFT_SCRATCH_DIR")
+    with pytest.raises(exceptions.InvalidConfigFile):
+        utils.iohelper.get_scratch_dir()
+
+
+def test_patching_and_writing_aside(tmp_path):
+    from cookiecutter import generate
+
+    generate_file = generate.generate_file
+    calls = []
+
+    def record(name):
+        def patch(function):
+            return lambda *args: calls.append(name) or function(*args)
+
+        return patch
+
+    with utils.iohelper.patching(generate, "generate_file", record("outer")):
+        with utils.iohelper.patching(generate, "generate_file", lambda function: function):
+            with utils.iohelper.patching(generate, "generate_file", record("inner")):
+                with pytest.raises(TypeError):
+                    generate.generate_file()
+    assert calls == ["inner", "outer"]
+    assert generate.generate_file is generate_file
+
+    with utils.iohelper.writing_aside(tmp_path / "cache" / "file") as partial_file:
+        partial_file.write_text("stored")
+        assert not (tmp_path / "cache" / "file").exists()
+    assert os.listdir(tmp_path / "cache") == ["file"]
+    with pytest.raises(ValueError):
+        with utils.iohelper.writing_aside(tmp_path / "cache" / "file") as partial_file:
+            partial_file.write_text("partial")
+            raise ValueError()
+    for content in ("stored", "other"):
+        with utils.iohelper.writing_aside(tmp_path / "cache" / "dir", directory=True) as partial:
+            (partial / "file").write_text(content)
+    # A directory already stored is kept
+    assert (tmp_path / "cache" / "dir" / "file").read_text() == "stored"
+    assert sorted(os.listdir(tmp_path / "cache")) == ["dir", "file"]
+    assert (tmp_path / "cache" / "file").read_text() == "stored"
+
+
+def test_bytecode_cache(tmp_path, monkeypatch):
+    import jinja2
+    from cookiecutter.generate import generate_files
+
+    monkeypatch.setenv("CRUFT_CACHE_DIR", str(tmp_path / "cache"))
+    utils.bytecode._memory.clear()
+    template_dir = tmp_path / "template"
+    (template_dir / "{{cookiecutter.name}}").mkdir(parents=True)
+    (template_dir / "{{cookiecutter.name}}" / "{{cookiecutter.name}}.txt").write_text(
+        "{% for i in range(3) %}{{ cookiecutter.name }}{% endfor %}"
+    )
+    compiled = []
+    compile_source = jinja2.Environment._compile
+    monkeypatch.setattr(
+        jinja2.Environment,
+        "_compile",
+        lambda self, source, filename: (
+            compiled.append(filename) or compile_source(self, source, filename)
+        ),
+    )
+
+    def render(name: str) -> str:
+        output_dir = tmp_path / name
+        with utils.iohelper.rendering(template_dir):
+            generate_files(str(template_dir), {"cookiecutter": {"name": "ab"}}, str(output_dir))
+        return (output_dir / "ab" / "ab.txt").read_text()
+
+    assert render("first") == "ababab"
+    assert compiled and os.listdir(tmp_path / "cache" / "bytecode")
+
+    # Loaded from the cache directory by another process, as from memory by this one
+    utils.bytecode._memory.clear()
+    compiled.clear()
+    assert render("second") == "ababab"
+    assert compiled == []
+
+    # Only kept in memory without a cache on disk
+    monkeypatch.setenv("CRUFT_CACHE_DIR", str(tmp_path / "disabled"))
+    monkeypatch.setenv("CRUFT_CACHE_SIZE", "0")
+    utils.bytecode._memory.clear()
+    assert render("third") == "ababab"
+    assert not (tmp_path / "disabled").exists()
+
+    monkeypatch.setenv("CRUFT_BYTECODE_CACHE", "0")
+    compiled.clear()
+    assert render("uncached") == "ababab"
+    assert compiled
+
+
+def test_prune_cache(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    (cache_dir / "directory").mkdir(parents=True)
+    for path in ("file", "directory/first", "directory/second", "other"):
+        (cache_dir / path).write_bytes(b"0" * 1000)
+    now = time.time()
+    for age, name in enumerate(["other", "directory", "file"]):
+        os.utime(str(cache_dir / name), (now - 300 - age, now - 300 - age))
+    utils.cache.use_entry(cache_dir / "file")
+
+    # The least recently used first, while the entries just used are kept
+    utils.cache.prune_cache(cache_dir, 3000)
+    assert sorted(os.listdir(cache_dir)) == ["file", "other"]
+    utils.cache.prune_cache(cache_dir, 0)
+    assert os.listdir(cache_dir) == ["file"]
+
+    monkeypatch.setenv("CRUFT_CACHE_SIZE", "0.001")
+    assert utils.cache.get_cache_size() == 1048
+    os.utime(str(cache_dir / "file"), (now - 300, now - 300))
+    (cache_dir / "stored").write_bytes(b"0" * 1000)
+    utils.cache.store_entry(cache_dir / "stored")
+    assert os.listdir(cache_dir) == ["stored"]
+
+
+def test_template_dependencies():
+    from cookiecutter.environment import StrictEnvironment
+
+    environment = StrictEnvironment()
+    assert utils.dependencies.get_dependencies(
+        "{% include 'header.j2' %}{{ cookiecutter.name }}{{ cookiecutter['version'] }}",
+        environment,
+    ) == ({"name", "version"}, {"header.j2"})
+    assert utils.dependencies.get_dependencies("No template here", environment) == (set(), set())
+    # The variables used can't be known from the source
+    for source in (
+        "{{ cookiecutter | tojson }}",
+        "{{ cookiecutter[name] }}",
+        "{% for key, value in cookiecutter.items() %}{% endfor %}",
+    ):
+        assert utils.dependencies.get_dependencies(source, environment)[0] is None
+    assert utils.dependencies.get_dependencies("{% include name %}", environment)[1] is None
+
+    index = utils.dependencies.TemplateIndex(
+        files={
+            "README.md": utils.dependencies.FileDependencies(["name"], ["macros.j2"], []),
+            "setup.cfg": utils.dependencies.FileDependencies(["version"], [], []),
+            "macros.j2": utils.dependencies.FileDependencies(["license"], [], []),
+        },
+        templates={},
+    )
+    assert utils.dependencies.get_affected_files(index, set(), {"license"}, set()) == {
+        "README.md",
+        "macros.j2",
+    }
+    assert utils.dependencies.get_affected_files(index, set(), {"version"}, {"setup.cfg"}) == set()